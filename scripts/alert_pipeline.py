@@ -0,0 +1,396 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from step10_explainer import explain_prediction, explain_batch
+from step11_remediation import get_engine, get_executor
+from step12_notifier import send_batch_alert
+from incident_store import open_incident_store
+from telemetry import stage_timer, timed_stage, ALERTS, ALERT_DELIVERY_SECONDS
+
+# Configuration
+WEBHOOK_URL = os.environ.get("SLACK_WEBHOOK")
+COOLDOWN_SECONDS = 300   # Minimum gap between two alerts for the same service
+MAX_BATCH = 20           # Root causes folded into one notification
+BATCH_WAIT = 0.5         # Seconds to wait for more root causes before sending
+QUEUE_SIZE = 64          # Pending ticks; further ticks are dropped, never blocking scoring
+NOTIFY_WORKERS = 4       # Concurrent webhook deliveries
+SIMILAR_INCIDENTS = 3    # Past incidents attached to each alert
+
+class AlertPipeline:
+    """
+    Runs the post-scoring actions (explain -> remediate -> notify) off the
+    inference hot loop.
+
+    The scorer calls submit() with the flagged reports of a tick, which only
+    enqueues them. A worker thread drains the bounded queue, drops services
+    still inside their cooldown window, explains and plans remediation for
+    the rest, and sends up to MAX_BATCH root causes as one notification on a
+    small pool of sender threads. A service's cooldown starts when it is
+    picked for a batch and is lifted again if that batch fails before or
+    during delivery.
+
+    Remediation is planned per batch by the policy engine from step 11, so
+    a large incident gets at most one command per deployment, within its
+    rate limits. With an executor the planned commands are also run
+    (batched, dry-run unless configured otherwise) on a remediation thread
+    of their own, after the batch's notifications are queued, so a slow
+    kubectl call never holds up alerts.
+
+    With an incident_store and a model, every alerting tick is fingerprinted,
+    the most similar past incidents are attached to its reports, and the
+    tick is recorded with its remediation for future lookups, once its
+    notifications are queued. Incident history is best effort: a failed
+    lookup or record is counted in stats["incident_errors"] and the alert
+    goes out regardless.
+    """
+    def __init__(self, webhook_url=WEBHOOK_URL, cooldown_seconds=COOLDOWN_SECONDS, max_batch=MAX_BATCH,
+                 batch_wait=BATCH_WAIT, queue_size=QUEUE_SIZE, notify=send_batch_alert,
+                 notify_workers=NOTIFY_WORKERS, model=None, explain_method="saliency", incident_store=None,
+                 similar_incidents=SIMILAR_INCIDENTS, remediation=None, executor=None):
+        self.webhook_url = webhook_url
+        self.cooldown_seconds = cooldown_seconds
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.notify = notify
+        self.model = model  # Enables gradient/attention explanations in step 10
+        self.explain_method = explain_method
+        self.incident_store = incident_store
+        self.similar_incidents = similar_incidents
+        self.remediation = remediation if remediation is not None else get_engine()
+        self.executor = executor
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.last_alert = {}  # service -> time of last notification
+        self.stats = {"submitted": 0, "dropped": 0, "suppressed": 0, "sent": 0, "notifications": 0, "errors": 0,
+                      "incident_errors": 0, "remediation_errors": 0}
+        self.latencies_ms = []
+        self.notify_workers = notify_workers
+        self._lock = threading.Lock()
+        self._senders = None
+        self._remediator = None
+        self._worker = None
+
+    def submit(self, reports, x, edge_index=None, node_ids=None, scores=None, history=None):
+        """
+        Hands a tick's flagged reports (each with "service", "score" and the
+        node "index" into x) to the pipeline, optionally with every node's
+        score for the incident fingerprint and, for the temporal model, the
+        projected frames before x (TemporalInference.history()) that it was
+        scored with. Never blocks: if the queue is full the tick is dropped
+        and counted.
+        """
+        if not reports:
+            return True
+        tick = {"reports": reports, "x": x, "edge_index": edge_index, "node_ids": node_ids, "scores": scores,
+                "history": history, "submitted_at": time.perf_counter()}
+        try:
+            self.queue.put_nowait(tick)
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped"] += len(reports)
+            ALERTS.inc(len(reports), outcome="dropped")
+            return False
+        with self._lock:
+            self.stats["submitted"] += len(reports)
+        ALERTS.inc(len(reports), outcome="submitted")
+        return True
+
+    def _collect(self, first):
+        """
+        Gathers reports from the first tick plus any ticks arriving within
+        batch_wait, up to max_batch, skipping services in cooldown.
+        """
+        ticks = [first]
+        pending = len(first["reports"])
+        deadline = time.perf_counter() + self.batch_wait
+        stopping = False
+        while pending < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                tick = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            self.queue.task_done()
+            if tick is None:
+                stopping = True
+                break
+            ticks.append(tick)
+            pending += len(tick["reports"])
+
+        now = time.time()
+        batch = []
+        with self._lock:
+            for tick in ticks:
+                tick["alerted_at"] = now
+                for report in tick["reports"]:
+                    service = report["service"]
+                    if now - self.last_alert.get(service, -float("inf")) < self.cooldown_seconds:
+                        self.stats["suppressed"] += 1
+                        ALERTS.inc(outcome="suppressed")
+                        continue
+                    self.last_alert[service] = now
+                    batch.append((tick, report))
+        return batch, stopping
+
+    def _release(self, batch):
+        """
+        Lifts the cooldown taken for a batch that was never delivered, so the
+        next tick flagging the same services alerts again.
+        """
+        with self._lock:
+            for tick, report in batch:
+                if self.last_alert.get(report["service"]) == tick["alerted_at"]:
+                    del self.last_alert[report["service"]]
+
+    @timed_stage("explain")
+    def _explain(self, batch):
+        """
+        Step 10 for a batch: one batched attribution pass per tick when the
+        model and graph are available, the model-free fallback otherwise.
+        """
+        by_tick = {}
+        for tick, report in batch:
+            by_tick.setdefault(id(tick), (tick, []))[1].append(report)
+
+        for tick, reports in by_tick.values():
+            if self.model is None or tick["edge_index"] is None:
+                for report in reports:
+                    report["explanation"] = explain_prediction(report["service"], tick["x"][report["index"]].numpy())
+                continue
+            node_ids = tick.get("node_ids")
+            details = explain_batch(self.model, tick["x"], tick["edge_index"], [r["index"] for r in reports],
+                                    node_ids, method=self.explain_method, history=tick.get("history"))
+            for report, detail in zip(reports, details):
+                report["explanation"] = detail["explanation"]
+                report["attribution"] = detail
+
+    def _incident_error(self, action, e):
+        with self._lock:
+            self.stats["incident_errors"] += 1
+        print(f"Incident history {action} failed: {e}")
+
+    @timed_stage("incident_index")
+    def _find_similar_incidents(self, batch):
+        """
+        Fingerprints each tick and attaches the most similar past incidents
+        to its reports. Returns [(tick, reports, fingerprint)] to record.
+        """
+        by_tick = {}
+        for tick, report in batch:
+            by_tick.setdefault(id(tick), (tick, []))[1].append(report)
+
+        found = []
+        for tick, reports in by_tick.values():
+            if tick["edge_index"] is None:
+                continue
+            try:
+                inputs = {} if tick.get("history") is None else {"history": tick["history"]}
+                with torch.no_grad():
+                    fingerprint = self.model.fingerprint(tick["x"], tick["edge_index"], tick["scores"],
+                                                         **inputs).numpy()
+                similar = self.incident_store.similar(fingerprint, self.similar_incidents)
+            except Exception as e:
+                self._incident_error("lookup", e)
+                continue
+            for report in reports:
+                report["similar_incidents"] = similar
+            found.append((tick, reports, fingerprint))
+        return found
+
+    @timed_stage("incident_index")
+    def _record_incidents(self, found):
+        """
+        Stores each fingerprinted tick as a new incident.
+        """
+        for tick, reports, fingerprint in found:
+            if tick["scores"] is not None and tick["node_ids"] is not None:
+                ranking = [{"service": s, "score": p} for s, p in zip(tick["node_ids"], tick["scores"])]
+            else:
+                ranking = reports
+            try:
+                self.incident_store.add(fingerprint, ranking, reports)
+            except Exception as e:
+                self._incident_error("record", e)
+
+    def _execute(self, plans):
+        try:
+            with stage_timer("remediation_execute"):
+                self.executor.execute(plans)
+        except Exception as e:
+            with self._lock:
+                self.stats["remediation_errors"] += 1
+            print(f"Remediation failed: {e}")
+
+    def _act(self, batch):
+        self._explain(batch)
+        with stage_timer("remediation"):
+            # Step 11: Remediation, planned for the whole batch at once
+            reports = [report for _, report in batch]
+            for report, plan in zip(reports, self.remediation.plan(reports)):
+                report["remediation"] = plan
+        found = []
+        if self.incident_store is not None and self.model is not None:
+            found = self._find_similar_incidents(batch)
+
+        # Step 12: Notification, one message per batch
+        for start in range(0, len(batch), self.max_batch):
+            self._senders.submit(self._send, batch[start:start + self.max_batch])
+        if self.executor is not None:
+            self._remediator.submit(self._execute, [report["remediation"] for report in reports])
+
+        if found:
+            self._record_incidents(found)
+
+    def _send(self, batch):
+        try:
+            with stage_timer("notify"):
+                self.notify([report for _, report in batch], self.webhook_url)
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            self._release(batch)
+            ALERTS.inc(len(batch), outcome="failed")
+            print(f"Alert delivery failed: {e}")
+            return
+        done = time.perf_counter()
+        ALERTS.inc(len(batch), outcome="sent")
+        with self._lock:
+            self.stats["notifications"] += 1
+            self.stats["sent"] += len(batch)
+            for tick, _ in batch:
+                self.latencies_ms.append((done - tick["submitted_at"]) * 1000)
+                ALERT_DELIVERY_SECONDS.observe(done - tick["submitted_at"])
+
+    def _run(self):
+        while True:
+            tick = self.queue.get()
+            self.queue.task_done()
+            if tick is None:
+                break
+            batch, stopping = self._collect(tick)
+            try:
+                if batch:
+                    self._act(batch)
+            except Exception as e:
+                with self._lock:
+                    self.stats["errors"] += 1
+                self._release(batch)
+                print(f"Alert pipeline error: {e}")
+            if stopping:
+                break
+
+    def start(self):
+        if self._worker is None:
+            self._senders = ThreadPoolExecutor(max_workers=self.notify_workers, thread_name_prefix="rca-notify")
+            # One thread, so commands run in the order they were planned
+            self._remediator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rca-remediate")
+            self._worker = threading.Thread(target=self._run, name="rca-alerts", daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self):
+        """
+        Flushes queued ticks and stops the worker once every queued
+        notification and remediation has run.
+        """
+        if self._worker is not None:
+            self.queue.put(None)
+            self._worker.join()
+            self._worker = None
+            self._senders.shutdown(wait=True)
+            self._remediator.shutdown(wait=True)
+
+    def latency_summary(self):
+        if not self.latencies_ms:
+            return {"p50_ms": 0.0, "p99_ms": 0.0}
+        return {"p50_ms": float(np.percentile(self.latencies_ms, 50)),
+                "p99_ms": float(np.percentile(self.latencies_ms, 99))}
+
+_pipeline = None
+
+def get_alert_pipeline(**kwargs):
+    """
+    Returns the process-wide AlertPipeline, starting it on first use. It
+    records into the incident store from open_incident_store() (only when
+    LOGWHISPERER_INCIDENTS is set; a separate one for the temporal model)
+    and runs remediation per get_executor() unless they are passed.
+    """
+    global _pipeline
+    if _pipeline is None:
+        if "incident_store" not in kwargs:
+            from step6_model import TemporalLogWhispererBrain
+            kwargs["incident_store"] = open_incident_store(
+                temporal=isinstance(kwargs.get("model"), TemporalLogWhispererBrain))
+        if "executor" not in kwargs:
+            kwargs["executor"] = get_executor()
+        _pipeline = AlertPipeline(**kwargs).start()
+    return _pipeline
+
+def start_stub_webhook(webhook_delay=0.0):
+    """
+    Local webhook on a free port that takes webhook_delay seconds per
+    request. Returns (server, url, received payloads); call
+    server.shutdown() when done.
+    """
+    received = []
+
+    class StubWebhook(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(webhook_delay)
+            received.append(json.loads(body))
+            self.send_response(200)
+            self.end_headers()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWebhook)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/hook", received
+
+def benchmark_alert_pipeline(bursts=20, nodes_per_burst=30, services=100, webhook_delay=0.05):
+    """
+    Bursty-load check against the stub webhook. Reports end-to-end latency
+    from submit() to delivery and how little time submit() itself costs the
+    scoring loop.
+    """
+    server, url, received = start_stub_webhook(webhook_delay)
+    pipeline = AlertPipeline(webhook_url=url, cooldown_seconds=0.0, batch_wait=0.05).start()
+    x = torch.randn(services, 775)
+    rng = np.random.default_rng(0)
+
+    submit_ms = []
+    for _ in range(bursts):
+        flagged = rng.choice(services, size=nodes_per_burst, replace=False)
+        reports = [{"service": f"srv-{i}", "score": 0.9, "index": int(i)} for i in flagged]
+        start = time.perf_counter()
+        pipeline.submit(reports, x)
+        submit_ms.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.01)
+    pipeline.stop()
+    server.shutdown()
+
+    summary = pipeline.latency_summary()
+    summary.update(pipeline.stats)
+    summary["submit_p99_ms"] = float(np.percentile(submit_ms, 99))
+    summary["webhook_requests"] = len(received)
+    print(f"Alerts: {summary['sent']} sent in {summary['webhook_requests']} requests, "
+          f"end-to-end p50 {summary['p50_ms']:.1f} ms / p99 {summary['p99_ms']:.1f} ms, "
+          f"submit p99 {summary['submit_p99_ms']:.3f} ms")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LogWhisperer alert pipeline")
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--nodes-per-burst", type=int, default=30)
+    args = parser.parse_args()
+    benchmark_alert_pipeline(args.bursts, args.nodes_per_burst)
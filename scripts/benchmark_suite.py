@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import tracemalloc
+from collections import Counter
+from synthetic_mesh import SyntheticMesh
+from feature_store import FeatureStore, FeatureFrame
+
+# Configuration
+SIZES = [100, 1000, 10000]
+RESULTS_PATH = "benchmark_results.json"
+BASELINE_PATH = "benchmark_baseline.json"
+TOLERANCE = 0.20          # Allowed slowdown against the baseline before a stage counts as regressed
+MIN_DELTA_SECONDS = 0.005  # Ignore differences below timer noise
+INFERENCE_REPEATS = 5
+
+def _max_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+def _reset_peak_rss():
+    """
+    Resets the kernel's peak-RSS mark (VmHWM) for this process, so the next
+    _rss_status() peak covers only what ran in between. Linux only; returns
+    False where it is not supported.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _rss_status():
+    """
+    (current RSS, peak RSS since the last reset) in MB, from /proc/self/status.
+    """
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                key, kib = line.split()[:2]
+                values[key] = int(kib) / 1024
+    return values["VmRSS:"], values["VmHWM:"]
+
+def _run_stage(fn, memory):
+    """
+    Times fn() once. With memory, also records:
+
+        peak_rss_mb / rss_growth_mb  the stage's own peak resident set
+            (VmHWM reset before it ran, so torch/NumPy buffers count) and
+            how far it rose above the RSS at stage start; Linux only
+        python_heap_peak_mb  peak of Python-level allocations only, from a
+            second run under tracemalloc; torch tensors are invisible to it
+        max_rss_so_far_mb    elsewhere, ru_maxrss: the process-lifetime
+            high-water mark, not a per-stage figure
+
+    Returns (result, record).
+    """
+    per_stage_rss = memory and _reset_peak_rss()
+    if per_stage_rss:
+        rss_start, _ = _rss_status()
+    start = time.perf_counter()
+    result = fn()
+    record = {"seconds": time.perf_counter() - start}
+    if not memory:
+        return result, record
+    if per_stage_rss:
+        _, peak = _rss_status()
+        record["peak_rss_mb"] = peak
+        record["rss_growth_mb"] = peak - rss_start
+    else:
+        record["max_rss_so_far_mb"] = _max_rss_mb()
+    tracemalloc.start()
+    fn()
+    record["python_heap_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, record
+
+def benchmark_mesh(num_services, workdir, lines_per_service=20, metric_steps=10, traces_per_service=1,
+                   memory=True, bert=True, seed=0):
+    """
+    Runs every pipeline stage once on a synthetic mesh of num_services and
+    returns {stage: {"seconds", memory fields from _run_stage}} plus the
+    input volumes. A stage that cannot run here (e.g. BERT weights missing)
+    records its error and its consumers fall back to zeros; bert=False
+    skips the embedding stage outright.
+    """
+    from step2_log_processor import stream_service_windows, extract_template, EmbeddingCache
+    from step3_metric_analyzer import normalize_metrics, NUMERIC_COLS
+    from step4_trace_encoder import load_spans, encode_traces, Vocabulary
+    from step5_graph_builder import build_rca_graph, _data_class
+    from step9_inference import InferenceServer
+    from template_miner import TemplateMiner
+
+    mesh = SyntheticMesh(num_services, seed=seed)
+    topology = mesh.topology()
+    entries = mesh.log_entries(lines_per_service)
+    rows = mesh.metric_rows(metric_steps)
+    trace_path = mesh.write_jaeger_export(os.path.join(workdir, f"traces_{num_services}.jsonl"),
+                                          traces_per_service=traces_per_service)
+    store = FeatureStore(os.path.join(workdir, f"store_{num_services}"))
+    _data_class()  # Keep the one-off PyG import out of graph_build
+
+    results = {"inputs": {"services": num_services, "edges": len(topology["edges"]),
+                          "log_lines": len(entries), "metric_rows": len(rows)}}
+    outputs = {}
+
+    def log_templates():
+        miner = TemplateMiner()
+        return Counter(extract_template(line, miner) for _, _, line in entries)
+
+    def log_features():
+        latest = {}
+        for window in stream_service_windows(entries, miner=TemplateMiner(), cache=EmbeddingCache()):
+            latest[window["service"]] = window["vector"]
+        return FeatureFrame.from_dict(latest) if latest else None
+
+    def metrics():
+        df = normalize_metrics(rows)
+        latest = df.groupby('service', sort=False).tail(1)
+        return FeatureFrame(latest['service'].tolist(), latest[NUMERIC_COLS].to_numpy())
+
+    def trace_parsing():
+        return load_spans(trace_path, Vocabulary(), Vocabulary())
+
+    def trace_encoding():
+        return encode_traces(outputs["trace_parsing"])
+
+    def graph_build():
+        return build_rca_graph(topology, outputs.get("log_features"), outputs.get("metrics"),
+                               outputs.get("trace_encoding"), store=store, save=False)
+
+    server = None
+
+    def inference():
+        # Steady-state scoring: median of several ticks after warmup
+        latencies = []
+        for _ in range(INFERENCE_REPEATS):
+            start = time.perf_counter()
+            result = server.score(outputs["graph_build"])
+            latencies.append(time.perf_counter() - start)
+        inference.median = sorted(latencies)[len(latencies) // 2]
+        return result
+
+    stages = [("log_templates", log_templates), ("log_features", log_features), ("metrics", metrics),
+              ("trace_parsing", trace_parsing), ("trace_encoding", trace_encoding),
+              ("graph_build", graph_build), ("inference", inference)]
+    for name, fn in stages:
+        if name == "log_features" and not bert:
+            continue
+        if name == "inference":
+            server = InferenceServer(checkpoint_path=None).warmup(alerts=False)
+        try:
+            outputs[name], results[name] = _run_stage(fn, memory)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"[{num_services}] {name} failed: {results[name]['error']}")
+            continue
+        if name == "inference":
+            results[name]["seconds"] = inference.median
+        if name == "trace_parsing":
+            results["inputs"]["spans"] = len(outputs[name])
+    return results
+
+def compare(results, baseline, tolerance=TOLERANCE, min_delta=MIN_DELTA_SECONDS):
+    """
+    Lists stages slower than the baseline by more than tolerance (and by
+    more than min_delta seconds): [(size, stage, baseline_s, current_s)].
+    """
+    regressions = []
+    for size, stages in results["results"].items():
+        for stage, record in stages.items():
+            old = baseline.get("results", {}).get(size, {}).get(stage, {})
+            if "seconds" not in record or "seconds" not in old:
+                continue
+            if record["seconds"] > old["seconds"] * (1 + tolerance) and record["seconds"] - old["seconds"] > min_delta:
+                regressions.append((size, stage, old["seconds"], record["seconds"]))
+    return regressions
+
+def print_results(results, baseline=None):
+    for size, stages in results["results"].items():
+        inputs = stages["inputs"]
+        print(f"\n--- {size} services: {inputs['edges']} edges, {inputs['log_lines']} log lines, "
+              f"{inputs['metric_rows']} metric rows, {inputs.get('spans', 0)} spans ---")
+        for stage, record in stages.items():
+            if stage == "inputs":
+                continue
+            if "error" in record:
+                print(f"{stage:15s} skipped ({record['error'][:60]})")
+                continue
+            line = f"{stage:15s} {record['seconds'] * 1000:10.1f} ms"
+            if "peak_rss_mb" in record:
+                line += f" | stage peak RSS {record['peak_rss_mb']:8.1f} MB (+{record['rss_growth_mb']:.1f})"
+            elif "max_rss_so_far_mb" in record:
+                line += f" | process max RSS so far {record['max_rss_so_far_mb']:8.1f} MB"
+            if "python_heap_peak_mb" in record:
+                line += f" | Python heap peak {record['python_heap_peak_mb']:7.1f} MB"
+            old = (baseline or {}).get("results", {}).get(size, {}).get(stage, {})
+            if "seconds" in old:
+                line += f" | {record['seconds'] / max(old['seconds'], 1e-9):5.2f}x baseline"
+            print(line)
+
+def run_suite(sizes=SIZES, memory=True, **kwargs):
+    workdir = tempfile.mkdtemp(prefix="logwhisperer-bench-")
+    try:
+        import torch
+        results = {
+            "meta": {"timestamp": time.time(), "python": platform.python_version(), "torch": torch.__version__,
+                     "platform": platform.platform(), "cpus": os.cpu_count(), "threads": torch.get_num_threads()},
+            "results": {},
+        }
+        for size in sizes:
+            print(f"Benchmarking {size} services...")
+            results["results"][str(size)] = benchmark_mesh(size, workdir, memory=memory, **kwargs)
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end LogWhisperer benchmark on synthetic meshes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--lines-per-service", type=int, default=20)
+    parser.add_argument("--metric-steps", type=int, default=10)
+    parser.add_argument("--traces-per-service", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the RSS and tracemalloc measurements")
+    parser.add_argument("--no-bert", action="store_true", help="Skip the BERT log embedding stage")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Results to compare against, if present")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    results = run_suite(args.sizes, memory=not args.no_memory, lines_per_service=args.lines_per_service,
+                        metric_steps=args.metric_steps, traces_per_service=args.traces_per_service,
+                        bert=not args.no_bert)
+
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for size, stage, old, new in regressions:
+            print(f"REGRESSION [{size}] {stage}: {old * 1000:.1f} ms -> {new * 1000:.1f} ms")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import numpy as np
+
+# Configuration
+STORE_ROOT = "feature_store"
+LATEST = "latest"
+MODALITY_DIMS = {"logs": 768, "metrics": 4, "traces": 3}
+FEATURE_DIM = sum(MODALITY_DIMS.values())  # 775, the fused node vector fed to the GNN
+MODALITY_SLICES = {"logs": slice(0, 768), "metrics": slice(768, 772), "traces": slice(772, 775)}
+
+class FeatureFrame:
+    """
+    One (group, window) slice of the store: a [N, D] float32 matrix whose rows
+    are keyed by service name.
+    """
+    def __init__(self, services, values):
+        if len(services) != values.shape[0]:
+            raise ValueError(f"{len(services)} services for {values.shape[0]} rows")
+        self.services = list(services)
+        self.values = values
+        self.index = {s: i for i, s in enumerate(self.services)}
+
+    def __len__(self):
+        return len(self.services)
+
+    def __contains__(self, service):
+        return service in self.index
+
+    def row(self, service):
+        return self.values[self.index[service]]
+
+    def rows_for(self, services):
+        """
+        Returns (row_ids, found) for the requested services; missing services get row -1.
+        """
+        rows = np.fromiter((self.index.get(s, -1) for s in services), dtype=np.int64, count=len(services))
+        return rows, rows >= 0
+
+    def gather(self, services, out=None):
+        """
+        Copies the rows for services into out (allocated if needed), leaving
+        zeros for services this frame has no data for.
+        """
+        if out is None:
+            out = np.zeros((len(services), self.values.shape[1]), dtype=np.float32)
+        rows, found = self.rows_for(services)
+        out[found] = self.values[rows[found]]
+        return out
+
+    @classmethod
+    def from_dict(cls, features):
+        services = list(features)
+        values = np.array([features[s] for s in services], dtype=np.float32).reshape(len(services), -1)
+        return cls(services, values)
+
+    def to_dict(self):
+        return {s: self.values[i].tolist() for i, s in enumerate(self.services)}
+
+class TemporalFeatureBuffer:
+    """
+    Fixed-size history of the last `window` frames of a service set: one
+    preallocated float32 [W, N, D] ring, written in place each tick.
+
+    push() overwrites the oldest slot and advances the head, so a tick costs
+    one [N, D] copy however long the window is. frames() hands out the
+    filled slots oldest first as views, without reordering the ring.
+    Only a change of the service set reallocates (see reindex).
+    """
+    def __init__(self, window, services, dim=FEATURE_DIM):
+        self.window = window
+        self.dim = dim
+        self.values = np.zeros((window, len(services), dim), dtype=np.float32)
+        self.services = list(services)
+        self.index = {s: i for i, s in enumerate(self.services)}
+        self.head = 0   # Slot the next frame goes to
+        self.count = 0  # Filled slots
+
+    def __len__(self):
+        return self.count
+
+    def _advance(self):
+        self.head = (self.head + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+
+    def push(self, values):
+        """
+        Appends a full [N, D] frame in service order.
+        """
+        np.copyto(self.values[self.head], values, casting="same_kind")
+        self._advance()
+
+    def push_frame(self, frame):
+        """
+        Appends a FeatureFrame: services it has rows for are updated, the
+        rest carry their previous value forward.
+        """
+        slot = self.values[self.head]
+        if self.count:
+            np.copyto(slot, self.latest())
+        else:
+            slot.fill(0.0)
+        rows, found = frame.rows_for(self.services)
+        slot[found] = frame.values[rows[found]]
+        self._advance()
+
+    def latest(self):
+        return self.values[(self.head - 1) % self.window]
+
+    def frames(self):
+        """
+        The filled slots, oldest first, as [N, D] views.
+        """
+        start = (self.head - self.count) % self.window
+        return [self.values[(start + i) % self.window] for i in range(self.count)]
+
+    def reindex(self, services, fill=None):
+        """
+        Switches to a new service set (topology change), keeping the history
+        of services present in both. New services start at zeros, or with
+        their row of `fill` ([N, D] in the new order, e.g. the frame about to
+        be pushed) in every slot, as if they had always looked like that.
+        """
+        services = list(services)
+        if services == self.services:
+            return
+        if fill is None:
+            values = np.zeros((self.window, len(services), self.dim), dtype=np.float32)
+        else:
+            values = np.repeat(np.asarray(fill, dtype=np.float32)[None], self.window, axis=0)
+        rows = np.fromiter((self.index.get(s, -1) for s in services), dtype=np.int64, count=len(services))
+        found = rows >= 0
+        values[:, found] = self.values[:, rows[found]]
+        self.values = values
+        self.services = services
+        self.index = {s: i for i, s in enumerate(services)}
+
+class FeatureStore:
+    """
+    Columnar on-disk feature store replacing the per-step JSON handoffs.
+
+    Layout: <root>/<group>/<window>/values.npy (float32 [N, D]) and
+    services.json (row order). Reads are memory-mapped copy-on-write, so
+    consumers get NumPy/torch views without parsing or copying the data.
+    """
+    def __init__(self, root=STORE_ROOT):
+        self.root = root
+
+    def _dir(self, group, window):
+        return os.path.join(self.root, group, str(window))
+
+    def write(self, group, services, values, window=LATEST):
+        values = np.ascontiguousarray(values, dtype=np.float32)
+        if values.ndim != 2 or values.shape[0] != len(services):
+            raise ValueError(f"Expected [{len(services)}, D] values, got {values.shape}")
+        path = self._dir(group, window)
+        os.makedirs(path, exist_ok=True)
+
+        # Write side files first, then swap each one in atomically. A reader
+        # racing the swap gets a row-count mismatch error, never torn files.
+        tmp_values = os.path.join(path, f"values.{os.getpid()}.npy")
+        tmp_services = os.path.join(path, f"services.{os.getpid()}.json")
+        np.save(tmp_values, values)
+        with open(tmp_services, "w") as f:
+            json.dump(list(services), f)
+        os.replace(tmp_values, os.path.join(path, "values.npy"))
+        os.replace(tmp_services, os.path.join(path, "services.json"))
+
+        with open(os.path.join(self.root, group, "LATEST"), "w") as f:
+            f.write(str(window))
+        return path
+
+    def latest_window(self, group):
+        marker = os.path.join(self.root, group, "LATEST")
+        if os.path.exists(marker):
+            with open(marker, "r") as f:
+                return f.read().strip()
+        return LATEST
+
+    def windows(self, group):
+        base = os.path.join(self.root, group)
+        if not os.path.isdir(base):
+            return []
+        return sorted(d for d in os.listdir(base) if os.path.isdir(os.path.join(base, d)))
+
+    def exists(self, group, window=None):
+        window = self.latest_window(group) if window is None else window
+        return os.path.exists(os.path.join(self._dir(group, window), "services.json"))
+
+    def read(self, group, window=None, mmap=True):
+        """
+        Loads a (group, window) frame; window=None means the most recently written one.
+        """
+        window = self.latest_window(group) if window is None else window
+        path = self._dir(group, window)
+        with open(os.path.join(path, "services.json"), "r") as f:
+            services = json.load(f)
+        values = np.load(os.path.join(path, "values.npy"), mmap_mode="c" if mmap else None)
+        return FeatureFrame(services, values)
+
+    # --- JSON shim ---
+    def import_json(self, group, path, window=LATEST):
+        """
+        Imports a legacy {service: vector} JSON file (as written by steps 2-4).
+        """
+        with open(path, "r") as f:
+            frame = FeatureFrame.from_dict(json.load(f))
+        return self.write(group, frame.services, frame.values, window)
+
+    def export_json(self, group, path, window=None):
+        with open(path, "w") as f:
+            json.dump(self.read(group, window).to_dict(), f)
+
+if __name__ == "__main__":
+    # Usage: python feature_store.py import|export <group> <json_path> [window]
+    if len(sys.argv) < 4:
+        print("Usage: feature_store.py import|export <group> <json_path> [window]")
+        raise SystemExit(1)
+    command, group, json_path = sys.argv[1:4]
+    store = FeatureStore()
+    if command == "import":
+        print(f"Imported into {store.import_json(group, json_path, *sys.argv[4:5])}")
+    else:
+        store.export_json(group, json_path, *sys.argv[4:5])
+        print(f"Exported {group} to {json_path}")
@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import argparse
+import threading
+import numpy as np
+
+# Configuration
+INCIDENT_ROOT = os.environ.get("LOGWHISPERER_INCIDENTS", "")  # Incident history directory; unset = off
+TOP_K = 5                 # Ranking entries kept per incident
+NLIST = 256               # IVF coarse clusters
+NPROBE = 16               # Clusters scanned per query
+TRAIN_POINTS_PER_LIST = 40  # IVF trains once it holds NLIST * this many incidents
+KMEANS_ITERATIONS = 10
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _top_k(ids, similarities, k):
+    if len(ids) > k:
+        keep = np.argpartition(-similarities, k - 1)[:k]
+        ids, similarities = ids[keep], similarities[keep]
+    order = np.argsort(-similarities, kind="stable")
+    return ids[order], similarities[order]
+
+def train_kmeans(vectors, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Spherical k-means on unit vectors: centroids are unit vectors and
+    points join the centroid with the highest cosine similarity. Empty
+    clusters are reseeded with random points.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = np.bincount(assign, minlength=k) == 0
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+class BruteForceIndex:
+    """
+    Exact cosine k-NN over unit vectors: one matrix-vector product over a
+    contiguous, geometrically grown float32 matrix. Ids are insertion order.
+    """
+    def __init__(self, dim):
+        self.dim = dim
+        self._vectors = np.empty((1024, dim), dtype=np.float32)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        return self._vectors[:self._size]
+
+    def add(self, vectors):
+        vectors = _normalize(vectors).reshape(-1, self.dim)
+        end = self._size + len(vectors)
+        if end > len(self._vectors):
+            grown = np.empty((max(end, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+            grown[:self._size] = self.vectors
+            self._vectors = grown
+        self._vectors[self._size:end] = vectors
+        ids = np.arange(self._size, end)
+        self._size = end
+        return ids
+
+    def search(self, query, k=10):
+        """
+        Returns (ids, cosine similarities) of the k nearest vectors, best first.
+        """
+        if not self._size:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        similarities = self.vectors @ _normalize(query).reshape(self.dim)
+        return _top_k(np.arange(self._size), similarities, k)
+
+class IVFIndex(BruteForceIndex):
+    """
+    Inverted-file approximate index: a spherical k-means coarse quantizer
+    splits the vectors into nlist clusters and a query only scans the
+    nprobe clusters whose centroids are closest to it.
+
+    Until it holds enough vectors to train (nlist * TRAIN_POINTS_PER_LIST)
+    it answers exactly by brute force. It retrains when it has doubled
+    since the last training, so the clusters follow the data.
+    """
+    def __init__(self, dim, nlist=NLIST, nprobe=NPROBE):
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = None
+        self._trained_size = 0
+        self._lists = []         # cluster -> list of ids
+        self._list_arrays = {}   # cluster -> cached np.array of its ids
+
+    def train(self, centroids=None):
+        """
+        Fits the coarse quantizer (or installs saved centroids) and assigns
+        every stored vector to its cluster.
+        """
+        if centroids is None:
+            vectors = self.vectors
+            sample = min(len(vectors), self.nlist * TRAIN_POINTS_PER_LIST * 4)
+            if sample < len(vectors):
+                vectors = vectors[np.random.default_rng(0).choice(len(vectors), size=sample, replace=False)]
+            centroids = train_kmeans(vectors, self.nlist)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self._lists = [[] for _ in range(len(self.centroids))]
+        self._list_arrays = {}
+        self._assign(np.arange(self._size))
+        self._trained_size = self._size
+
+    def _assign(self, ids):
+        # Chunked so assigning 100k+ vectors does not materialise a huge score matrix
+        for start in range(0, len(ids), 65536):
+            chunk = ids[start:start + 65536]
+            for i, cluster in zip(chunk.tolist(), np.argmax(self._vectors[chunk] @ self.centroids.T, axis=1).tolist()):
+                self._lists[cluster].append(i)
+                self._list_arrays.pop(cluster, None)
+
+    def add(self, vectors):
+        ids = super().add(vectors)
+        if self.centroids is None:
+            if self._size >= self.nlist * TRAIN_POINTS_PER_LIST:
+                self.train()
+        elif self._size >= 2 * self._trained_size:
+            self.train()
+        else:
+            self._assign(ids)
+        return ids
+
+    def _members(self, cluster):
+        members = self._list_arrays.get(cluster)
+        if members is None:
+            members = self._list_arrays[cluster] = np.array(self._lists[cluster], dtype=np.int64)
+        return members
+
+    def search(self, query, k=10, nprobe=None):
+        if self.centroids is None:
+            return super().search(query, k)
+        query = _normalize(query).reshape(self.dim)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        closest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self._members(c) for c in closest.tolist()])
+        if not len(candidates):
+            return candidates, np.empty(0, dtype=np.float32)
+        return _top_k(candidates, self._vectors[candidates] @ query, k)
+
+class IncidentStore:
+    """
+    Append-only history of alerting ticks, searchable by failure shape.
+
+    Each incident is a fingerprint vector (LogWhispererBrain.fingerprint)
+    plus a JSON record: timestamp, the top-k ranking and the flagged root
+    causes with their explanation and step 11 remediation. On disk:
+
+        <root>/meta.json        fingerprint dimension
+        <root>/incidents.jsonl  one record per line
+        <root>/vectors.f32      raw float32 fingerprints, same order
+        <root>/centroids.npy    trained IVF quantizer, if any
+
+    Records and vectors are appended as incidents arrive, so nothing is
+    rewritten and a crash loses at most the incident being written.
+    """
+    def __init__(self, root, index="ivf", nlist=NLIST, nprobe=NPROBE):
+        self.root = root
+        self.index_kind = index
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.records = []
+        self.index = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _new_index(self, dim):
+        if self.index_kind == "ivf":
+            return IVFIndex(dim, nlist=self.nlist, nprobe=self.nprobe)
+        return BruteForceIndex(dim)
+
+    def _load(self):
+        if not os.path.exists(self._path("meta.json")):
+            return
+        with open(self._path("meta.json"), "r") as f:
+            dim = json.load(f)["dim"]
+        records, vectors, vector_bytes = [], np.empty((0, dim), dtype=np.float32), 0
+        if os.path.exists(self._path("incidents.jsonl")):
+            with open(self._path("incidents.jsonl"), "r") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+        if os.path.exists(self._path("vectors.f32")):
+            raw = np.fromfile(self._path("vectors.f32"), dtype=np.float32)
+            vectors = raw[:len(raw) // dim * dim].reshape(-1, dim)
+            vector_bytes = raw.nbytes
+
+        # A torn append leaves one side longer: keep what both agree on and
+        # cut the files back so later appends stay aligned
+        count = min(len(records), len(vectors))
+        if count != len(records) or count != len(vectors) or vector_bytes != vectors.nbytes:
+            vectors = vectors[:count].copy()
+            vectors.tofile(self._path("vectors.f32"))
+            with open(self._path("incidents.jsonl"), "w") as f:
+                f.writelines(json.dumps(r) + "\n" for r in records[:count])
+        self.records = records[:count]
+        self.index = self._new_index(dim)
+        if isinstance(self.index, IVFIndex) and os.path.exists(self._path("centroids.npy")):
+            BruteForceIndex.add(self.index, vectors[:count])
+            self.index.train(np.load(self._path("centroids.npy")))
+        else:
+            self.index.add(vectors[:count])
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, fingerprint, ranking, root_causes=(), timestamp=None, top_k=TOP_K):
+        """
+        Stores one incident. ranking is [{"service", "score"}] for the tick
+        (trimmed to the top_k by score); root_causes are the flagged reports
+        with their "explanation" and "remediation". Returns the record.
+        """
+        fingerprint = np.asarray(fingerprint, dtype=np.float32).reshape(-1)
+        ranking = sorted(ranking, key=lambda r: r["score"], reverse=True)[:top_k]
+        record = {
+            "timestamp": timestamp or time.time(),
+            "ranking": [{"service": r["service"], "score": float(r["score"])} for r in ranking],
+            "root_causes": [{"service": r["service"], "score": float(r["score"]),
+                             "explanation": r.get("explanation"), "remediation": r.get("remediation")}
+                            for r in root_causes],
+        }
+        with self._lock:
+            if self.index is None:
+                os.makedirs(self.root, exist_ok=True)
+                with open(self._path("meta.json"), "w") as f:
+                    json.dump({"dim": len(fingerprint)}, f)
+                self.index = self._new_index(len(fingerprint))
+            record = dict(id=len(self.records), **record)
+            trained_before = getattr(self.index, "_trained_size", 0)
+            self.index.add(fingerprint)
+            self.records.append(record)
+
+            with open(self._path("vectors.f32"), "ab") as f:
+                f.write(_normalize(fingerprint).tobytes())
+            with open(self._path("incidents.jsonl"), "a") as f:
+                f.write(json.dumps(record) + "\n")
+            if getattr(self.index, "_trained_size", 0) != trained_before:
+                np.save(self._path("centroids.npy"), self.index.centroids)
+        return record
+
+    def similar(self, fingerprint, k=3, min_similarity=0.0):
+        """
+        The k past incidents closest to fingerprint, best first, as records
+        with an added "similarity" (cosine).
+        """
+        with self._lock:
+            if self.index is None:
+                return []
+            ids, similarities = self.index.search(fingerprint, k)
+            return [dict(self.records[i], similarity=float(s))
+                    for i, s in zip(ids.tolist(), similarities.tolist()) if s >= min_similarity]
+
+def open_incident_store(root=None, temporal=False):
+    """
+    The incident store the alert pipeline records into: the directory in
+    LOGWHISPERER_INCIDENTS, or None (no history) when it is unset or empty.
+    Fingerprints of the temporal model live in its temporal/ subdirectory,
+    since they are not comparable with the static model's.
+    """
+    root = INCIDENT_ROOT if root is None else root
+    if not root:
+        return None
+    return IncidentStore(os.path.join(root, "temporal") if temporal else root)
+
+def benchmark_index(num_incidents=100000, dim=128, queries=200, k=10, clusters=500, seed=0):
+    """
+    Build time, query latency and IVF recall@k against brute force on
+    synthetic fingerprints drawn around `clusters` recurring failure shapes.
+    """
+    rng = np.random.default_rng(seed)
+    shapes = _normalize(rng.standard_normal((clusters, dim)))
+    vectors = _normalize(shapes[rng.integers(clusters, size=num_incidents)]
+                         + 0.35 * rng.standard_normal((num_incidents, dim)) / np.sqrt(dim))
+    probes = _normalize(shapes[rng.integers(clusters, size=queries)]
+                        + 0.35 * rng.standard_normal((queries, dim)) / np.sqrt(dim))
+
+    exact = BruteForceIndex(dim)
+    exact.add(vectors)
+    start = time.perf_counter()
+    approximate = IVFIndex(dim)
+    approximate.add(vectors)
+    build_s = time.perf_counter() - start
+
+    summary = {"incidents": num_incidents, "ivf_build_s": build_s}
+    truth = []
+    for name, index in (("brute_force", exact), ("ivf", approximate)):
+        latencies, found = [], []
+        for query in probes:
+            start = time.perf_counter()
+            ids, _ = index.search(query, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(ids)
+        if name == "brute_force":
+            truth = found
+        summary[f"{name}_p50_ms"] = float(np.percentile(latencies, 50))
+        summary[f"{name}_p99_ms"] = float(np.percentile(latencies, 99))
+    summary["ivf_recall"] = float(np.mean([len(np.intersect1d(a, b)) / k for a, b in zip(found, truth)]))
+
+    print(f"{num_incidents} incidents, dim {dim}: IVF built in {build_s:.2f} s")
+    print(f"Brute force p50 {summary['brute_force_p50_ms']:.2f} ms / p99 {summary['brute_force_p99_ms']:.2f} ms")
+    print(f"IVF         p50 {summary['ivf_p50_ms']:.2f} ms / p99 {summary['ivf_p99_ms']:.2f} ms, "
+          f"recall@{k} {summary['ivf_recall']:.3f}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LogWhisperer incident history")
+    parser.add_argument("--root", help="Print the most recent incidents of this store instead of benchmarking")
+    parser.add_argument("--incidents", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.root:
+        store = IncidentStore(args.root)
+        for record in store.records[-10:]:
+            causes = ", ".join(c["service"] for c in record["root_causes"]) or "-"
+            print(f"#{record['id']} {time.ctime(record['timestamp'])}: {causes}")
+        print(f"{len(store)} incidents in {args.root}")
+    else:
+        benchmark_index(args.incidents, args.dim, k=args.k)
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import threading
+import importlib
+import importlib.abc
+import importlib.util
+from contextlib import contextmanager
+
+# Configuration
+TIMING_ENV = "LOGWHISPERER_TIMING"  # Set to 1 to print import/startup timings
+
+_loaded_at = time.perf_counter()
+timings = {}  # label -> milliseconds
+_pending = {}  # Name -> lock of each lazy_import() module that has not run yet
+_pending_lock = threading.Lock()
+
+class _SerialLoader(importlib.abc.Loader):
+    """
+    Wraps the real loader of a lazy module. The first attribute access runs
+    exec_module from whichever thread gets there first; this runs it once,
+    under the module's lock, and makes other threads that read the
+    half-initialized module meanwhile wait for it instead of failing.
+    """
+    def __init__(self, loader, lock):
+        self.loader = loader
+        self.lock = lock
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        with self.lock:
+            if module.__name__ not in _pending:
+                return  # Another thread ran it while this one waited
+
+            def wait_for_module(attr):
+                with self.lock:
+                    try:
+                        return module.__dict__[attr]
+                    except KeyError:
+                        raise AttributeError(f"module '{module.__name__}' has no attribute '{attr}'") from None
+
+            module.__getattr__ = wait_for_module
+            try:
+                self.loader.exec_module(module)
+            finally:
+                if module.__dict__.get("__getattr__") is wait_for_module:
+                    del module.__getattr__
+                with _pending_lock:
+                    _pending.pop(module.__name__, None)
+
+def lazy_import(name):
+    """
+    Returns the top-level module `name` without executing it; the real import
+    runs on first attribute access, once, even if several threads get there
+    at the same time. Use it for heavy libraries (pandas, torch) that only
+    some code paths of a script need.
+    """
+    with _pending_lock:
+        if name in sys.modules:
+            return sys.modules[name]
+        spec = importlib.util.find_spec(name)
+        if spec is None:
+            raise ImportError(f"No module named '{name}'")
+        lock = _pending[name] = threading.RLock()
+        loader = importlib.util.LazyLoader(_SerialLoader(spec.loader, lock))
+        spec.loader = loader
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        loader.exec_module(module)
+    return module
+
+def process_uptime_ms():
+    """
+    Milliseconds since the interpreter process started (Linux /proc), or since
+    this module was imported where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return (uptime - start_ticks / os.sysconf("SC_CLK_TCK")) * 1000
+    except (OSError, ValueError, IndexError):
+        return (time.perf_counter() - _loaded_at) * 1000
+
+@contextmanager
+def timed(label):
+    """
+    Records how long the block took under `label` (imports, model loads, warmup).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[label] = (time.perf_counter() - start) * 1000
+        if os.environ.get(TIMING_ENV) == "1":
+            print(f"[timing] {label}: {timings[label]:.0f} ms")
+
+def timed_import(name):
+    """
+    Imports `name` now, recording the cost as "import <name>".
+    """
+    module = sys.modules.get(name)
+    if module is not None and name not in _pending:
+        return module
+    with timed(f"import {name}"):
+        module = importlib.import_module(name)
+        getattr(module, "__dict__")  # Completes a pending lazy import
+    return module
+
+def report_startup(label="startup"):
+    """
+    Records (and with LOGWHISPERER_TIMING=1 prints) the time from process
+    start to this point, e.g. the first useful output of a step.
+    """
+    timings[label] = process_uptime_ms()
+    if os.environ.get(TIMING_ENV) == "1":
+        print(f"[timing] {label}: {timings[label]:.0f} ms since process start")
+    return timings[label]
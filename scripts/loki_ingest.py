@@ -0,0 +1,125 @@
+import json
+import heapq
+from lazy_loader import lazy_import
+
+requests = lazy_import("requests")  # Only live queries need it; dumps are read from disk
+
+# Configuration
+LOKI_URL = "http://loki-service:3100"  # Matches the fluent-bit [OUTPUT] host/port
+SERVICE_LABEL = "service_name"         # Label attached by infra/fluent-bit-config.yaml
+CHUNK_SECONDS = 60
+CHUNK_LIMIT = 5000
+
+
+def iter_loki_range(query, start, end, loki_url=LOKI_URL, chunk_seconds=CHUNK_SECONDS,
+                    limit=CHUNK_LIMIT, session=None):
+    """
+    Pages through Loki's query_range API in fixed time chunks (forward order),
+    yielding one response body at a time so callers never hold the whole range.
+    start/end are epoch seconds.
+    """
+    session = session or requests.Session()
+    chunk_start = int(start * 1e9)
+    end_ns = int(end * 1e9)
+    step_ns = int(chunk_seconds * 1e9)
+
+    while chunk_start < end_ns:
+        chunk_end = min(chunk_start + step_ns, end_ns)
+        cursor = chunk_start
+        seen = set()  # (ts, stream labels, line) already yielded at the cursor timestamp
+        page_limit = limit
+        while cursor < chunk_end:
+            response = session.get(f"{loki_url}/loki/api/v1/query_range", params={
+                "query": query, "start": cursor, "end": chunk_end,
+                "limit": page_limit, "direction": "forward",
+            })
+            response.raise_for_status()
+            body = response.json()
+
+            # A full page means the chunk was truncated. The next page starts at the
+            # last timestamp (not after it) so entries sharing it are not skipped,
+            # and the ones this page already returned are dropped from the next.
+            last_ts, count, fresh = None, 0, 0
+            for stream in body["data"]["result"]:
+                count += len(stream["values"])
+                if stream["values"]:
+                    ts = int(stream["values"][-1][0])
+                    last_ts = ts if last_ts is None else max(last_ts, ts)
+                if seen:
+                    labels = tuple(sorted(stream.get("stream", {}).items()))
+                    stream["values"] = [v for v in stream["values"] if (int(v[0]), labels, v[1]) not in seen]
+                fresh += len(stream["values"])
+            yield body
+
+            if count < page_limit or last_ts is None:
+                break
+            if fresh == 0:
+                # The page holds only entries already seen: more of them share the
+                # cursor timestamp than fit on a page, and Loki cannot page within
+                # one timestamp, so ask again for a larger page
+                page_limit *= 2
+                continue
+            page_limit = limit
+            if last_ts != cursor:
+                seen = set()
+            for stream in body["data"]["result"]:
+                labels = tuple(sorted(stream.get("stream", {}).items()))
+                seen.update((last_ts, labels, v[1]) for v in stream["values"] if int(v[0]) == last_ts)
+            cursor = last_ts
+        chunk_start = chunk_end
+
+def iter_loki_file(path):
+    """
+    Reads a local dump of query_range output, whatever its extension. A JSONL
+    dump is streamed line by line, where each line is either a full
+    query_range response (one chunk, as produced by iter_loki_range) or a
+    single stream object; anything else is read as one JSON response.
+    """
+    with open(path, "r") as f:
+        first = f.readline()
+        while first and not first.strip():
+            first = f.readline()
+        try:
+            record = json.loads(first)
+        except json.JSONDecodeError:
+            record = None  # Not a complete document on one line: a (pretty-printed) JSON response
+        if not isinstance(record, dict):
+            f.seek(0)
+            yield json.load(f)
+            return
+
+        lines = iter(f)
+        while record is not None:
+            if "data" not in record:
+                record = {"data": {"result": [record]}}
+            yield record
+            record = None
+            for line in lines:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    break
+
+def iter_entries(responses, label=SERVICE_LABEL):
+    """
+    Flattens query_range responses into (timestamp_seconds, service, line) tuples.
+    Loki returns each stream separately, so the (already sorted) streams of a
+    response are merged to keep entries in time order within the chunk.
+    """
+    def stream_entries(stream):
+        service = stream.get("stream", {}).get(label, "unknown")
+        for ts, line in stream["values"]:
+            yield int(ts) / 1e9, service, line
+
+    for body in responses:
+        yield from heapq.merge(*(stream_entries(s) for s in body["data"]["result"]),
+                               key=lambda entry: entry[0])
+
+
+if __name__ == "__main__":
+    sample = {"data": {"result": [
+        {"stream": {"service_name": "auth"}, "values": [["1700000000000000000", "User 501 logged in"]]},
+        {"stream": {"service_name": "cart"}, "values": [["1700000001000000000", "Read timed out"]]},
+    ]}}
+    for entry in iter_entries([sample]):
+        print(entry)
@@ -0,0 +1,271 @@
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from feature_store import FeatureStore, FeatureFrame
+from lazy_loader import timed_import
+from telemetry import stage_timer, serve_metrics, TICKS, METRICS_PORT
+
+# Configuration
+TICK_INTERVAL = 15       # Seconds between pipeline ticks, matches the Prometheus scrape interval
+MAX_WORKERS = 4          # Steps 1-4 run side by side
+LOKI_QUERY = '{service_name=~".+"}'
+
+class Stage:
+    """
+    One node of the pipeline DAG. fn(inputs, tick) receives the results of
+    the stages listed in deps as a {name: result} dict.
+    """
+    def __init__(self, name, fn, deps=()):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+
+class PipelineOrchestrator:
+    """
+    Runs the pipeline as a DAG once per tick: every stage starts as soon as
+    its dependencies are done, on a thread pool (NumPy, torch and HTTP I/O
+    release the GIL), and results are handed over in memory. A tick's wall
+    time therefore follows the critical path (slowest collector, then graph
+    building and inference) rather than the sum of the steps.
+
+    Backpressure: ticks run one at a time. When a tick overruns the
+    interval, the ticks it overlapped are skipped (and counted) instead of
+    queueing up behind it.
+    """
+    def __init__(self, stages, interval=TICK_INTERVAL, max_workers=MAX_WORKERS):
+        self.stages = {stage.name: stage for stage in stages}
+        self.interval = interval
+        self.max_workers = max_workers
+        self.stats = {"ticks": 0, "skipped": 0, "overruns": 0, "errors": 0}
+        self.last_timings = {}
+        self._order = self._topological_order()
+
+    def _topological_order(self):
+        order, done = [], set()
+        pending = dict(self.stages)
+        while pending:
+            ready = [name for name, stage in pending.items() if all(d in done for d in stage.deps)]
+            if not ready:
+                missing = {n: [d for d in s.deps if d not in done] for n, s in pending.items()}
+                raise ValueError(f"Pipeline has a cycle or unknown dependency: {missing}")
+            for name in ready:
+                order.append(name)
+                done.add(name)
+                del pending[name]
+        return order
+
+    def _timed(self, stage, inputs, tick):
+        start = time.perf_counter()
+        with stage_timer(f"tick_{stage.name}"):
+            result = stage.fn(inputs, tick)
+        return result, (time.perf_counter() - start) * 1000
+
+    def run_tick(self, tick=None):
+        """
+        Runs every stage once. Returns ({stage: result}, {stage: ms, "total": ms}).
+        A failing stage fails its dependents; the others still run.
+        """
+        tick = tick or {"start": time.time() - self.interval, "end": time.time(), "index": self.stats["ticks"]}
+        results, timings, failed = {}, {}, {}
+        started = time.perf_counter()
+
+        with stage_timer("tick"), ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rca-stage") as pool:
+            running = {}
+            remaining = list(self._order)
+            while remaining or running:
+                for name in list(remaining):
+                    stage = self.stages[name]
+                    if any(d in failed for d in stage.deps):
+                        failed[name] = "upstream failure"
+                        remaining.remove(name)
+                    elif all(d in results for d in stage.deps):
+                        inputs = {d: results[d] for d in stage.deps}
+                        running[pool.submit(self._timed, stage, inputs, tick)] = name
+                        remaining.remove(name)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name], timings[name] = future.result()
+                    except Exception as e:
+                        failed[name] = e
+                        print(f"Stage {name} failed: {e}")
+
+        timings["total"] = (time.perf_counter() - started) * 1000
+        self.stats["ticks"] += 1
+        self.stats["errors"] += len(failed)
+        TICKS.inc(outcome="failed" if failed else "ok")
+        self.last_timings = timings
+        return results, timings
+
+    def run(self, iterations=None):
+        """
+        Ticks every `interval` seconds on a fixed schedule, forever or for
+        `iterations` ticks.
+        """
+        next_tick = time.time()
+        while iterations is None or self.stats["ticks"] < iterations:
+            tick_start = time.time()
+            _, timings = self.run_tick({"start": tick_start - self.interval, "end": tick_start,
+                                        "index": self.stats["ticks"]})
+            print(format_timings(self.stats["ticks"], timings))
+
+            # Backpressure: drop the ticks a slow run has already overlapped
+            next_tick += self.interval
+            now = time.time()
+            if now > next_tick:
+                missed = int((now - next_tick) // self.interval) + 1
+                self.stats["overruns"] += 1
+                self.stats["skipped"] += missed
+                TICKS.inc(outcome="overrun")
+                TICKS.inc(missed, outcome="skipped")
+                next_tick += missed * self.interval
+                print(f"Tick overran the {self.interval}s interval; skipping {missed} tick(s).")
+            time.sleep(max(0.0, next_tick - time.time()))
+
+def format_timings(tick, timings):
+    stages = " | ".join(f"{name} {ms:.0f} ms" for name, ms in timings.items() if name != "total")
+    return f"Tick {tick}: {stages} | total {timings['total']:.0f} ms"
+
+def _store_frame(store, group):
+    return store.read(group) if store.exists(group) else None
+
+def default_stages(store=None, topology_service=None, topology_path=None, loki_query=None, loki_dump=None,
+                   metrics_source=None, trace_export=None, server=None, alert=True, persist=False):
+    """
+    Steps 1-5 and 9 wired as a DAG:
+
+        topology --.
+        logs ------+--> graph --> inference (alerts go to steps 10-12)
+        metrics ---+
+        traces ----'
+
+    Each collector reads its live source when one is configured
+    (topology_service or topology_path, loki_query or loki_dump,
+    metrics_source() returning raw metric rows, trace_export) and otherwise
+    falls back to the latest group in the feature store, so per-step cron
+    jobs can still feed it. persist=True also writes every tick's frames to
+    the store.
+    """
+    store = store or FeatureStore()
+
+    def topology(inputs, tick):
+        step5 = timed_import("step5_graph_builder")
+        if topology_service is not None:
+            topology_service.poll()
+            return topology_service.topology()
+        return step5.load_topology(topology_path) if topology_path else step5.load_topology()
+
+    def logs(inputs, tick):
+        if not (loki_query or loki_dump):
+            return _store_frame(store, "logs")
+        step2 = timed_import("step2_log_processor")
+        loki = timed_import("loki_ingest")
+        if loki_dump:
+            responses = loki.iter_loki_file(loki_dump)
+        else:
+            responses = loki.iter_loki_range(loki_query, tick["start"], tick["end"])
+        vectors = step2.latest_service_vectors(loki.iter_entries(responses))
+        if not vectors:
+            return None
+        frame = FeatureFrame.from_dict(vectors)
+        if persist:
+            store.write("logs", frame.services, frame.values)
+        return frame
+
+    metrics_normalizer = []  # Per-service baselines live across ticks
+
+    def metrics(inputs, tick):
+        if metrics_source is None:
+            return _store_frame(store, "metrics")
+        step3 = timed_import("step3_metric_analyzer")
+        if not metrics_normalizer:
+            metrics_normalizer.append(step3.StreamingNormalizer())
+        df = step3.normalize_metrics(metrics_source(tick), metrics_normalizer[0])
+        latest = df.groupby('service', sort=False).tail(1)
+        frame = FeatureFrame(latest['service'].tolist(), latest[step3.NUMERIC_COLS].to_numpy())
+        if persist:
+            store.write("metrics", frame.services, frame.values)
+        return frame
+
+    def traces(inputs, tick):
+        if trace_export is None:
+            return _store_frame(store, "traces")
+        step4 = timed_import("step4_trace_encoder")
+        frame = step4.encode_traces(step4.load_spans(trace_export))
+        if persist:
+            store.write("traces", frame.services, frame.values)
+        return frame
+
+    def graph(inputs, tick):
+        step5 = timed_import("step5_graph_builder")
+        return step5.build_rca_graph(inputs["topology"], inputs["logs"], inputs["metrics"], inputs["traces"],
+                                     store=store, save=persist)
+
+    def inference(inputs, tick):
+        step9 = timed_import("step9_inference")
+        scorer = server or step9.get_server()
+        if not alert:
+            return scorer.process(inputs["graph"])
+        return step9.run_inference(inputs["graph"], store=store, server=scorer)
+
+    return [
+        Stage("topology", topology),
+        Stage("logs", logs),
+        Stage("metrics", metrics),
+        Stage("traces", traces),
+        Stage("graph", graph, deps=("topology", "logs", "metrics", "traces")),
+        Stage("inference", inference, deps=("graph",)),
+    ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the LogWhisperer pipeline as a concurrent DAG")
+    parser.add_argument("--interval", type=float, default=TICK_INTERVAL)
+    parser.add_argument("--iterations", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--prometheus", help="Poll live topology from this Prometheus URL")
+    parser.add_argument("--topology", help="Topology JSON written by step 1")
+    parser.add_argument("--loki-query", nargs="?", const=LOKI_QUERY,
+                        help="Pull each tick's logs from Loki (LogQL selector, default all services)")
+    parser.add_argument("--loki-dump", help="Loki query_range JSON/JSONL dump")
+    parser.add_argument("--trace-export", help="Jaeger or OTLP JSON/JSONL export")
+    parser.add_argument("--persist", action="store_true", help="Also write each tick's frames to the feature store")
+    parser.add_argument("--no-alerts", action="store_true", help="Rank only; skip steps 10-12")
+    parser.add_argument("--shard-workers", type=int, default=0,
+                        help="Score graph shards on this many worker processes (0 = single process)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Prometheus /metrics port (0 = off)")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+
+    topology_service = None
+    if args.prometheus:
+        from step1_extract_topology import TopologyService
+        topology_service = TopologyService(args.prometheus)
+
+    server = None
+    if args.shard_workers:
+        from sharding import ShardedInference
+        from step9_inference import CHECKPOINT_PATH, QUANTIZED, TEMPORAL_WINDOW
+        server = ShardedInference(checkpoint_path=CHECKPOINT_PATH, num_workers=args.shard_workers,
+                                  quantized=QUANTIZED, temporal_window=TEMPORAL_WINDOW)
+
+    orchestrator = PipelineOrchestrator(
+        default_stages(topology_service=topology_service, topology_path=args.topology,
+                       loki_query=args.loki_query, loki_dump=args.loki_dump, trace_export=args.trace_export,
+                       server=server, alert=not args.no_alerts, persist=args.persist),
+        interval=args.interval, max_workers=args.workers)
+    try:
+        orchestrator.run(args.iterations)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if not args.no_alerts:
+            from alert_pipeline import get_alert_pipeline
+            get_alert_pipeline().stop()
+        if server is not None:
+            server.close()
+        print(f"Orchestrator stats: {orchestrator.stats}")
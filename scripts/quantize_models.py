@@ -0,0 +1,160 @@
+import io
+import os
+import copy
+import json
+import time
+import argparse
+import numpy as np
+import torch
+from step6_model import LogWhispererBrain, quantize_brain
+from step7_chaos_simulator import ChaosSimulator, synthetic_topology
+from step9_inference import CHECKPOINT_PATH, QUANTIZED_CHECKPOINT_PATH, HIDDEN_DIM, file_digest
+from feature_store import FEATURE_DIM
+
+# Configuration
+REPORT_PATH = "quantization_report.json"
+HELD_OUT_SEED = 99  # Topology seed disjoint from the training/validation pools in step8
+
+def state_dict_bytes(model):
+    """
+    Serialized size of the model weights, the part of RSS quantization shrinks.
+    """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+def load_brain(checkpoint_path=CHECKPOINT_PATH, hidden_dim=HIDDEN_DIM):
+    model = LogWhispererBrain(in_channels=FEATURE_DIM, hidden_channels=hidden_dim, out_channels=1)
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        model.load_state_dict(torch.load(checkpoint_path, map_location="cpu"))
+    else:
+        print(f"Warning: checkpoint {checkpoint_path} not found, comparing untrained weights.")
+    return model.eval()
+
+def export_brain(model, path=QUANTIZED_CHECKPOINT_PATH, checkpoint_path=CHECKPOINT_PATH):
+    """
+    Saves the int8 GNN together with the digest of the fp32 checkpoint it was
+    quantized from, so step 9 can tell when it is stale.
+    """
+    quantized = quantize_brain(model)
+    torch.save({"source_digest": file_digest(checkpoint_path), "state_dict": quantized.state_dict()}, path)
+    print(f"Exported int8 GNN to {path}")
+    return quantized
+
+def export_encoder(path=None):
+    """
+    Quantizes the DistilBERT log encoder and saves its int8 weights. Returns
+    the (tokenizer, model) pairs for fp32 and int8.
+    """
+    from step2_log_processor import load_encoder, quantize_encoder, QUANTIZED_ENCODER_PATH
+    path = path or QUANTIZED_ENCODER_PATH
+    tokenizer, fp32 = load_encoder(quantized=False)
+    int8 = quantize_encoder(copy.deepcopy(fp32))
+    torch.save(int8.state_dict(), path)
+    print(f"Exported int8 log encoder to {path}")
+    return (tokenizer, fp32), (tokenizer, int8)
+
+def ranking_metrics(logits, roots):
+    """
+    Top-1/top-5 hit rate and mean reciprocal rank of the true root cause.
+    logits: [B, N], roots: [B].
+    """
+    true_score = logits.gather(1, roots.view(-1, 1))
+    rank = (logits > true_score).sum(dim=1) + 1
+    return {
+        "top1": float((rank == 1).float().mean()),
+        "top5": float((rank <= 5).float().mean()),
+        "mrr": float((1.0 / rank.float()).mean()),
+    }
+
+def compare_brains(fp32, int8, num_scenarios=200, num_nodes=500, seed=HELD_OUT_SEED):
+    """
+    Scores held-out chaos scenarios with both GNNs and reports ranking
+    accuracy, per-graph latency, weight size and how often the top-1 agrees.
+    """
+    simulator = ChaosSimulator(synthetic_topology(num_nodes, seed=seed * 1000))
+    x, _, roots, _ = simulator.simulate(num_scenarios, torch.Generator().manual_seed(seed))
+    edge_index = simulator.edge_index
+
+    report = {}
+    top1 = {}
+    for name, model in (("fp32", fp32), ("int8", int8)):
+        with torch.inference_mode():
+            model(x[0], edge_index)  # Warmup
+            start = time.perf_counter()
+            logits = torch.stack([model(graph, edge_index).view(-1) for graph in x])
+            elapsed = time.perf_counter() - start
+        report[name] = ranking_metrics(logits, roots)
+        report[name]["ms_per_graph"] = elapsed * 1000 / num_scenarios
+        report[name]["weight_bytes"] = state_dict_bytes(model)
+        top1[name] = logits.argmax(dim=1)
+    report["top1_agreement"] = float((top1["fp32"] == top1["int8"]).float().mean())
+    report["speedup"] = report["fp32"]["ms_per_graph"] / report["int8"]["ms_per_graph"]
+    return report
+
+def compare_encoders(fp32, int8, num_templates=512):
+    """
+    Embeds synthetic log templates with both encoders and reports throughput,
+    weight size and the cosine similarity of the int8 embeddings to fp32.
+    """
+    from step2_log_processor import get_log_embeddings, synthetic_log_corpus, extract_template
+    from template_miner import TemplateMiner
+
+    miner = TemplateMiner()
+    templates = sorted({extract_template(line, miner) for line in synthetic_log_corpus(20 * num_templates, num_templates)})
+
+    report = {}
+    vectors = {}
+    for name, encoder in (("fp32", fp32), ("int8", int8)):
+        start = time.perf_counter()
+        vectors[name] = get_log_embeddings(templates, encoder=encoder)
+        elapsed = time.perf_counter() - start
+        report[name] = {"templates_per_sec": len(templates) / elapsed, "weight_bytes": state_dict_bytes(encoder[1])}
+    a, b = vectors["fp32"], vectors["int8"]
+    cosine = (a * b).sum(axis=1) / np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+    report["cosine_mean"] = float(cosine.mean())
+    report["cosine_min"] = float(cosine.min())
+    report["speedup"] = report["int8"]["templates_per_sec"] / report["fp32"]["templates_per_sec"]
+    return report
+
+def print_report(report):
+    gnn = report["gnn"]
+    print("\n--- GNN: fp32 vs int8 (held-out chaos scenarios) ---")
+    for name in ("fp32", "int8"):
+        r = gnn[name]
+        print(f"{name}: top1 {r['top1']:.3f} | top5 {r['top5']:.3f} | MRR {r['mrr']:.3f} | "
+              f"{r['ms_per_graph']:.2f} ms/graph | {r['weight_bytes'] / 1024:.0f} KiB")
+    print(f"Top-1 agreement {gnn['top1_agreement']:.3f}, speedup {gnn['speedup']:.2f}x")
+
+    encoder = report.get("encoder")
+    if encoder:
+        print("\n--- Log encoder: fp32 vs int8 ---")
+        for name in ("fp32", "int8"):
+            r = encoder[name]
+            print(f"{name}: {r['templates_per_sec']:.0f} templates/sec | {r['weight_bytes'] / 2**20:.0f} MiB")
+        print(f"Cosine to fp32: mean {encoder['cosine_mean']:.4f}, min {encoder['cosine_min']:.4f}, "
+              f"speedup {encoder['speedup']:.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export int8 models and compare them with fp32")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--scenarios", type=int, default=200)
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--skip-encoder", action="store_true", help="Only export and compare the GNN")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--report", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    brain = load_brain(args.checkpoint)
+    report = {"gnn": compare_brains(brain, export_brain(brain, checkpoint_path=args.checkpoint), args.scenarios,
+                                    args.nodes)}
+    if not args.skip_encoder:
+        report["encoder"] = compare_encoders(*export_encoder())
+
+    print_report(report)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.report}. Set LOGWHISPERER_QUANTIZED=1 to serve the int8 models.")
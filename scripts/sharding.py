@@ -0,0 +1,332 @@
+import os
+import time
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import torch
+from feature_store import FEATURE_DIM
+from telemetry import INFERENCE_SECONDS, NODES_SCORED
+
+# Configuration
+HALO_HOPS = 2            # Receptive field of the two GAT layers
+SHARDS_PER_WORKER = 2    # More shards than workers evens out stragglers
+HIDDEN_DIM = 16
+
+def connected_components(num_nodes, edge_index):
+    """
+    Weakly connected component label per node ([N] int64, labels 0..C-1):
+    min-label propagation along the edges with pointer jumping.
+    """
+    labels = np.arange(num_nodes)
+    src, dst = np.asarray(edge_index)
+    while True:
+        low = np.minimum(labels[src], labels[dst])
+        updated = labels.copy()
+        np.minimum.at(updated, src, low)
+        np.minimum.at(updated, dst, low)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    return np.unique(labels, return_inverse=True)[1]
+
+def namespace_groups(node_ids, namespaces):
+    """
+    Namespace label per node ([N] int64); services without one share a group.
+    """
+    names = [namespaces.get(n, "") for n in node_ids]
+    return np.unique(names, return_inverse=True)[1]
+
+class Shard:
+    """
+    One partition of the graph: its core nodes (scored here), the halo
+    nodes within HALO_HOPS upstream of the core (inputs only), and the
+    induced edges relabeled onto nodes = core + halo.
+    """
+    def __init__(self, core, halo, edge_index):
+        self.core = core
+        self.halo = halo
+        self.nodes = np.concatenate([core, halo])
+        self.edge_index = edge_index
+
+    def __len__(self):
+        return len(self.nodes)
+
+def partition(num_nodes, edge_index, groups, num_shards, hops=HALO_HOPS):
+    """
+    Packs the groups (components or namespaces, [N] labels) into num_shards
+    shards of balanced core size, largest group first onto the least loaded
+    shard, and adds each shard's halo.
+
+    Messages flow source -> target, so a core node's logit depends on the
+    nodes up to `hops` edges upstream of it. With them and every edge among
+    them in the shard, the core logits equal full-graph inference exactly;
+    halo logits are discarded.
+
+    Independent components need no halo at all. Namespace shards of one
+    connected mesh replicate the upstream neighbourhood of their hubs, which
+    is why plan() prefers components.
+    """
+    edge_index = np.asarray(edge_index)
+    src, dst = edge_index
+    sizes = np.bincount(groups)
+    loads = np.zeros(num_shards, dtype=np.int64)
+    group_shard = np.empty(len(sizes), dtype=np.int64)
+    for group in np.argsort(-sizes, kind="stable"):
+        shard = int(np.argmin(loads))
+        group_shard[group] = shard
+        loads[shard] += sizes[group]
+    shard_of = group_shard[groups]
+
+    shards = []
+    relabel = np.empty(num_nodes, dtype=np.int64)
+    for s in range(num_shards):
+        core = np.flatnonzero(shard_of == s)
+        if not len(core):
+            continue
+        mask = np.zeros(num_nodes, dtype=bool)
+        mask[core] = True
+        for _ in range(hops):
+            mask[src[mask[dst]]] = True
+        halo = np.flatnonzero(mask & (shard_of != s))
+        shard = Shard(core, halo, None)
+        relabel[shard.nodes] = np.arange(len(shard))
+        shard.edge_index = relabel[edge_index[:, mask[src] & mask[dst]]]
+        shards.append(shard)
+    return shards
+
+# --- Worker side ---
+_worker = {}
+
+def _init_worker(state_dict, hidden_dim, num_threads, quantized=False):
+    # Runs once per process: one model per worker, single-threaded so
+    # throughput scales with processes rather than intra-op threads
+    from step6_model import LogWhispererBrain, quantize_brain
+    torch.set_num_threads(num_threads)
+    model = LogWhispererBrain(in_channels=FEATURE_DIM, hidden_channels=hidden_dim, out_channels=1)
+    model.load_state_dict(state_dict)
+    _worker["model"] = quantize_brain(model) if quantized else model.eval()
+
+def _features(name, shape):
+    cached = _worker.get("shm")
+    if cached is None or cached.name != name:
+        if cached is not None:
+            cached.close()
+        # Spawned workers share the parent's resource tracker, which unlinks
+        # the block once, when the parent does
+        cached = _worker["shm"] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=np.float32, buffer=cached.buf)
+
+def _score_shard(name, shape, nodes, edge_index, num_core, k=None):
+    """
+    Scores one shard from the shared feature matrix. Returns (positions in
+    the shard core, probabilities), the shard's top k only when k is given.
+    """
+    x = torch.from_numpy(_features(name, shape)[nodes])
+    with torch.inference_mode():
+        logits = _worker["model"](x, torch.from_numpy(edge_index))
+    probabilities = torch.sigmoid(logits[:num_core]).view(-1).numpy()
+    positions = np.arange(num_core)
+    if k is not None and k < num_core:
+        positions = np.argpartition(-probabilities, k - 1)[:k]
+        probabilities = probabilities[positions]
+    return positions, probabilities
+
+class ShardedInference:
+    """
+    Scores a large graph as independent shards on a process pool.
+
+    The topology is partitioned into connected components (or namespaces,
+    see plan()) packed into num_shards balanced shards with their halo. The
+    plan is cached per topology_version. Per tick the feature matrix is copied
+    once into shared memory; workers gather their shard's rows from it.
+
+    score() returns (node_ids, probabilities, x, edge_index) like
+    InferenceServer.score, so run_inference and the orchestrator accept it
+    as their server; top_k() merges per-shard top k into a global one.
+
+    quantized: workers score with the int8 model (quantized on load);
+    explanations still use the fp32 weights. The temporal model keeps
+    per-node history across ticks, which shards do not carry, so a
+    temporal_window raises ValueError.
+    """
+    def __init__(self, model=None, checkpoint_path=None, hidden_dim=HIDDEN_DIM, num_workers=None, num_shards=None,
+                 by="auto", hops=HALO_HOPS, threads_per_worker=1, quantized=False, temporal_window=0):
+        if temporal_window:
+            raise ValueError("Sharded scoring does not support the temporal model")
+        if model is None:
+            from step6_model import LogWhispererBrain
+            model = LogWhispererBrain(in_channels=FEATURE_DIM, hidden_channels=hidden_dim, out_channels=1)
+            if checkpoint_path and os.path.exists(checkpoint_path):
+                model.load_state_dict(torch.load(checkpoint_path, map_location="cpu"))
+        self.explain_model = model.eval()
+        self.quantized = quantized
+        self.temporal = None
+        self.num_workers = num_workers or os.cpu_count()
+        self.num_shards = num_shards or self.num_workers * SHARDS_PER_WORKER
+        self.by = by
+        self.hops = hops
+        self.pool = ProcessPoolExecutor(self.num_workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker,
+                                        initargs=(model.state_dict(), hidden_dim, threads_per_worker, quantized))
+        self.shards = []
+        self.stats = {"partitions": 0, "ticks": 0}
+        self._plan_key = None
+        self._shm = None
+
+    def plan(self, node_ids, edge_index, namespaces=None):
+        """
+        Partitions the topology: by="component", "namespace", or "auto"
+        (components, unless the largest one would not fit a single shard
+        and namespaces are known).
+        """
+        num_nodes = len(node_ids)
+        edge_index = np.asarray(edge_index)
+        groups = connected_components(num_nodes, edge_index)
+        by = self.by
+        if by == "auto":
+            too_big = np.bincount(groups).max() > num_nodes / self.num_shards
+            by = "namespace" if too_big and namespaces else "component"
+        if by == "namespace":
+            groups = namespace_groups(node_ids, namespaces or {})
+        self.shards = partition(num_nodes, edge_index, groups, self.num_shards, self.hops)
+        self.stats["partitions"] += 1
+        self.stats["by"] = by
+        self.stats["replication"] = sum(len(s) for s in self.shards) / max(num_nodes, 1)
+        return self.shards
+
+    def _share(self, x):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        if self._shm is None or self._shm.size < x.nbytes:
+            self.close_memory()
+            self._shm = shared_memory.SharedMemory(create=True, size=max(x.nbytes, 1))
+        np.ndarray(x.shape, dtype=np.float32, buffer=self._shm.buf)[:] = x
+        return self._shm.name, x.shape
+
+    def _run(self, graph, k=None):
+        node_ids = list(graph['node_ids'])
+        x, edge_index = graph['x'], graph['edge_index']
+        key = graph.get('topology_version')
+        if key is None or key != self._plan_key:
+            self.plan(node_ids, edge_index, graph.get('namespaces'))
+            self._plan_key = key
+
+        name, shape = self._share(x.numpy() if torch.is_tensor(x) else x)
+        futures = [(shard, self.pool.submit(_score_shard, name, shape, shard.nodes, shard.edge_index,
+                                            len(shard.core), k))
+                   for shard in self.shards]
+        results = [(shard.core[positions], probabilities)
+                   for shard, (positions, probabilities) in ((s, f.result()) for s, f in futures)]
+        self.stats["ticks"] += 1
+        return node_ids, results
+
+    def score(self, graph):
+        start = time.perf_counter()
+        node_ids, results = self._run(graph)
+        probabilities = np.empty(len(node_ids), dtype=np.float32)
+        for nodes, shard_probabilities in results:
+            probabilities[nodes] = shard_probabilities
+        elapsed = time.perf_counter() - start
+        INFERENCE_SECONDS.observe(elapsed)
+        NODES_SCORED.inc(len(node_ids))
+        return node_ids, probabilities, graph['x'], graph['edge_index']
+
+    def top_k(self, graph, k=10):
+        """
+        Global top k: each shard returns only its own top k, merged here.
+        """
+        node_ids, results = self._run(graph, k)
+        nodes = np.concatenate([n for n, _ in results])
+        probabilities = np.concatenate([p for _, p in results])
+        order = np.argsort(-probabilities, kind="stable")[:k]
+        return [{"service": node_ids[nodes[i]], "score": float(probabilities[i])} for i in order]
+
+    def process(self, graph):
+        node_ids, probabilities, _, _ = self.score(graph)
+        order = np.argsort(-probabilities, kind="stable")
+        return [{"service": node_ids[i], "score": float(probabilities[i])} for i in order]
+
+    def close_memory(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.close_memory()
+
+def multi_cluster_topology(num_services, clusters, seed=0):
+    """
+    `clusters` disjoint SyntheticMesh clusters with num_services in total,
+    prefixed "c<k>/" (services and namespaces).
+    """
+    from synthetic_mesh import SyntheticMesh
+    topology = {"nodes": [], "edges": [], "namespaces": {}, "version": 1}
+    for c in range(clusters):
+        part = SyntheticMesh(num_services // clusters, seed=seed + c).topology()
+        topology["nodes"].extend(f"c{c}/{n}" for n in part["nodes"])
+        topology["edges"].extend(dict(e, source=f"c{c}/{e['source']}", target=f"c{c}/{e['target']}")
+                                 for e in part["edges"])
+        topology["namespaces"].update({f"c{c}/{n}": f"c{c}/{ns}" for n, ns in part["namespaces"].items()})
+    return topology
+
+def benchmark_sharding(num_services=10000, clusters=20, workers=(1, 2, 4), ticks=5, by="auto", seed=0):
+    """
+    Sharded vs single-process full-graph scoring on a multi-cluster
+    synthetic mesh: latency per worker count, halo replication, the largest
+    score difference and whether the merged top 10 matches.
+    """
+    from step5_graph_builder import build_edge_index
+    from step6_model import LogWhispererBrain
+
+    topology = multi_cluster_topology(num_services, clusters, seed)
+    num_services = len(topology["nodes"])
+    edge_index, _ = build_edge_index(topology["nodes"], topology["edges"])
+    x = torch.randn(num_services, FEATURE_DIM, generator=torch.Generator().manual_seed(seed))
+    graph = {"node_ids": topology["nodes"], "x": x, "edge_index": edge_index,
+             "namespaces": topology["namespaces"], "topology_version": 1}
+    model = LogWhispererBrain(in_channels=FEATURE_DIM, hidden_channels=HIDDEN_DIM, out_channels=1).eval()
+
+    with torch.inference_mode():
+        model(graph["x"], edge_index)
+        start = time.perf_counter()
+        for _ in range(ticks):
+            reference = torch.sigmoid(model(graph["x"], edge_index)).view(-1).numpy()
+        full_ms = (time.perf_counter() - start) / ticks * 1000
+    print(f"{num_services} services in {clusters} clusters, {edge_index.shape[1]} edges: full graph {full_ms:.1f} ms/tick "
+          f"({torch.get_num_threads()} threads)")
+
+    summary = {"services": num_services, "full_ms": full_ms, "sharded": {}}
+    for n in workers:
+        sharded = ShardedInference(model, num_workers=n, by=by)
+        try:
+            _, probabilities, _, _ = sharded.score(graph)  # Spawns workers, plans shards
+            start = time.perf_counter()
+            for _ in range(ticks):
+                _, probabilities, _, _ = sharded.score(graph)
+            ms = (time.perf_counter() - start) / ticks * 1000
+            top = sharded.top_k(graph, 10)
+        finally:
+            sharded.close()
+        diff = float(np.abs(probabilities - reference).max())
+        expected = np.argsort(-reference, kind="stable")[:10]
+        matches = [r["service"] for r in top] == [topology["nodes"][i] for i in expected]
+        summary["sharded"][n] = {"ms": ms, "max_diff": diff, "top_k_matches": matches,
+                                 "shards": len(sharded.shards), "replication": sharded.stats["replication"]}
+        print(f"{n} workers: {ms:.1f} ms/tick, {len(sharded.shards)} {sharded.stats['by']} shards "
+              f"(halo replication {sharded.stats['replication']:.2f}x), max diff {diff:.2e}, "
+              f"top-10 {'matches' if matches else 'differs'}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded LogWhisperer inference benchmark")
+    parser.add_argument("--services", type=int, default=10000)
+    parser.add_argument("--clusters", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--by", choices=["auto", "component", "namespace"], default="auto")
+    args = parser.parse_args()
+    benchmark_sharding(args.services, args.clusters, tuple(args.workers), args.ticks, args.by)
@@ -1,33 +1,147 @@
+import time
 import torch
 import numpy as np
+from feature_store import MODALITY_SLICES
+
+# Feature map for human-readable output
+# Index 0-767: Log BERT, 768-771: Metrics, 772-774: Traces
+EXPLANATIONS = {
+    "logs": "High Semantic Match: Detected anomalous Log Patterns (Logs).",
+    "metrics": "Numerical Anomaly: Significant spike in Service Metrics (CPU/Latency).",
+    "traces": "Path Anomaly: Unusual Request Trace sequence detected.",
+}
+TIME_BUDGET = 0.25  # Seconds per explain_batch call, to stay inside the incident-latency SLO
+TOP_FEATURES = 5
 
 def explain_prediction(node_index, feature_vector):
     """
-    Simulates finding 'Feature Importance' using gradients or simple saliency.
+    Model-free fallback: attributes the alert to the modality holding the
+    largest absolute feature value. Use explain_batch when the model is at hand.
     """
-    print(f"Generating Explanation for Node {node_index}...")
-    
-    # Feature map for human-readable output
-    # Index 0-767: Log BERT, 768-771: Metrics, 772-774: Traces
-    
-    # In a real model, we would use torch.autograd to find which feature 
-    # has the highest gradient. Here we mock it by finding the highest value.
     top_feature_index = np.argmax(np.abs(feature_vector))
-    
-    explanation = ""
-    if top_feature_index < 768:
-        explanation = "High Semantic Match: Detected anomalous Log Patterns (Logs)."
-    elif 768 <= top_feature_index < 772:
-        explanation = "Numerical Anomaly: Significant spike in Service Metrics (CPU/Latency)."
-    else:
-        explanation = "Path Anomaly: Unusual Request Trace sequence detected."
-        
-    return explanation
+
+    for modality, span in MODALITY_SLICES.items():
+        if span.start <= top_feature_index < span.stop:
+            return EXPLANATIONS[modality]
+    return EXPLANATIONS["traces"]
+
+def _input_gradients(model, x, edge_index, targets, inputs):
+    """
+    d(sum of target logits)/dx in a single backward pass. Flagged nodes share
+    the pass, so a node's row also carries (usually small) gradient from other
+    flagged nodes in its receptive field.
+    """
+    x = x.detach().clone().requires_grad_(True)
+    logits = model(x, edge_index, **inputs).view(-1)
+    (grad,) = torch.autograd.grad(logits[targets].sum(), x)
+    return grad
+
+def _attributions(model, x, edge_index, targets, method, steps, deadline, inputs):
+    if method == "saliency":
+        # Gradient x input
+        return _input_gradients(model, x, edge_index, targets, inputs) * x, False
+
+    if method != "integrated_gradients":
+        raise ValueError(f"Unknown attribution method: {method}")
+
+    # Integrated gradients against an all-zero baseline (the "no signal" input).
+    # Steps are cut short when the time budget runs out.
+    total = torch.zeros_like(x)
+    done = 0
+    for step in range(1, steps + 1):
+        total += _input_gradients(model, x * (step / steps), edge_index, targets, inputs)
+        done += 1
+        if time.perf_counter() > deadline:
+            break
+    return x * total / done, done < steps
+
+def _top_edges(model, x, edge_index, targets, node_ids, k, inputs):
+    """
+    Highest-attention incoming neighbor edges per target from the last GAT layer.
+    """
+    with torch.no_grad():
+        _, attention = model.forward_with_attention(x, edge_index, **inputs)
+    full_edge_index, alpha = attention[-1]
+    alpha = alpha.mean(dim=1)
+    src, dst = full_edge_index
+    neighbor = src != dst
+
+    top = {}
+    for target in targets.tolist():
+        mask = (dst == target) & neighbor
+        weights = alpha[mask]
+        if weights.numel() == 0:
+            top[target] = []
+            continue
+        best = torch.topk(weights, min(k, weights.numel()))
+        sources = src[mask][best.indices].tolist()
+        top[target] = [{"source": node_ids[s] if node_ids else s, "attention": float(w)}
+                       for s, w in zip(sources, best.values.tolist())]
+    return top
+
+def explain_batch(model, x, edge_index, node_indices, node_ids=None, method="saliency", steps=16,
+                  top_k_edges=3, time_budget=TIME_BUDGET, history=None):
+    """
+    Attributes the scores of all flagged nodes through the model at once.
+
+    method: "saliency" (gradient x input, one backward pass) or
+    "integrated_gradients" (up to `steps` backward passes, truncated by the
+    time budget). Returns one dict per flagged node with per-modality
+    contribution shares, the top input features, a human-readable
+    explanation and, if the budget allows, its highest-attention neighbors.
+
+    history: for the temporal model, the projected frames before x
+    (TemporalInference.history()), so the alert is explained with the
+    trend it was scored with; attributions cover the latest snapshot.
+    """
+    deadline = time.perf_counter() + time_budget
+    model.eval()
+    targets = torch.as_tensor(node_indices, dtype=torch.long)
+    inputs = {} if history is None else {"history": history}
+
+    with torch.enable_grad():
+        attributions, truncated = _attributions(model, x, edge_index, targets, method, steps, deadline, inputs)
+    rows = attributions[targets].abs()
+
+    # Share of total attribution mass per modality
+    mass = torch.stack([rows[:, span].sum(dim=1) for span in MODALITY_SLICES.values()], dim=1)
+    shares = (mass / mass.sum(dim=1, keepdim=True).clamp(min=1e-12)).numpy()
+    top_features = torch.topk(rows, min(TOP_FEATURES, rows.shape[1]), dim=1).indices.tolist()
+
+    edges = {}
+    if top_k_edges and time.perf_counter() < deadline:
+        edges = _top_edges(model, x, edge_index, targets, node_ids, top_k_edges, inputs)
+
+    modalities = list(MODALITY_SLICES)
+    results = []
+    for row, target in enumerate(targets.tolist()):
+        dominant = modalities[int(np.argmax(shares[row]))]
+        results.append({
+            "index": target,
+            "service": node_ids[target] if node_ids else target,
+            "modality_contributions": {m: float(shares[row, j]) for j, m in enumerate(modalities)},
+            "dominant_modality": dominant,
+            "explanation": EXPLANATIONS[dominant],
+            "top_features": top_features[row],
+            "top_edges": edges.get(target, []),
+            "truncated": truncated,
+        })
+    return results
 
 if __name__ == "__main__":
+    from step6_model import LogWhispererBrain
+
     # Mock feature vector with a spike in the Metric region (Index 769)
     mock_vector = np.zeros(775)
     mock_vector[769] = 10.0 # Huge spike in CPU
-    
+
     reason = explain_prediction("payment-service", mock_vector)
     print(f"AI Decision: {reason}")
+
+    model = LogWhispererBrain(in_channels=775, hidden_channels=16, out_channels=1)
+    x = torch.randn(4, 775)
+    x[1] = torch.from_numpy(mock_vector).float()
+    edge_index = torch.tensor([[0, 2, 3], [1, 1, 1]])
+    for result in explain_batch(model, x, edge_index, [1], ["auth", "payment-service", "cart", "db"],
+                                method="integrated_gradients"):
+        print(result)
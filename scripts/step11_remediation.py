@@ -1,41 +1,316 @@
 import os
+import re
+import time
+import shlex
+import argparse
+import threading
+import subprocess
+from telemetry import REMEDIATIONS
+
+# Configuration
+POLICY_PATH = os.environ.get("LOGWHISPERER_REMEDIATION_POLICY",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "infra",
+                                          "remediation-policy.yaml"))
+KUBECTL = os.environ.get("LOGWHISPERER_KUBECTL", "kubectl")  # Point at a shim to exercise the executor
+# "suggest": plan commands only; "dry-run": also batch and report them; "apply": run them
+REMEDIATION_MODE = os.environ.get("LOGWHISPERER_REMEDIATION", "suggest")
+DRY_RUN = REMEDIATION_MODE != "apply"
+KUBECTL_TIMEOUT = 30
+
+class TokenBucket:
+    """
+    `capacity` tokens, refilled continuously at capacity / refill_seconds
+    per second. Starts full.
+    """
+    def __init__(self, capacity, refill_seconds, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / float(refill_seconds)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def available(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens >= 1.0
+
+    def full(self):
+        self.available()
+        return self.tokens >= self.capacity
+
+    def take(self):
+        if not self.available():
+            return False
+        self.tokens -= 1.0
+        return True
+
+class CompiledAction:
+    """
+    An action template from the policy, split into argv once; fields are
+    filled per argument, so service names can never inject extra arguments.
+    """
+    def __init__(self, name, spec):
+        self.name = name
+        self.argv = shlex.split(spec["command"])
+        self.description = spec.get("description", name)
+        self.safety = spec.get("safety", "MANUAL-REVIEW")
+        self.batchable = bool(spec.get("batchable", False))
+        # The argument naming the deployment, which batching merges across actions
+        self.resource_index = next((i for i, arg in enumerate(self.argv) if "{deployment}" in arg), None)
+
+    def render(self, fields):
+        return [arg.format(**fields) for arg in self.argv]
+
+class PolicyMatcher:
+    """
+    The policy rules with their regexes compiled once, tried in order.
+    """
+    def __init__(self, rules, actions):
+        self.rules = []
+        for rule in rules:
+            match = rule.get("match") or {}
+            if rule["action"] not in actions:
+                raise ValueError(f"Rule {rule.get('name')} uses unknown action {rule['action']}")
+            self.rules.append((
+                re.compile(match["service"]) if "service" in match else None,
+                re.compile(match["explanation"]) if "explanation" in match else None,
+                rule,
+            ))
+
+    def match(self, service, explanation):
+        for service_re, explanation_re, rule in self.rules:
+            if service_re is not None and not service_re.search(service):
+                continue
+            if explanation_re is not None and not explanation_re.search(explanation or ""):
+                continue
+            return rule
+        return None
+
+def load_policy(path=POLICY_PATH):
+    import yaml
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
+
+class RemediationEngine:
+    """
+    Declarative remediation: maps flagged root causes to kubectl commands
+    using the YAML policy, with guard rails for large incidents.
+
+    plan() takes a batch of reports and returns one plan per report:
+        planned       a command to run (one per deployment)
+        coalesced     the deployment already has a command in this batch or
+                      within coalesce_window_seconds; no new command
+        rate_limited  the per-service or global token bucket is empty (for
+                      this report or a higher scoring one on the same
+                      deployment in this batch); left for manual review
+
+    History is pruned as it ages: issued commands older than the coalesce
+    window and per-service buckets that have refilled are dropped, so a
+    long-running pipeline only tracks recently remediated services.
+    """
+    def __init__(self, policy, clock=time.monotonic):
+        defaults = policy.get("defaults") or {}
+        self.actions = {name: CompiledAction(name, spec) for name, spec in policy["actions"].items()}
+        self.matcher = PolicyMatcher(policy["rules"], self.actions)
+        self.deployments = policy.get("deployments") or {}
+        self.window = float(defaults.get("coalesce_window_seconds", 300))
+        limits = defaults.get("rate_limits") or {}
+        self.service_limit = limits.get("per_service")
+        self.global_bucket = TokenBucket(clock=clock, **limits["global"]) if limits.get("global") else None
+        self.clock = clock
+        self.service_buckets = {}
+        self.issued = {}  # deployment -> (time, plan)
+        self.stats = {"planned": 0, "coalesced": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path=POLICY_PATH, **kwargs):
+        return cls(load_policy(path), **kwargs)
+
+    def suggest(self, service, explanation):
+        """
+        The policy's plan for one root cause, ignoring limits and history.
+        """
+        rule = self.matcher.match(service, explanation)
+        if rule is None:
+            raise ValueError(f"No remediation rule matches {service}; add a fallback rule")
+        action = self.actions[rule["action"]]
+        deployment = self.deployments.get(service, service)
+        argv = action.render(dict(rule.get("params") or {}, service=service, deployment=deployment))
+        return {
+            "service": service,
+            "deployment": deployment,
+            "rule": rule.get("name", rule["action"]),
+            "action": action.name,
+            "action_required": action.description,
+            "argv": argv,
+            "suggested_command": shlex.join(argv),
+            "safety_level": action.safety,
+            "status": "planned",
+        }
+
+    def _prune(self, now):
+        # A dropped bucket is recreated full, exactly what it had refilled to
+        self.issued = {d: entry for d, entry in self.issued.items() if now - entry[0] < self.window}
+        self.service_buckets = {s: bucket for s, bucket in self.service_buckets.items() if not bucket.full()}
+
+    def _allow(self, service):
+        bucket = self.service_buckets.get(service)
+        if bucket is None and self.service_limit:
+            bucket = self.service_buckets[service] = TokenBucket(clock=self.clock, **self.service_limit)
+        if (bucket is not None and not bucket.available()) or \
+                (self.global_bucket is not None and not self.global_bucket.available()):
+            return False
+        if bucket is not None:
+            bucket.take()
+        if self.global_bucket is not None:
+            self.global_bucket.take()
+        return True
+
+    def plan(self, reports):
+        """
+        Plans a batch of reports ({"service", "score", "explanation"}) and
+        returns their plans in the same order. Within a batch the highest
+        scoring report of each deployment decides its command.
+        """
+        plans = [self.suggest(r["service"], r.get("explanation", "")) for r in reports]
+        order = sorted(range(len(reports)), key=lambda i: -reports[i].get("score", 0.0))
+        with self._lock:
+            now = self.clock()
+            self._prune(now)
+            planned, limited = set(), set()  # Deployments planned / rate limited in this batch
+            for i in order:
+                plan = plans[i]
+                deployment = plan["deployment"]
+                issued = self.issued.get(deployment)
+                if deployment in limited:
+                    plan["status"] = "rate_limited"
+                elif deployment in planned or (issued is not None and now - issued[0] < self.window):
+                    plan.update(status="coalesced", suggested_command=issued[1]["suggested_command"],
+                                argv=issued[1]["argv"])
+                elif self._allow(plan["service"]):
+                    self.issued[deployment] = (now, plan)
+                    planned.add(deployment)
+                else:
+                    plan["status"] = "rate_limited"
+                    limited.add(deployment)
+                self.stats[plan["status"]] += 1
+                REMEDIATIONS.inc(status=plan["status"])
+        return plans
+
+class KubectlExecutor:
+    """
+    Runs planned remediations, batched: batchable actions whose commands
+    differ only in the deployment become one kubectl call naming all of
+    them. With dry_run (unless LOGWHISPERER_REMEDIATION=apply)
+    nothing is run and the batches are only reported. `kubectl` can point
+    at any executable, e.g. tests/fake_kubectl, which records its arguments.
+    """
+    def __init__(self, engine, kubectl=KUBECTL, dry_run=DRY_RUN, timeout=KUBECTL_TIMEOUT):
+        self.engine = engine
+        self.kubectl = kubectl
+        self.dry_run = dry_run
+        self.timeout = timeout
+        self.history = []
+
+    def batch(self, plans):
+        """
+        Groups the "planned" plans into [(argv, [services])].
+        """
+        batches = {}
+        for plan in plans:
+            if plan["status"] != "planned":
+                continue
+            action = self.engine.actions[plan["action"]]
+            argv = [self.kubectl] + plan["argv"][1:]
+            if action.batchable and action.resource_index is not None:
+                i = action.resource_index
+                key = (action.name, tuple(argv[:i]), tuple(argv[i + 1:]))
+                entry = batches.setdefault(key, (argv[:i], [], argv[i + 1:], []))
+                entry[1].append(argv[i])
+                entry[3].append(plan["service"])
+            else:
+                batches[(id(plan),)] = (argv, [], [], [plan["service"]])
+        return [(head + resources + tail, services) for head, resources, tail, services in batches.values()]
+
+    def execute(self, plans):
+        """
+        Runs (or, in dry-run mode, reports) the batched commands. Returns
+        one result per kubectl call.
+        """
+        results = []
+        for argv, services in self.batch(plans):
+            result = {"argv": argv, "services": services, "dry_run": self.dry_run}
+            if self.dry_run:
+                print(f"[dry-run] {shlex.join(argv)}")
+            else:
+                try:
+                    completed = subprocess.run(argv, capture_output=True, text=True, timeout=self.timeout)
+                    result.update(returncode=completed.returncode,
+                                  output=(completed.stdout + completed.stderr).strip())
+                except (OSError, subprocess.TimeoutExpired) as e:
+                    result.update(returncode=None, output=str(e))
+                print(f"{shlex.join(argv)} -> {result['returncode']}")
+            results.append(result)
+        self.history.extend(results)
+        return results
+
+_engine = None
+
+def get_engine(path=POLICY_PATH):
+    """
+    The process-wide RemediationEngine, compiled from the policy file on first use.
+    """
+    global _engine
+    if _engine is None:
+        _engine = RemediationEngine.from_file(path)
+    return _engine
+
+def get_executor(mode=REMEDIATION_MODE):
+    """
+    A KubectlExecutor for the engine per LOGWHISPERER_REMEDIATION, or None
+    when commands are only suggested.
+    """
+    if mode not in ("suggest", "dry-run", "apply"):
+        raise ValueError(f"Unknown remediation mode: {mode}")
+    if mode == "suggest":
+        return None
+    return KubectlExecutor(get_engine(), dry_run=mode != "apply")
 
 def suggest_remediation(service_id, root_cause_reason):
     """
     Industrial Remediation Engine:
-    Maps AI-detected root causes to actionable infrastructure commands.
+    Maps AI-detected root causes to actionable infrastructure commands,
+    as configured in the remediation policy. One report at a time, without
+    rate limits or coalescing; batches go through RemediationEngine.plan.
     """
     print(f"--- Remediation Engine: Analyzing {service_id} ---")
-    
-    action = ""
-    command = ""
-    
-    if "Log Patterns" in root_cause_reason:
-        action = "Potential Bug/Error Spike detected in logs."
-        command = f"kubectl rollout restart deployment/{service_id}"
-    elif "Metric" in root_cause_reason:
-        action = "Resource Exhaustion / Latency detected."
-        command = f"kubectl scale deployment/{service_id} --replicas=5"
-    elif "Trace" in root_cause_reason:
-        action = "Network Dependency / Circuit Breaker failure."
-        command = f"kubectl rollout undo deployment/{service_id}"
-    else:
-        action = "General instability."
-        command = f"kubectl get pods -l app={service_id}"
-
-    remediation_plan = {
-        "service": service_id,
-        "action_required": action,
-        "suggested_command": command,
-        "safety_level": "AUTO-REPAIR" if "restart" in command else "MANUAL-REVIEW"
-    }
-    
-    print(f"Recommended Action: {action}")
-    print(f"Run Command: {command}")
-    
+
+    remediation_plan = get_engine().suggest(service_id, root_cause_reason)
+
+    print(f"Recommended Action: {remediation_plan['action_required']}")
+    print(f"Run Command: {remediation_plan['suggested_command']}")
+
     return remediation_plan
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LogWhisperer remediation policy")
+    parser.add_argument("--policy", default=POLICY_PATH)
+    parser.add_argument("--kubectl", default=KUBECTL, help="kubectl binary, or a shim for testing")
+    parser.add_argument("--apply", action="store_true", help="Run the commands instead of a dry run")
+    parser.add_argument("--services", type=int, default=30, help="Root causes in the simulated incident")
+    args = parser.parse_args()
+
     # Test
-    plan = suggest_remediation("auth-service", "Numerical Anomaly: Significant spike in Service Metrics (CPU/Latency).")
+    engine = RemediationEngine.from_file(args.policy)
+    plan = engine.suggest("auth-service", "Numerical Anomaly: Significant spike in Service Metrics (CPU/Latency).")
     print(plan)
+
+    # A large incident: many root causes, several per deployment, all at once
+    reasons = ["Log Patterns shifted", "Metric spike", "Trace errors", "Unknown"]
+    reports = [{"service": f"svc-{i % (args.services // 3 or 1)}", "score": 1.0 - i / (2 * args.services),
+                "explanation": reasons[i % len(reasons)]} for i in range(args.services)]
+    plans = engine.plan(reports)
+    results = KubectlExecutor(engine, kubectl=args.kubectl, dry_run=not args.apply).execute(plans)
+    print(f"{len(reports)} root causes -> {engine.stats} -> {len(results)} kubectl calls")
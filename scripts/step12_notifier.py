@@ -1,38 +1,108 @@
 import json
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def send_alert(rca_report, webhook_url=None):
+_session = None
+
+def get_session(pool_size=8, retries=3):
+    """
+    Shared HTTP session for webhooks: pooled keep-alive connections and
+    retries with backoff on throttling/5xx responses.
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset({"POST"}))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+def format_similar_incidents(incidents, max_causes=3):
+    lines = []
+    for incident in incidents:
+        root_causes = sorted(incident['root_causes'], key=lambda c: c['score'], reverse=True)
+        causes = ", ".join(
+            f"{c['service']} (`{c['remediation']['suggested_command']}`)" if c.get('remediation') else c['service']
+            for c in root_causes[:max_causes])
+        if len(root_causes) > max_causes:
+            causes += f" +{len(root_causes) - max_causes} more"
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(incident['timestamp']))
+        lines.append(f"#{incident['id']} {when}, {incident['similarity']:.0%} similar: {causes or '-'}")
+    return "\n".join(lines)
+
+def format_remediation(remediation):
+    text = f"`{remediation['suggested_command']}`"
+    status = remediation.get('status', 'planned')
+    if status == 'coalesced':
+        text += " (already issued for this deployment)"
+    elif status == 'rate_limited':
+        text += " (rate limited, needs manual review)"
+    return text
+
+def build_attachment(rca_report):
+    fields = [
+        {"title": "Root Cause", "value": rca_report['service'], "short": True},
+        {"title": "Confidence", "value": f"{rca_report['score']:.2%}", "short": True},
+        {"title": "Explanation", "value": rca_report['explanation'], "short": False},
+        {"title": "Remediation", "value": format_remediation(rca_report['remediation']), "short": False}
+    ]
+    if rca_report.get('similar_incidents'):
+        fields.append({"title": "Similar Past Incidents",
+                       "value": format_similar_incidents(rca_report['similar_incidents']), "short": False})
+    return {
+        "color": "#ff0000",
+        "fields": fields,
+        "footer": "LogWhisperer RCA Bot",
+        "ts": int(time.time())
+    }
+
+def post_payload(payload, webhook_url, session=None, timeout=5):
+    response = (session or get_session()).post(webhook_url, json=payload, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+def send_alert(rca_report, webhook_url=None, session=None):
     """
     Industrial Notification Hub:
     Sends structured RCA reports to Slack, Microsoft Teams, or custom webhooks.
     """
     print("--- Notification Hub: Dispatching Alerts ---")
-    
+
     # Format the payload for Slack/JSON webhook
     payload = {
         "text": "🚨 *LogWhisperer Incident Report*",
-        "attachments": [
-            {
-                "color": "#ff0000",
-                "fields": [
-                    {"title": "Root Cause", "value": rca_report['service'], "short": True},
-                    {"title": "Confidence", "value": f"{rca_report['score']:.2%}", "short": True},
-                    {"title": "Explanation", "value": rca_report['explanation'], "short": False},
-                    {"title": "Remediation", "value": f"`{rca_report['remediation']['suggested_command']}`", "short": False}
-                ],
-                "footer": "LogWhisperer RCA Bot",
-                "ts": 1625000000
-            }
-        ]
+        "attachments": [build_attachment(rca_report)]
     }
 
     if webhook_url:
         print(f"Post data to: {webhook_url}")
-        # In a real scenario: requests.post(webhook_url, json=payload)
+        post_payload(payload, webhook_url, session)
     else:
         print("MOCK ALERT: (Specify SLACK_WEBHOOK to enable live alerts)")
         print(json.dumps(payload, indent=2))
-        
+
+    return payload
+
+def send_batch_alert(rca_reports, webhook_url=None, session=None):
+    """
+    Sends several root causes from the same incident as one notification.
+    """
+    payload = {
+        "text": f"🚨 *LogWhisperer Incident Report* ({len(rca_reports)} root cause candidates)",
+        "attachments": [build_attachment(r) for r in rca_reports]
+    }
+
+    if webhook_url:
+        post_payload(payload, webhook_url, session)
+    else:
+        print("MOCK ALERT: (Specify SLACK_WEBHOOK to enable live alerts)")
+        print(json.dumps(payload, indent=2))
+
     return payload
 
 if __name__ == "__main__":
@@ -1,45 +1,200 @@
 import requests
 import json
-import pandas as pd
+import time
+import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Configuration
 PROMETHEUS_URL = "http://localhost:9090"  # Update to your Prometheus service URL
-QUERY = 'istio_requests_total{reporter="destination"}'
+RATE_WINDOW = "1m"
+QUERY = (
+    'sum by (source_workload, source_workload_namespace, destination_workload, destination_workload_namespace) '
+    '(rate(istio_requests_total{{reporter="destination"}}[{window}]))'
+)
+HISTORY_SIZE = 60        # Edge-weight samples kept per (source, target)
+CHANGE_THRESHOLD = 0.1   # Relative RPS change that marks an edge as "changed"
+POLL_INTERVAL = 15       # Seconds, matches a typical Prometheus scrape interval
 
-def fetch_topology():
-    print(f"Fetching topology from {PROMETHEUS_URL}...")
-    try:
-        response = requests.get(f"{PROMETHEUS_URL}/api/v1/query", params={'query': QUERY})
-        results = response.json()['data']['result']
-        
-        edges = []
-        nodes = set()
-        
+class EdgeHistory:
+    """
+    Fixed-size ring buffer of (timestamp, requests_per_second) samples for one edge.
+    """
+    def __init__(self, size=HISTORY_SIZE):
+        self.timestamps = np.zeros(size, dtype=np.float64)
+        self.values = np.zeros(size, dtype=np.float32)
+        self.head = 0
+        self.count = 0
+
+    def append(self, timestamp, value):
+        self.timestamps[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % len(self.values)
+        self.count = min(self.count + 1, len(self.values))
+
+    def latest(self):
+        return float(self.values[self.head - 1]) if self.count else 0.0
+
+    def series(self):
+        """
+        Returns (timestamps, values) oldest first.
+        """
+        if self.count < len(self.values):
+            return self.timestamps[:self.count].copy(), self.values[:self.count].copy()
+        order = np.roll(np.arange(len(self.values)), -self.head)
+        return self.timestamps[order], self.values[order]
+
+class TopologyService:
+    """
+    Polls Istio request rates from Prometheus over a pooled HTTP session, diffs
+    every snapshot against the previous graph and keeps a short edge-weight
+    time series per (source, target).
+    """
+    def __init__(self, prometheus_url=PROMETHEUS_URL, rate_window=RATE_WINDOW,
+                 history_size=HISTORY_SIZE, change_threshold=CHANGE_THRESHOLD, session=None):
+        self.prometheus_url = prometheus_url.rstrip("/")
+        self.query = QUERY.format(window=rate_window)
+        self.history_size = history_size
+        self.change_threshold = change_threshold
+
+        if session is None:
+            session = requests.Session()
+            retries = Retry(total=3, backoff_factor=0.2, status_forcelist=(502, 503, 504))
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retries)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+        self.history = {}     # (source, target) -> EdgeHistory
+        self.namespaces = {}  # workload -> namespace
+        self.version = 0      # Bumped whenever the edge set itself changes
+
+    def _get(self, path, params):
+        response = self.session.get(f"{self.prometheus_url}{path}", params=params, timeout=10)
+        response.raise_for_status()
+        return response.json()["data"]["result"]
+
+    def _edge_key(self, metric):
+        source = metric.get('source_workload', 'unknown')
+        dest = metric.get('destination_workload', 'unknown')
+        if 'source_workload_namespace' in metric:
+            self.namespaces[source] = metric['source_workload_namespace']
+        if 'destination_workload_namespace' in metric:
+            self.namespaces[dest] = metric['destination_workload_namespace']
+        return source, dest
+
+    def snapshot(self):
+        """
+        Current {(source, target): requests_per_second} from an instant rate() query.
+        """
+        snapshot = {}
+        for result in self._get("/api/v1/query", {'query': self.query}):
+            snapshot[self._edge_key(result['metric'])] = float(result['value'][1])
+        return snapshot
+
+    def _apply(self, snapshot, timestamp):
+        delta = {"added": [], "removed": [], "changed": []}
+
+        for key in [k for k in self.history if k not in snapshot]:
+            del self.history[key]
+            delta["removed"].append({"source": key[0], "target": key[1]})
+
+        for key, rps in snapshot.items():
+            history = self.history.get(key)
+            edge = {"source": key[0], "target": key[1], "requests_per_second": rps}
+            if history is None:
+                history = self.history[key] = EdgeHistory(self.history_size)
+                delta["added"].append(edge)
+            else:
+                previous = history.latest()
+                if abs(rps - previous) > self.change_threshold * max(abs(previous), 1e-9):
+                    delta["changed"].append(edge)
+            history.append(timestamp, rps)
+
+        if delta["added"] or delta["removed"]:
+            self.version += 1
+        delta["version"] = self.version
+        return delta
+
+    def poll(self):
+        """
+        Takes one snapshot and returns the delta against the previous graph:
+        {"added": [...], "removed": [...], "changed": [...], "version": n}.
+        """
+        return self._apply(self.snapshot(), time.time())
+
+    def backfill(self, start, end, step="15s"):
+        """
+        Seeds the edge histories from a range query between start and end (epoch seconds).
+        """
+        results = self._get("/api/v1/query_range",
+                            {'query': self.query, 'start': start, 'end': end, 'step': step})
+        samples = {}
         for result in results:
-            metric = result['metric']
-            source = metric.get('source_workload', 'unknown')
-            dest = metric.get('destination_workload', 'unknown')
-            rps = result['value'][1]
-            
+            key = self._edge_key(result['metric'])
+            for ts, value in result['values']:
+                samples.setdefault(float(ts), {})[key] = float(value)
+        delta = None
+        for ts in sorted(samples):
+            delta = self._apply(samples[ts], ts)
+        return delta
+
+    def topology(self):
+        nodes = set()
+        edges = []
+        for (source, dest), history in self.history.items():
             nodes.add(source)
             nodes.add(dest)
             edges.append({
                 "source": source,
                 "target": dest,
-                "requests_per_second": rps
+                "requests_per_second": history.latest()
             })
-            
-        topology = {
-            "nodes": list(nodes),
-            "edges": edges
+        return {
+            "nodes": sorted(nodes),
+            "edges": edges,
+            "namespaces": {n: self.namespaces[n] for n in nodes if n in self.namespaces},
+            "version": self.version
         }
-        
-        with open("topology_graph.json", "w") as f:
-            json.dump(topology, f, indent=4)
-            
+
+    def edge_series(self, source, target):
+        return self.history[(source, target)].series()
+
+    def save(self, path="topology_graph.json"):
+        with open(path, "w") as f:
+            json.dump(self.topology(), f)
+
+    def run(self, interval=POLL_INTERVAL, iterations=None):
+        """
+        Polls forever (or for a fixed number of iterations), writing the graph
+        after each snapshot. Deltas are only kept in memory: in-process
+        consumers (the orchestrator) take them from poll().
+        """
+        done = 0
+        while iterations is None or done < iterations:
+            started = time.time()
+            try:
+                delta = self.poll()
+                self.save()
+                print(f"Topology v{delta['version']}: +{len(delta['added'])} "
+                      f"-{len(delta['removed'])} ~{len(delta['changed'])} edges")
+            except Exception as e:
+                print(f"Error connecting to Prometheus: {e}")
+            done += 1
+            time.sleep(max(0.0, interval - (time.time() - started)))
+
+def fetch_topology(service=None):
+    service = service or TopologyService()
+    print(f"Fetching topology from {service.prometheus_url}...")
+    try:
+        delta = service.poll()
+        service.save()
+        topology = service.topology()
+
         print("Success! Topology saved to topology_graph.json")
-        print(f"Discovered {len(nodes)} nodes and {len(edges)} edges.")
-        
+        print(f"Discovered {len(topology['nodes'])} nodes and {len(topology['edges'])} edges.")
+        return topology
+
     except Exception as e:
         print(f"Error connecting to Prometheus: {e}")
 
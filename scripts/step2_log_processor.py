@@ -1,50 +1,386 @@
-import torch
-from transformers import AutoTokenizer, AutoModel
-import re
 import json
+import os
+import time
+import random
+import hashlib
+import math
+import argparse
+import numpy as np
+from collections import OrderedDict, Counter
+from template_miner import TemplateMiner
+from loki_ingest import iter_loki_file, iter_entries
+from feature_store import FeatureStore
+from lazy_loader import lazy_import, timed, timed_import, report_startup
+from telemetry import stage_timer, timed_stage, LOG_LINES, TEMPLATES_EMBEDDED, CACHE_LOOKUPS
+
+torch = lazy_import("torch")  # Only the BERT paths need torch
 
 # Configuration
 MODEL_NAME = "distilbert-base-uncased" # Using DistilBERT as a representative base for LogBERT
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModel.from_pretrained(MODEL_NAME)
+EMBEDDING_DIM = 768
+CACHE_SIZE = 50000  # Max number of distinct templates kept in memory
+CACHE_PATH = "log_embedding_cache.npz"
+MINER_STATE_PATH = "template_miner_state.json"
+BATCH_SIZE = 64
+WINDOW_SECONDS = 60
+QUANTIZED_ENCODER_PATH = "log_encoder_int8.pt"  # Written by quantize_models.py
+QUANTIZED = os.environ.get("LOGWHISPERER_QUANTIZED", "0") == "1"
+
+def quantize_encoder(model):
+    """
+    Dynamic int8 quantization of the encoder's Linear layers (attention
+    projections and feed-forward blocks), which hold nearly all of its compute.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_encoder(quantized=QUANTIZED, path=QUANTIZED_ENCODER_PATH):
+    """
+    Loads the tokenizer and DistilBERT. With quantized=True the int8 variant
+    is used: exported weights from path if present, otherwise the fp32
+    weights quantized on load.
+    """
+    transformers = timed_import("transformers")
+    with timed("load log encoder"):
+        tokenizer = transformers.AutoTokenizer.from_pretrained(MODEL_NAME)
+        model = transformers.AutoModel.from_pretrained(MODEL_NAME)
+        model.eval()
+        if quantized:
+            model = quantize_encoder(model)
+            if path and os.path.exists(path):
+                model.load_state_dict(torch.load(path, map_location="cpu", weights_only=False))
+    return tokenizer, model
+
+_encoder = None
+
+def get_encoder():
+    """
+    Returns the process-wide (tokenizer, model) pair, loading it on first
+    use so steps that never embed a template skip the BERT cold start.
+    """
+    global _encoder
+    if _encoder is None:
+        _encoder = load_encoder()
+    return _encoder
+
+def warmup_encoder():
+    """
+    Loads the encoder and runs one embedding so the first real batch does
+    not pay for model load or first-call allocation. For server startup.
+    """
+    with timed("warmup log encoder"):
+        get_log_embeddings(["warmup"])
+
+class EmbeddingCache:
+    """
+    Size-bounded LRU cache of template embeddings, keyed by template hash.
+    Can be persisted to disk so warm restarts skip BERT entirely.
+    """
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
 
-def extract_template(log_message):
+    @staticmethod
+    def key(template):
+        return hashlib.blake2b(template.encode("utf-8"), digest_size=8).hexdigest()
+
+    def get(self, template):
+        k = self.key(template)
+        vector = self._entries.get(k)
+        if vector is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(k)
+        self.hits += 1
+        return vector
+
+    def put(self, template, vector):
+        k = self.key(template)
+        self._entries[k] = vector
+        self._entries.move_to_end(k)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def save(self, path=CACHE_PATH):
+        keys = np.array(list(self._entries.keys()), dtype="U16")
+        if self._entries:
+            vectors = np.stack(list(self._entries.values())).astype(np.float32)
+        else:
+            vectors = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        np.savez(path, keys=keys, vectors=vectors)
+
+    def load(self, path=CACHE_PATH):
+        if not os.path.exists(path):
+            return self
+        data = np.load(path)
+        # Oldest entries first so LRU order survives the round trip
+        for k, vector in zip(data["keys"], data["vectors"]):
+            self._entries[str(k)] = vector
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return self
+
+embedding_cache = EmbeddingCache()
+template_miner = TemplateMiner()
+
+def extract_template(log_message, miner=None):
     """
-    Mock template extractor. 
-    In industry, tools like Drain or MoLFI are used.
+    Drain-style template extraction: variable parts are masked and the line
+    is merged into a stable, incrementally learned template.
     """
-    # Replace common variable patterns with placeholders
-    log_message = re.sub(r'\d+', '<ID>', log_message)
-    log_message = re.sub(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', '<IP>', log_message)
-    return log_message
+    miner = template_miner if miner is None else miner
+    _, template = miner.add(log_message)
+    return template
+
+def get_log_embeddings(templates, batch_size=BATCH_SIZE, encoder=None):
+    """
+    Converts a list of log templates into a [len(templates), 768] matrix,
+    running BERT over padded mini-batches. encoder overrides the lazily
+    loaded (tokenizer, model) pair.
+    """
+    encoder_tokenizer, encoder_model = encoder or get_encoder()
+    out = np.zeros((len(templates), EMBEDDING_DIM), dtype=np.float32)
+    for start in range(0, len(templates), batch_size):
+        batch = templates[start:start + batch_size]
+        inputs = encoder_tokenizer(batch, return_tensors="pt", padding=True, truncation=True)
+        with torch.no_grad():
+            outputs = encoder_model(**inputs)
+
+        # Mean Pooling over real tokens only (padding is masked out)
+        mask = inputs["attention_mask"].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+        summed = (outputs.last_hidden_state * mask).sum(dim=1)
+        embeddings = summed / mask.sum(dim=1).clamp(min=1)
+        out[start:start + len(batch)] = embeddings.numpy()
+    return out
 
 def get_log_embedding(template):
     """
     Converts a log template into a 768-dimensional vector.
     """
-    inputs = tokenizer(template, return_tensors="pt", padding=True, truncation=True)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    
-    # Use Mean Pooling to get a single vector for the sentence
-    embeddings = outputs.last_hidden_state.mean(dim=1)
-    return embeddings.squeeze().numpy()
+    return get_log_embeddings([template])[0]
+
+def embed_templates(templates, cache=None, batch_size=BATCH_SIZE):
+    """
+    Returns {template: vector} for the given templates, serving repeats from
+    the cache and embedding only the misses in batches.
+    """
+    cache = embedding_cache if cache is None else cache
+    vectors = {}
+    misses = []
+    hits_before = cache.hits
+    for template in templates:
+        if template in vectors:
+            # Repeats within the batch are served without BERT as well
+            cache.hits += 1
+            continue
+        vector = cache.get(template)
+        if vector is None:
+            misses.append(template)
+            vectors[template] = None
+        else:
+            vectors[template] = vector
+
+    CACHE_LOOKUPS.inc(cache.hits - hits_before, result="hit")
+    CACHE_LOOKUPS.inc(len(misses), result="miss")
+    if misses:
+        with stage_timer("log_embedding"):
+            embeddings = get_log_embeddings(misses, batch_size)
+        TEMPLATES_EMBEDDED.inc(len(misses))
+        for template, vector in zip(misses, embeddings):
+            cache.put(template, vector)
+            vectors[template] = vector
+    return vectors
 
-def process_logs(sample_logs):
+@timed_stage("log_processing")
+def process_logs(sample_logs, cache=None):
     print(f"Processing {len(sample_logs)} logs...")
+    LOG_LINES.inc(len(sample_logs))
     features = {}
     
-    for log in sample_logs:
-        template = extract_template(log)
-        embedding = get_log_embedding(template)
-        
+    templates = [extract_template(log) for log in sample_logs]
+    vectors = embed_templates(templates, cache)
+    
+    for log, template in zip(sample_logs, templates):
         # In a real system, we aggregate these per service_name
-        features[log] = embedding.tolist()
+        features[log] = vectors[template].tolist()
         
     print("Success! Logs embedded into vectors.")
     return features
 
+def _pool_windows(windows, cache):
+    """
+    Embeds every template used by the closing windows in one batched call and
+    returns the count-weighted mean vector for each window.
+    """
+    templates = set()
+    for counts in windows.values():
+        templates.update(counts)
+    vectors = embed_templates(list(templates), cache)
+
+    for (window_start, service), counts in sorted(windows.items()):
+        pooled = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        total = 0
+        for template, n in counts.items():
+            pooled += n * vectors[template]
+            total += n
+        yield {"service": service, "window_start": window_start,
+               "vector": pooled / max(total, 1), "lines": total}
+
+def stream_service_windows(entries, window_seconds=WINDOW_SECONDS, lateness_seconds=None,
+                           miner=None, cache=None):
+    """
+    Groups (timestamp, service, line) entries into per-service tumbling windows
+    and yields one pooled 768-d vector per (service, window).
+
+    Open windows only hold template counts, so memory is bounded by
+    services x open windows x distinct templates rather than by log volume.
+    A window closes once the newest timestamp seen is lateness_seconds past
+    its end; entries arriving after that are dropped.
+    """
+    lateness = window_seconds if lateness_seconds is None else lateness_seconds
+    open_windows = {}
+    watermark = -math.inf
+    current_window = None
+    dropped = 0
+    lines = 0
+
+    for ts, service, line in entries:
+        lines += 1
+        window_start = math.floor(ts / window_seconds) * window_seconds
+        if window_start + window_seconds + lateness <= watermark:
+            dropped += 1
+            continue
+
+        template = extract_template(line, miner)
+        key = (window_start, service)
+        counts = open_windows.get(key)
+        if counts is None:
+            counts = open_windows[key] = Counter()
+        counts[template] += 1
+
+        if ts > watermark:
+            watermark = ts
+            # Only look for closable windows when the watermark enters a new window
+            if window_start != current_window:
+                current_window = window_start
+                closing = {k: v for k, v in open_windows.items()
+                           if k[0] + window_seconds + lateness <= watermark}
+                for k in closing:
+                    del open_windows[k]
+                if closing:
+                    yield from _pool_windows(closing, cache)
+
+    if open_windows:
+        yield from _pool_windows(open_windows, cache)
+    LOG_LINES.inc(lines - dropped)
+    if dropped:
+        print(f"Dropped {dropped} late log lines.")
+
+def latest_service_vectors(entries, window_seconds=WINDOW_SECONDS):
+    """
+    Featurizes (timestamp, service, line) entries and returns the most recent
+    pooled vector per service as {service: np.ndarray}.
+    """
+    latest = {}
+    for window in stream_service_windows(entries, window_seconds):
+        latest[window["service"]] = window["vector"]
+    return latest
+
+def process_loki_dump(path, window_seconds=WINDOW_SECONDS):
+    """
+    Featurizes a local Loki query_range dump and returns the most recent
+    pooled vector per service.
+    """
+    latest = latest_service_vectors(iter_entries(iter_loki_file(path)), window_seconds)
+    return {service: vector.tolist() for service, vector in latest.items()}
+
+def synthetic_log_corpus(num_lines, num_templates=300, seed=0):
+    """
+    Generates a log corpus where num_lines are drawn (Zipf-like) from
+    num_templates distinct message shapes with random variable parts.
+    """
+    rng = random.Random(seed)
+    verbs = ["Connection refused to", "Read timed out from", "User", "Request",
+             "Cache miss for key", "Retrying call to", "Slow query on", "Pod"]
+    nouns = ["database", "payment", "auth", "cart", "inventory", "gateway", "shard", "queue"]
+    shapes = [f"{rng.choice(verbs)} {rng.choice(nouns)}-{i} after {{}} ms from {{}}"
+              for i in range(num_templates)]
+    weights = [1.0 / (rank + 1) for rank in range(num_templates)]
+
+    corpus = []
+    for shape in rng.choices(shapes, weights=weights, k=num_lines):
+        ip = ".".join(str(rng.randint(1, 254)) for _ in range(4))
+        corpus.append(shape.format(rng.randint(1, 5000), ip))
+    return corpus
+
+def benchmark_log_processing(num_lines=100000, num_templates=300, batch_size=BATCH_SIZE):
+    """
+    Reports featurization throughput (lines/sec) and cache hit rate on a
+    synthetic corpus.
+    """
+    corpus = synthetic_log_corpus(num_lines, num_templates)
+    cache = EmbeddingCache()
+    miner = TemplateMiner()
+
+    start = time.perf_counter()
+    templates = [extract_template(log, miner) for log in corpus]
+    embed_templates(templates, cache, batch_size)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "lines": num_lines,
+        "distinct_templates": len(miner),
+        "seconds": elapsed,
+        "lines_per_sec": num_lines / elapsed if elapsed else float("inf"),
+        "cache_hit_rate": cache.hit_rate(),
+    }
+    print(f"Benchmark: {result['lines_per_sec']:.0f} lines/sec, "
+          f"hit rate {result['cache_hit_rate']:.2%} over {num_lines} lines")
+    return result
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LogWhisperer log processor")
+    parser.add_argument("--benchmark", action="store_true", help="Run the embedding cache benchmark")
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--loki-dump", help="Featurize a Loki query_range JSON/JSONL dump per service")
+    parser.add_argument("--templates-only", action="store_true",
+                        help="Mine and print templates without loading BERT")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_log_processing(num_lines=args.lines)
+        raise SystemExit(0)
+
+    embedding_cache.load(CACHE_PATH)
+    template_miner = TemplateMiner.load(MINER_STATE_PATH)
+
+    if args.templates_only:
+        entries = iter_entries(iter_loki_file(args.loki_dump)) if args.loki_dump else []
+        lines = [line for _, _, line in entries] or synthetic_log_corpus(1000, 20)
+        counts = Counter(extract_template(line) for line in lines)
+        for template, count in counts.most_common(20):
+            print(f"{count:6d}  {template}")
+        report_startup("first output")
+        template_miner.save(MINER_STATE_PATH)
+        raise SystemExit(0)
+
+    if args.loki_dump:
+        service_features = process_loki_dump(args.loki_dump)
+        embedding_cache.save(CACHE_PATH)
+        template_miner.save(MINER_STATE_PATH)
+        print(f"Success! Pooled log vectors for {len(service_features)} services.")
+        services = list(service_features)
+        FeatureStore().write("logs", services, np.array([service_features[s] for s in services]))
+        raise SystemExit(0)
+
     test_logs = [
         "Connection refused to 192.168.1.10",
         "NullPointerException at com.app.Service.execute",
@@ -53,6 +389,9 @@ if __name__ == "__main__":
     ]
     
     results = process_logs(test_logs)
+    report_startup("first output")
+    embedding_cache.save(CACHE_PATH)
+    template_miner.save(MINER_STATE_PATH)
     
     # Show first few dims of first log
     first_log = test_logs[0]
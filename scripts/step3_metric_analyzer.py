@@ -1,47 +1,230 @@
-import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-import json
+import time
+import argparse
+from feature_store import FeatureStore
+from lazy_loader import lazy_import, report_startup
+from telemetry import timed_stage
 
-def normalize_metrics(raw_data):
+pd = lazy_import("pandas")  # Only the replay/legacy paths build DataFrames
+
+NUMERIC_COLS = ['cpu_usage', 'memory_usage', 'latency_ms', 'error_rate']
+
+class StreamingNormalizer:
+    """
+    Per-service rolling baseline for metric z-scores.
+
+    Running mean/variance live in NumPy arrays indexed by service ID and are
+    updated in place per scrape (Welford for an all-history baseline, EWMA for
+    a decaying one), so each update costs O(services) regardless of history.
+    Every value is scored against the baseline *before* it is folded in, so no
+    future data leaks into the normalization.
+    """
+    def __init__(self, num_features=len(NUMERIC_COLS), mode="welford", alpha=0.05,
+                 min_std=1e-6, rel_std_floor=0.05, capacity=1024):
+        if mode not in ("welford", "ewma"):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.num_features = num_features
+        self.mode = mode
+        self.alpha = alpha
+        self.min_std = min_std
+        self.rel_std_floor = rel_std_floor  # Flat series get a std floor relative to their level
+        self.index = {}
+        self.count = np.zeros((capacity, num_features), dtype=np.int64)
+        self.mean = np.zeros((capacity, num_features), dtype=np.float64)
+        self.m2 = np.zeros((capacity, num_features), dtype=np.float64)    # Welford M2 or EWMA variance
+        self.last = np.zeros((capacity, num_features), dtype=np.float64)  # Last value seen, for forward-fill
+
+    def _grow(self, needed):
+        capacity = len(self.count)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("count", "mean", "m2", "last"):
+            old = getattr(self, name)
+            new = np.zeros((capacity, self.num_features), dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def service_ids(self, services):
+        """
+        Maps service names to stable row IDs, registering new services on first sight.
+        """
+        ids = np.empty(len(services), dtype=np.int64)
+        for i, service in enumerate(services):
+            sid = self.index.get(service)
+            if sid is None:
+                sid = self.index[service] = len(self.index)
+            ids[i] = sid
+        self._grow(len(self.index))
+        return ids
+
+    def std(self, ids):
+        count = self.count[ids]
+        if self.mode == "welford":
+            var = self.m2[ids] / np.maximum(count - 1, 1)
+        else:
+            var = self.m2[ids]
+        floor = np.maximum(self.rel_std_floor * np.abs(self.mean[ids]), self.min_std)
+        return np.maximum(np.sqrt(var), floor)
+
+    def update(self, ids, values):
+        """
+        Scores one scrape and folds it into the baseline.
+        ids: [k] service IDs (each at most once), values: [k, F] with NaN for
+        missing readings. Missing values are forward-filled from the same
+        service for scoring but do not move the baseline.
+        Returns the [k, F] z-scores.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        observed = ~np.isnan(values)
+        filled = np.where(observed, values, self.last[ids])
+
+        # 1. Score against the baseline as it was before this scrape
+        count = self.count[ids]
+        mean = self.mean[ids]
+        z = np.where(count >= 2, (filled - mean) / self.std(ids), 0.0)
+
+        # 2. Fold observed values into the baseline
+        delta = np.where(observed, filled - mean, 0.0)
+        new_count = count + observed
+        if self.mode == "welford":
+            new_mean = mean + delta / np.maximum(new_count, 1)
+            self.m2[ids] += delta * np.where(observed, filled - new_mean, 0.0)
+        else:
+            first = observed & (count == 0)
+            new_mean = np.where(first, filled, mean + self.alpha * delta)
+            self.m2[ids] = np.where(observed & ~first,
+                                    (1 - self.alpha) * (self.m2[ids] + self.alpha * delta ** 2),
+                                    self.m2[ids])
+        self.mean[ids] = new_mean
+        self.count[ids] = new_count
+        self.last[ids] = filled
+        return z
+
+def normalize_records(raw_data, normalizer=None):
+    """
+    NumPy-only core of normalize_metrics(), for callers that do not need a
+    DataFrame (and the pandas import). Returns (timestamps, services,
+    scaled [rows, len(NUMERIC_COLS)]) in time order.
+    """
+    normalizer = normalizer or StreamingNormalizer()
+    records = sorted(raw_data, key=lambda r: r['timestamp'])
+    timestamps = np.array([r['timestamp'] for r in records])
+    services = [r['service'] for r in records]
+    values = np.array([[r.get(col) for col in NUMERIC_COLS] for r in records], dtype=np.float64).reshape(-1, len(NUMERIC_COLS))
+
+    # 1. Map services to baseline rows once
+    ids = normalizer.service_ids(services)
+
+    # 2. Replay scrapes in time order; missing values are forward-filled per service
+    scaled = np.empty_like(values)
+    boundaries = np.flatnonzero(np.diff(timestamps)) + 1
+    for rows in np.split(np.arange(len(records)), boundaries):
+        scaled[rows] = normalizer.update(ids[rows], values[rows])
+    return timestamps, services, scaled
+
+@timed_stage("metric_normalization")
+def normalize_metrics(raw_data, normalizer=None):
     """
     Transforms raw Prometheus metrics into normalized feature vectors.
+    Each row is z-scored against its own service's baseline built from
+    earlier timestamps only.
     """
     print("Normalizing metrics...")
-    
-    # Convert to DataFrame
+    timestamps, services, scaled = normalize_records(raw_data, normalizer)
+    df = pd.DataFrame(scaled, columns=NUMERIC_COLS)
+    df.insert(0, 'service', services)
+    df.insert(0, 'timestamp', timestamps)
+
+    print("Success! Metrics scaled against per-service rolling baselines.")
+    return df
+
+def normalize_metrics_global(raw_data):
+    """
+    Previous approach: a single StandardScaler over all services and timestamps.
+    Kept as the reference path for benchmarking.
+    """
+    from sklearn.preprocessing import StandardScaler
+
     df = pd.DataFrame(raw_data)
-    
-    # 1. Handling Missing Values (Imputation)
-    # If a service stops reporting, we forward-fill the last known state
-    df = df.fillna(method='ffill').fillna(0)
-    
-    # 2. Extract numeric columns for scaling
-    numeric_cols = ['cpu_usage', 'memory_usage', 'latency_ms', 'error_rate']
-    
-    # 3. Z-Score Scaling
+    df = df.ffill().fillna(0)
     scaler = StandardScaler()
-    df[numeric_cols] = scaler.fit_transform(df[numeric_cols])
-    
-    print("Success! Metrics scaled to Mean=0, StdDev=1.")
+    df[NUMERIC_COLS] = scaler.fit_transform(df[NUMERIC_COLS])
     return df
 
+def benchmark_normalizers(num_services=5000, num_steps=10000, pandas_steps=1000, mode="welford"):
+    """
+    Compares per-scrape cost of the streaming normalizer against re-fitting
+    the global pandas/StandardScaler path over the accumulated history.
+    The pandas path is timed on pandas_steps of history and extrapolated
+    linearly to num_steps to keep memory in check.
+    """
+    rng = np.random.default_rng(0)
+    normalizer = StreamingNormalizer(mode=mode, capacity=num_services)
+    ids = normalizer.service_ids([f"srv-{i}" for i in range(num_services)])
+
+    scrapes = rng.normal(size=(16, num_services, len(NUMERIC_COLS)))
+    start = time.perf_counter()
+    for step in range(num_steps):
+        normalizer.update(ids, scrapes[step % len(scrapes)])
+    streaming_total = time.perf_counter() - start
+
+    steps = min(pandas_steps, num_steps)
+    history = {
+        'timestamp': np.repeat(np.arange(steps), num_services),
+        'service': np.tile(np.arange(num_services), steps),
+    }
+    for col in NUMERIC_COLS:
+        history[col] = rng.normal(size=steps * num_services)
+    start = time.perf_counter()
+    normalize_metrics_global(history)
+    pandas_refit = (time.perf_counter() - start) * num_steps / steps
+
+    result = {
+        "services": num_services,
+        "steps": num_steps,
+        "streaming_total_sec": streaming_total,
+        "streaming_per_scrape_ms": 1000 * streaming_total / num_steps,
+        "pandas_per_scrape_ms": 1000 * pandas_refit,
+    }
+    print(f"Streaming: {result['streaming_per_scrape_ms']:.3f} ms/scrape "
+          f"({streaming_total:.2f}s for {num_steps} scrapes)")
+    print(f"Pandas re-fit at {num_steps} steps of history: {result['pandas_per_scrape_ms']:.1f} ms/scrape "
+          f"(extrapolated from {steps} steps)")
+    return result
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LogWhisperer metric analyzer")
+    parser.add_argument("--benchmark", action="store_true", help="Benchmark streaming vs pandas normalization")
+    parser.add_argument("--services", type=int, default=5000)
+    parser.add_argument("--steps", type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_normalizers(args.services, args.steps)
+        raise SystemExit(0)
+
     # Mock data representing metrics for 3 services over 5 time steps
     mock_metrics = [
         {"timestamp": 1, "service": "auth", "cpu_usage": 10, "memory_usage": 200, "latency_ms": 50, "error_rate": 0.01},
         {"timestamp": 1, "service": "cart", "cpu_usage": 15, "memory_usage": 300, "latency_ms": 60, "error_rate": 0.02},
-        {"timestamp": 2, "service": "auth", "cpu_usage": 80, "memory_usage": 210, "latency_ms": 500, "error_rate": 0.05}, # SPIKE
+        {"timestamp": 2, "service": "auth", "cpu_usage": 12, "memory_usage": 205, "latency_ms": 55, "error_rate": 0.01},
         {"timestamp": 2, "service": "cart", "cpu_usage": 18, "memory_usage": 310, "latency_ms": 70, "error_rate": 0.02},
-        {"timestamp": 3, "service": "auth", "cpu_usage": 95, "memory_usage": 220, "latency_ms": 1200, "error_rate": 0.10}, # FAILURE
+        {"timestamp": 3, "service": "auth", "cpu_usage": 80, "memory_usage": 210, "latency_ms": 500, "error_rate": 0.05}, # SPIKE
+        {"timestamp": 3, "service": "cart", "cpu_usage": 16, "memory_usage": None, "latency_ms": 65, "error_rate": 0.02},
+        {"timestamp": 4, "service": "auth", "cpu_usage": 95, "memory_usage": 220, "latency_ms": 1200, "error_rate": 0.10}, # FAILURE
     ]
-    
-    normalized_df = normalize_metrics(mock_metrics)
-    
+
+    # The CLI stays on the NumPy path: importing pandas alone would double its startup time
+    timestamps, services, scaled = normalize_records(mock_metrics)
+
     print("\n--- Normalized Data Preview ---")
-    print(normalized_df.head())
-    
-    # Convert to JSON features for the GNN
-    features = normalized_df.to_dict(orient='records')
-    with open("metric_features.json", "w") as f:
-        json.dump(features, f, indent=4)
+    print(f"{'timestamp':>9} {'service':<8} " + " ".join(f"{col:>12}" for col in NUMERIC_COLS))
+    for ts, service, row in zip(timestamps, services, scaled):
+        print(f"{ts:>9} {service:<8} " + " ".join(f"{v:>12.4f}" for v in row))
+    report_startup("first output")
+
+    # Latest normalized row per service becomes the GNN metric feature
+    latest = {service: row for service, row in zip(services, scaled)}
+    FeatureStore().write("metrics", list(latest), np.stack(list(latest.values())))
@@ -1,52 +1,280 @@
-import numpy as np
 import json
+import argparse
+import numpy as np
+from feature_store import FeatureStore, FeatureFrame
+from telemetry import timed_stage, SPANS_ENCODED
+
+# Per-service columns written to the fused node vector (indices 772-774)
+TRACE_COLUMNS = ["p99_self_time_ms", "error_ratio", "retry_ratio"]
+P99 = 0.99
+
+class Vocabulary:
+    """
+    Grows a name -> integer ID table on demand; IDs are stable for the life
+    of the vocabulary so batches encoded with it line up.
+    """
+    def __init__(self, names=()):
+        self.ids = {}
+        self.names = []
+        for name in names:
+            self.intern(name)
 
-def encode_traces(traces):
+    def intern(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def __len__(self):
+        return len(self.names)
+
+services_vocab = Vocabulary()
+operations_vocab = Vocabulary()
+
+class SpanBatch:
     """
-    Simulates encoding request paths (Traces) into fixed-length vectors.
+    Flat columnar view of a batch of spans. parent holds the row of the parent
+    span within the batch (-1 for roots or parents outside the batch).
+    """
+    def __init__(self, trace, parent, service, operation, duration_ms, error, services, operations):
+        self.trace = trace
+        self.parent = parent
+        self.service = service
+        self.operation = operation
+        self.duration_ms = duration_ms
+        self.error = error
+        self.services = services
+        self.operations = operations
+
+    def __len__(self):
+        return len(self.trace)
+
+class _SpanColumns:
     """
-    print("Encoding traces...")
-    
-    # Map of operation names to integer IDs
-    op_map = {"auth": 1, "cart": 2, "payment": 3, "db_query": 4, "retry": 5}
-    
-    encoded_features = []
-    
+    Accumulates raw span fields while an export is parsed.
+    """
+    def __init__(self, services, operations):
+        self.services = services
+        self.operations = operations
+        self.trace_ids = Vocabulary()
+        self.trace, self.span_key, self.parent_key = [], [], []
+        self.service, self.operation, self.duration_ms, self.error = [], [], [], []
+
+    def add(self, trace_id, span_id, parent_id, service, operation, duration_ms, error):
+        self.trace.append(self.trace_ids.intern(trace_id))
+        self.span_key.append(f"{trace_id}:{span_id}")
+        self.parent_key.append(f"{trace_id}:{parent_id}" if parent_id else "")
+        self.service.append(self.services.intern(service))
+        self.operation.append(self.operations.intern(operation))
+        self.duration_ms.append(duration_ms)
+        self.error.append(error)
+
+    def build(self):
+        n = len(self.trace)
+        span_key = np.array(self.span_key, dtype=object)
+        parent_key = np.array(self.parent_key, dtype=object)
+
+        # Resolve parent span IDs to rows with one sort instead of a dict walk
+        codes = np.unique(np.concatenate([span_key, parent_key]).astype(str), return_inverse=True)[1]
+        row_of_code = np.full(codes.max() + 1 if n else 0, -1, dtype=np.int64)
+        row_of_code[codes[:n]] = np.arange(n)
+        parent = row_of_code[codes[n:]]
+        parent[parent_key == ""] = -1
+
+        return SpanBatch(
+            trace=np.array(self.trace, dtype=np.int64),
+            parent=parent,
+            service=np.array(self.service, dtype=np.int64),
+            operation=np.array(self.operation, dtype=np.int64),
+            duration_ms=np.array(self.duration_ms, dtype=np.float64),
+            error=np.array(self.error, dtype=bool),
+            services=self.services,
+            operations=self.operations,
+        )
+
+def _jaeger_traces(columns, traces):
     for trace in traces:
-        path = trace['path']
-        durations = trace['durations'] # ms per span
-        
-        # 1. Path Identity (Average ID) - simple representation
-        path_ids = [op_map.get(op, 0) for op in path]
-        path_score = np.mean(path_ids)
-        
-        # 2. Total Latency
-        total_latency = np.sum(durations)
-        
-        # 3. Anomaly Heuristic: Retries detected?
-        has_retry = 1.0 if "retry" in path else 0.0
-        
-        # Combined Trace Vector
-        trace_vector = [path_score, total_latency, has_retry]
-        encoded_features.append({
-            "trace_id": trace["trace_id"],
-            "vector": trace_vector
-        })
-        
+        processes = trace.get("processes", {})
+        for span in trace["spans"]:
+            parent_id = None
+            for ref in span.get("references", []):
+                if ref.get("refType") == "CHILD_OF":
+                    parent_id = ref["spanID"]
+                    break
+            tags = {t["key"]: t["value"] for t in span.get("tags", [])}
+            error = tags.get("error") in (True, "true") or int(tags.get("http.status_code", 0) or 0) >= 500
+            service = processes.get(span.get("processID"), {}).get("serviceName", "unknown")
+            columns.add(trace["traceID"], span["spanID"], parent_id, service, span["operationName"],
+                        span["duration"] / 1000.0, error)  # Jaeger durations are microseconds
+
+def _otlp_resource_spans(columns, resource_spans):
+    for resource in resource_spans:
+        service = "unknown"
+        for attr in resource.get("resource", {}).get("attributes", []):
+            if attr["key"] == "service.name":
+                service = attr["value"].get("stringValue", service)
+        for scope in resource.get("scopeSpans", resource.get("instrumentationLibrarySpans", [])):
+            for span in scope["spans"]:
+                status = span.get("status", {}).get("code", 0)
+                error = status in (2, "STATUS_CODE_ERROR")
+                duration = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+                columns.add(span["traceId"], span["spanId"], span.get("parentSpanId"), service,
+                            span["name"], duration, error)
+
+def _parse_document(columns, document):
+    if "resourceSpans" in document:
+        _otlp_resource_spans(columns, document["resourceSpans"])
+    elif "data" in document:
+        _jaeger_traces(columns, document["data"])
+    elif "spans" in document:
+        _jaeger_traces(columns, [document])
+    else:
+        raise ValueError("Unrecognized trace export: expected Jaeger 'data' or OTLP 'resourceSpans'")
+
+def iter_span_batches(path, batch_size=200000, services=None, operations=None):
+    """
+    Streams a local Jaeger or OTLP JSON export as SpanBatch chunks. A .jsonl
+    file is read one document (Jaeger trace or OTLP export) per line and cut
+    into batches of roughly batch_size spans at document boundaries, so a
+    trace's spans stay together when it is exported as one document.
+    """
+    services = services_vocab if services is None else services
+    operations = operations_vocab if operations is None else operations
+    columns = _SpanColumns(services, operations)
+
+    with open(path, "r") as f:
+        documents = (json.loads(line) for line in f if line.strip()) if path.endswith(".jsonl") else [json.load(f)]
+        for document in documents:
+            _parse_document(columns, document)
+            if len(columns.trace) >= batch_size:
+                yield columns.build()
+                columns = _SpanColumns(services, operations)
+    if columns.trace:
+        yield columns.build()
+
+@timed_stage("trace_parsing")
+def load_spans(path, services=None, operations=None):
+    """
+    Loads a whole export as one SpanBatch.
+    """
+    services = services_vocab if services is None else services
+    operations = operations_vocab if operations is None else operations
+    batches = list(iter_span_batches(path, batch_size=float("inf"), services=services, operations=operations))
+    return batches[0] if batches else _SpanColumns(services, operations).build()
+
+def service_trace_stats(spans):
+    """
+    Per-service span statistics computed with grouped NumPy reductions:
+    span_count, p99_self_time_ms, retry_count, error_spans, mean_fan_out.
+    Row i belongs to spans.services.names[i].
+    """
+    n = len(spans)
+    num_services = len(spans.services)
+    has_parent = spans.parent >= 0
+    parents = spans.parent[has_parent]
+
+    # 1. Self time = own duration minus time spent in direct children
+    child_time = np.bincount(parents, weights=spans.duration_ms[has_parent], minlength=n)
+    self_time = np.clip(spans.duration_ms - child_time, 0.0, None)
+
+    # 2. Fan-out = number of direct children per span
+    fan_out = np.bincount(parents, minlength=n)
+
+    # 3. Retries = repeated (trace, parent, service, operation) calls beyond the
+    # first, plus spans whose operation name says so
+    retry = np.zeros(n, dtype=bool)
+    if n:
+        keys = (spans.trace, spans.parent, spans.service, spans.operation)
+        order = np.lexsort(keys[::-1])
+        sorted_keys = np.stack([k[order] for k in keys], axis=1)
+        repeat = np.zeros(n, dtype=bool)
+        repeat[1:] = np.all(sorted_keys[1:] == sorted_keys[:-1], axis=1)
+        retry[order] = repeat & (spans.parent[order] >= 0)
+    retry_op = np.array(["retry" in name.lower() for name in spans.operations.names], dtype=bool)
+    if len(retry_op):
+        retry |= retry_op[spans.operation]
+
+    span_count = np.bincount(spans.service, minlength=num_services)
+    error_spans = np.bincount(spans.service, weights=spans.error, minlength=num_services)
+    retry_count = np.bincount(spans.service, weights=retry, minlength=num_services)
+    mean_fan_out = np.bincount(spans.service, weights=fan_out, minlength=num_services) / np.maximum(span_count, 1)
+
+    # 4. p99 self time per service: sort by (service, self_time) and index each group
+    order = np.lexsort((self_time, spans.service))
+    starts = np.searchsorted(spans.service[order], np.arange(num_services))
+    position = starts + np.floor(P99 * np.maximum(span_count - 1, 0)).astype(np.int64)
+    present = span_count > 0
+    p99 = np.zeros(num_services)
+    p99[present] = self_time[order][position[present]]
+
+    return {
+        "span_count": span_count,
+        "p99_self_time_ms": p99,
+        "retry_count": retry_count,
+        "error_spans": error_spans,
+        "mean_fan_out": mean_fan_out,
+    }
+
+@timed_stage("trace_encoding")
+def encode_traces(spans):
+    """
+    Encodes a SpanBatch into per-service trace vectors
+    [p99 self time (ms), error span ratio, retry ratio] as a FeatureFrame.
+    """
+    print(f"Encoding {len(spans)} spans...")
+    SPANS_ENCODED.inc(len(spans))
+    stats = service_trace_stats(spans)
+    count = np.maximum(stats["span_count"], 1)
+    vectors = np.stack([
+        stats["p99_self_time_ms"],
+        stats["error_spans"] / count,
+        stats["retry_count"] / count,
+    ], axis=1).astype(np.float32)
+
+    # Services known to the vocabulary but absent from this batch are left out
+    present = stats["span_count"] > 0
+    services = [name for name, keep in zip(spans.services.names, present) if keep]
     print("Success! Traces encoded.")
-    return encoded_features
+    return FeatureFrame(services, vectors[present])
+
+def _mock_jaeger_export():
+    def span(trace, span_id, parent, process, op, duration_us, error=False):
+        refs = [{"refType": "CHILD_OF", "traceID": trace, "spanID": parent}] if parent else []
+        tags = [{"key": "error", "type": "bool", "value": True}] if error else []
+        return {"traceID": trace, "spanID": span_id, "operationName": op, "references": refs,
+                "processID": process, "duration": duration_us, "tags": tags}
+
+    processes = {"p1": {"serviceName": "auth"}, "p2": {"serviceName": "cart"}, "p3": {"serviceName": "payment"}}
+    return {"data": [
+        {"traceID": "T1", "processes": processes, "spans": [
+            span("T1", "a", None, "p1", "login", 130000),
+            span("T1", "b", "a", "p2", "get_cart", 120000),
+            span("T1", "c", "b", "p3", "charge", 100000),
+        ]},
+        {"traceID": "T2", "processes": processes, "spans": [  # ANOMALY: retried, failing payment
+            span("T2", "a", None, "p1", "login", 1130000),
+            span("T2", "b", "a", "p2", "get_cart", 1120000),
+            span("T2", "c", "b", "p3", "charge", 500000, error=True),
+            span("T2", "d", "b", "p3", "charge", 500000),
+        ]},
+    ]}
 
 if __name__ == "__main__":
-    # Mock Traces
-    mock_traces = [
-        {"trace_id": "T1", "path": ["auth", "cart", "payment"], "durations": [10, 20, 100]},
-        {"trace_id": "T2", "path": ["auth", "cart", "payment", "retry", "payment"], "durations": [10, 20, 500, 100, 500]}, # ANOMALY
-    ]
-    
-    results = encode_traces(mock_traces)
-    
-    for res in results:
-        print(f"Trace {res['trace_id']} Vector: {res['vector']}")
-        
-    with open("trace_features.json", "w") as f:
-        json.dump(results, f, indent=4)
+    parser = argparse.ArgumentParser(description="LogWhisperer trace encoder")
+    parser.add_argument("--export", help="Jaeger or OTLP JSON/JSONL export to encode")
+    args = parser.parse_args()
+
+    if args.export:
+        spans = load_spans(args.export)
+    else:
+        columns = _SpanColumns(services_vocab, operations_vocab)
+        _parse_document(columns, _mock_jaeger_export())
+        spans = columns.build()
+
+    results = encode_traces(spans)
+
+    for service in results.services:
+        print(f"Service {service} Vector: {results.row(service).tolist()}")
+
+    FeatureStore().write("traces", results.services, results.values)
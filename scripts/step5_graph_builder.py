@@ -1,53 +1,107 @@
 import json
 import numpy as np
+import torch
+from feature_store import FeatureStore, FeatureFrame, FEATURE_DIM, MODALITY_SLICES
+from lazy_loader import timed_import
+from telemetry import timed_stage
 
-def build_rca_graph():
+def _data_class():
     """
-    Integrates topology, logs, metrics, and traces into a single graph.
+    PyG's Data class, imported on first use since PyG is slow to import.
+    None when PyG is not installed: graphs are then plain dicts of tensors.
     """
-    print("Building RCA Graph...")
-    
-    # 1. Load Topology (Phase 1)
     try:
-        with open("topology_graph.json", "r") as f:
-            topology = json.load(f)
+        return timed_import("torch_geometric.data").Data
+    except ImportError:
+        return None
+
+MOCK_TOPOLOGY = {"nodes": ["auth", "cart", "payment"], "edges": [{"source": "auth", "target": "cart"}]}
+
+def load_topology(path="topology_graph.json"):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
     except FileNotFoundError:
         print("Topology data not found. Using mock nodes.")
-        topology = {"nodes": ["auth", "cart", "payment"], "edges": [{"source": "auth", "target": "cart"}]}
-
-    # 2. Load Features (Phase 2)
-    # Mocking data that would be produced by log_processor.py, metric_analyzer.py, etc.
-    # In a real system, these would be loaded from .json files generated in Phase 2
-    
-    # Mock Log Vectors (768 dims, simplified here)
-    log_features = {node: np.random.randn(8).tolist() for node in topology["nodes"]}
-    
-    # Mock Metric Vectors (Normalized)
-    metric_features = {node: [np.random.normal(), np.random.normal()] for node in topology["nodes"]}
-    
+        return MOCK_TOPOLOGY
+
+def build_edge_index(nodes, edges):
+    """
+    Maps topology edges onto node indices: returns (edge_index [2, E] long,
+    edge_weight [E] float). Edges touching unknown nodes are dropped.
+    """
+    node_index = {name: i for i, name in enumerate(nodes)}
+    src = np.fromiter((node_index.get(e["source"], -1) for e in edges), dtype=np.int64, count=len(edges))
+    dst = np.fromiter((node_index.get(e["target"], -1) for e in edges), dtype=np.int64, count=len(edges))
+    weight = np.fromiter((float(e.get("requests_per_second", 1.0)) for e in edges), dtype=np.float32,
+                         count=len(edges))
+    keep = (src >= 0) & (dst >= 0)
+    edge_index = torch.from_numpy(np.stack([src[keep], dst[keep]]))
+    return edge_index, torch.from_numpy(weight[keep])
+
+def _as_frame(features, store, group):
+    if isinstance(features, FeatureFrame):
+        return features
+    if isinstance(features, dict):
+        return FeatureFrame.from_dict(features)
+    if store.exists(group):
+        return store.read(group)
+    return None
+
+@timed_stage("graph_build")
+def build_rca_graph(topology=None, log_features=None, metric_features=None, trace_features=None,
+                    store=None, save=True):
+    """
+    Integrates topology, logs, metrics, and traces into a single graph.
+
+    Each modality (a FeatureFrame, a {service: vector} dict, or None to read
+    it from the feature store) is joined by service name straight into a
+    preallocated [N, 775] float32 matrix; services with no data for a
+    modality keep zeros there. Returns a PyG Data object (or an equivalent
+    dict) with x, edge_index, edge_weight and node_ids.
+    """
+    print("Building RCA Graph...")
+    store = store or FeatureStore()
+
+    # 1. Load Topology (Phase 1)
+    topology = topology or load_topology()
+    nodes = list(topology["nodes"])
+
+    # 2. Fuse Features (Phase 2) into one preallocated matrix
+    x = np.zeros((len(nodes), FEATURE_DIM), dtype=np.float32)
+    for group, features in (("logs", log_features), ("metrics", metric_features), ("traces", trace_features)):
+        frame = _as_frame(features, store, group)
+        if frame is None:
+            print(f"No {group} features found; leaving zeros.")
+            continue
+        frame.gather(nodes, out=x[:, MODALITY_SLICES[group]])
+
     # 3. Graph Assembly
-    rca_graph = {
-        "nodes": [],
-        "edges": topology["edges"]
+    edge_index, edge_weight = build_edge_index(nodes, topology["edges"])
+    fields = {
+        "x": torch.from_numpy(x),
+        "edge_index": edge_index,
+        "edge_weight": edge_weight,
+        "node_ids": nodes,
+        "topology_version": topology.get("version"),
+        "namespaces": topology.get("namespaces"),
     }
-    
-    for node_name in topology["nodes"]:
-        # NODE ATTRIBUTE FUSION (Phase 3.2 conceptually)
-        # Concatenate Log + Metric features
-        combined_vector = log_features[node_name] + metric_features[node_name]
-        
-        rca_graph["nodes"].append({
-            "id": node_name,
-            "feature_vector": combined_vector
-        })
-    
-    # Save the final GNN input
-    with open("gnn_input_graph.json", "w") as f:
-        json.dump(rca_graph, f, indent=4)
-        
-    print(f"Success! RCA Graph built with {len(rca_graph['nodes'])} nodes.")
-    print(f"Node Vector Dimension: {len(rca_graph['nodes'][0]['feature_vector'])}")
-    return rca_graph
+    Data = _data_class()
+    graph = Data(**fields) if Data is not None else fields
+
+    # Save the final GNN input: node matrix to the store, the graph as a binary tensor file
+    if save:
+        store.write("graph", nodes, x)
+        torch.save(fields, "gnn_input_graph.pt")
+
+    print(f"Success! RCA Graph built with {len(nodes)} nodes and {edge_index.shape[1]} edges.")
+    print(f"Node Vector Dimension: {x.shape[1]}")
+    return graph
+
+def load_rca_graph(path="gnn_input_graph.pt"):
+    fields = torch.load(path)
+    Data = _data_class()
+    return Data(**fields) if Data is not None else fields
 
 if __name__ == "__main__":
     build_rca_graph()
@@ -1,6 +1,9 @@
+import copy
+import numpy as np
 import torch
 import torch.nn.functional as F
-from torch_geometric.nn import GATConv
+from lazy_loader import timed_import
+from feature_store import TemporalFeatureBuffer
 
 class LogWhispererBrain(torch.nn.Module):
     """
@@ -9,6 +12,8 @@ class LogWhispererBrain(torch.nn.Module):
     """
     def __init__(self, in_channels, hidden_channels, out_channels, heads=4):
         super(LogWhispererBrain, self).__init__()
+        # PyG takes seconds to import, so it is loaded when a model is built
+        GATConv = timed_import("torch_geometric.nn").GATConv
         
         # Layer 1: Graph Attention Convolution (with Multi-head attention)
         # in_channels = size of Log + Metric + Trace vector
@@ -35,6 +40,273 @@ class LogWhispererBrain(torch.nn.Module):
         # We use out_channels = 1 for binary anomaly detection per node
         return x
 
+    def forward_with_attention(self, x, edge_index):
+        """
+        Same as forward, but also returns the GAT attention of both layers as
+        [(edge_index_1, alpha_1), (edge_index_2, alpha_2)], where edge_index
+        includes the self-loops GATConv adds and alpha is [E, heads].
+        """
+        x = F.dropout(x, p=0.6, training=self.training)
+        x, attention_1 = self.conv1(x, edge_index, return_attention_weights=True)
+        x = F.elu(x)
+        x = F.dropout(x, p=0.6, training=self.training)
+        x, attention_2 = self.conv2(x, edge_index, return_attention_weights=True)
+        return x, [attention_1, attention_2]
+
+    def embed(self, x, edge_index):
+        """
+        Layer-1 node embeddings (after ELU), [N, hidden_channels * heads]:
+        each service's neighbourhood-aware state before it is scored.
+        """
+        x = F.dropout(x, p=0.6, training=self.training)
+        return F.elu(self.conv1(x, edge_index))
+
+    def fingerprint(self, x, edge_index, scores=None):
+        """
+        Graph-level fingerprint of one snapshot, [2 * hidden_channels * heads]:
+        the score-weighted mean of the node embeddings (what the suspected
+        services look like) next to their max pool (the strongest signal
+        anywhere), L2-normalised so dot products are cosine similarities.
+        Without scores the weights come from the model's own logits.
+        """
+        return self._pool(self.embed(x, edge_index), edge_index, scores)
+
+    def _pool(self, hidden, edge_index, scores):
+        if scores is None:
+            scores = torch.sigmoid(self.conv2(hidden, edge_index)).view(-1)
+        weights = torch.as_tensor(scores, dtype=hidden.dtype).view(-1, 1)
+        weighted = (weights * hidden).sum(dim=0) / weights.sum().clamp_min(1e-6)
+        pooled = torch.cat([weighted, hidden.max(dim=0).values])
+        return F.normalize(pooled, dim=0)
+
+class TemporalLogWhispererBrain(LogWhispererBrain):
+    """
+    Temporal variant of the brain for precursor trends (latency creeping
+    up before a crash). Every snapshot of a node's window is projected to
+    temporal_channels, a GRU cell runs over them oldest to newest, and its
+    final state is concatenated to the latest snapshot before the same two
+    GAT layers.
+
+    Inputs are [W, N, D] sequences (latest last); a plain [N, D] snapshot is
+    treated as a window of one. A snapshot can also be scored as the newest
+    frame of a window whose earlier frames were already projected (history,
+    [W - 1, N, temporal_channels], as kept by TemporalInference), which is
+    how explanations and fingerprints see the trend the alert was scored
+    on. The weights do not depend on W.
+    """
+    def __init__(self, in_channels, hidden_channels, out_channels, heads=4, temporal_channels=32):
+        super(TemporalLogWhispererBrain, self).__init__(in_channels + temporal_channels, hidden_channels,
+                                                        out_channels, heads=heads)
+        self.temporal_channels = temporal_channels
+        self.project = torch.nn.Linear(in_channels, temporal_channels)
+        self.temporal = torch.nn.GRUCell(temporal_channels, temporal_channels)
+
+    def project_frame(self, x):
+        # [N, D] -> [N, temporal_channels]
+        return F.relu(self.project(x))
+
+    def encode(self, projected_frames):
+        """
+        Runs the GRU cell over projected frames (oldest first) and returns
+        the trend state [N, temporal_channels].
+        """
+        state = None
+        for frame in projected_frames:
+            state = self.temporal(frame, state)
+        return state
+
+    def node_features(self, x, history=None):
+        if history is not None:
+            return torch.cat([x, self.encode(list(history) + [self.project_frame(x)])], dim=1)
+        if x.dim() == 2:
+            x = x.unsqueeze(0)
+        trend = self.encode(self.project_frame(x))
+        return torch.cat([x[-1], trend], dim=1)
+
+    def forward(self, x, edge_index, history=None):
+        return super(TemporalLogWhispererBrain, self).forward(self.node_features(x, history), edge_index)
+
+    def forward_with_attention(self, x, edge_index, history=None):
+        return super(TemporalLogWhispererBrain, self).forward_with_attention(self.node_features(x, history),
+                                                                             edge_index)
+
+    def embed(self, x, edge_index, history=None):
+        return super(TemporalLogWhispererBrain, self).embed(self.node_features(x, history), edge_index)
+
+    def fingerprint(self, x, edge_index, scores=None, history=None):
+        return self._pool(self.embed(x, edge_index, history), edge_index, scores)
+
+class TemporalInference:
+    """
+    Tick-to-tick scorer for TemporalLogWhispererBrain.
+
+    Keeps a TemporalFeatureBuffer of *projected* snapshots ([W, N,
+    temporal_channels] rather than [W, N, 775]), so each tick projects only
+    the new snapshot, writes it into the ring in place and runs the GRU cell
+    over the W cached frames: a constant cost per tick. The service set is
+    realigned when the topology changes: shared services keep their
+    history, new ones start with their first snapshot repeated, so every
+    tick scores like a full [W, N, D] forward over the same snapshots.
+    """
+    def __init__(self, model, window):
+        self.model = model
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.buffer = TemporalFeatureBuffer(self.window, [], dim=self.model.temporal_channels)
+
+    @torch.no_grad()
+    def __call__(self, x, edge_index, node_ids):
+        self.model.eval()
+        projected = self.model.project_frame(x).numpy()
+        self.buffer.reindex(node_ids, fill=projected)
+        self.buffer.push(projected)
+        trend = self.model.encode(torch.from_numpy(frame) for frame in self.buffer.frames())
+        return LogWhispererBrain.forward(self.model, torch.cat([x, trend], dim=1), edge_index)
+
+    def history(self):
+        """
+        The projected frames before the latest snapshot, [W - 1, N,
+        temporal_channels], copied out of the ring so they stay valid after
+        later ticks. Pass as `history` to score, explain or fingerprint the
+        latest snapshot with the trend it was scored with.
+        """
+        frames = self.buffer.frames()[:-1]
+        if not frames:
+            return torch.zeros(0, len(self.buffer.services), self.model.temporal_channels)
+        return torch.from_numpy(np.stack(frames))
+
+def to_torch_linear(model):
+    """
+    Replaces PyG's Linear projections (GATConv.lin) in place with plain
+    torch.nn.Linear holding the same weights, so torch quantization and
+    export tooling recognise them.
+    """
+    PyGLinear = timed_import("torch_geometric.nn.dense.linear").Linear
+    for name, module in list(model.named_modules()):
+        for child_name, child in list(module.named_children()):
+            if isinstance(child, PyGLinear):
+                linear = torch.nn.Linear(child.in_channels, child.out_channels, bias=child.bias is not None)
+                with torch.no_grad():
+                    linear.weight.copy_(child.weight)
+                    if child.bias is not None:
+                        linear.bias.copy_(child.bias)
+                setattr(module, child_name, linear)
+    return model
+
+def quantize_brain(model):
+    """
+    Returns an inference-only copy of the model with its linear projections
+    dynamically quantized to int8. Attention and aggregation stay in fp32.
+    """
+    quantized = to_torch_linear(copy.deepcopy(model)).eval()
+    return torch.ao.quantization.quantize_dynamic(quantized, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _incoming_subgraph(targets, edge_index, num_nodes):
+    """
+    Edges pointing into the target nodes, relabeled onto the compact node set
+    (targets first, then their in-neighbors). Returns (nodes, sub_edge_index).
+    """
+    mask = torch.zeros(num_nodes, dtype=torch.bool)
+    mask[targets] = True
+    edges = edge_index[:, mask[edge_index[1]]]
+    extra = edges[0][~mask[edges[0]]].unique()
+    nodes = torch.cat([targets, extra])
+    relabel = torch.empty(num_nodes, dtype=torch.long)
+    relabel[nodes] = torch.arange(len(nodes))
+    return nodes, relabel[edges]
+
+def _out_neighbors(nodes, edge_index, num_nodes):
+    """
+    nodes plus every node they send messages to.
+    """
+    mask = torch.zeros(num_nodes, dtype=torch.bool)
+    mask[nodes] = True
+    mask[edge_index[1][mask[edge_index[0]]]] = True
+    return mask.nonzero().view(-1)
+
+class IncrementalInference:
+    """
+    Tick-to-tick scorer for large meshes where few nodes change per scrape.
+
+    Keeps the last input, the layer-1 embeddings (after ELU) and the logits.
+    On each tick only nodes whose features changed are treated as dirty: their
+    layer-1 embeddings are recomputed for the dirty nodes and their direct
+    callees (the 1-hop fan-out), and logits for that set's fan-out in turn
+    (the 2-hop receptive field), each on a relabeled subgraph of incoming
+    edges. Results are spliced into the cached tensors.
+
+    Falls back to a full forward pass on the first tick, on a topology change
+    or when more than full_recompute_ratio of the nodes are dirty.
+    """
+    def __init__(self, model, atol=0.0, full_recompute_ratio=0.25):
+        self.model = model
+        self.atol = atol
+        self.full_recompute_ratio = full_recompute_ratio
+        self.stats = {"full": 0, "incremental": 0, "recomputed_nodes": 0}
+        self.reset()
+
+    def reset(self):
+        self._x = None
+        self._edge_index = None
+        self._hidden = None
+        self._logits = None
+
+    def _full(self, x, edge_index):
+        model = self.model
+        self._hidden = F.elu(model.conv1(x, edge_index))
+        self._logits = model.conv2(self._hidden, edge_index)
+        self.stats["full"] += 1
+        self.stats["recomputed_nodes"] += x.shape[0]
+
+    def _same_topology(self, edge_index):
+        cached = self._edge_index
+        return cached is not None and (cached is edge_index or
+                                       (cached.shape == edge_index.shape and torch.equal(cached, edge_index)))
+
+    def changed_nodes(self, x):
+        diff = torch.gt(torch.sub(x, self._x).abs_(), self.atol) if self.atol else torch.ne(x, self._x)
+        return diff.any(dim=1).nonzero().view(-1)
+
+    @torch.no_grad()
+    def __call__(self, x, edge_index, changed=None):
+        """
+        Returns logits [N, out_channels] for x, identical (up to float
+        reordering) to model(x, edge_index) in eval mode.
+
+        changed: optional indices of the nodes whose features were rewritten
+        this tick (e.g. the services a collector reported). Without it the
+        dirty set is found by comparing x with the previous input.
+        """
+        self.model.eval()
+        num_nodes = x.shape[0]
+        if self._x is None or self._x.shape != x.shape or not self._same_topology(edge_index):
+            self._full(x, edge_index)
+            self._x = x.clone()
+        else:
+            dirty = self.changed_nodes(x) if changed is None else torch.as_tensor(changed, dtype=torch.long).unique()
+            if len(dirty) > self.full_recompute_ratio * num_nodes:
+                self._full(x, edge_index)
+                self._x.copy_(x)
+            elif len(dirty):
+                self._x[dirty] = x[dirty]
+                model = self.model
+                # Layer 1 changes for the dirty nodes and whoever they message
+                layer1 = _out_neighbors(dirty, edge_index, num_nodes)
+                nodes, sub_edges = _incoming_subgraph(layer1, edge_index, num_nodes)
+                self._hidden[layer1] = F.elu(model.conv1(x[nodes], sub_edges))[:len(layer1)]
+
+                # Layer 2 changes one more hop out
+                layer2 = _out_neighbors(layer1, edge_index, num_nodes)
+                nodes, sub_edges = _incoming_subgraph(layer2, edge_index, num_nodes)
+                self._logits[layer2] = model.conv2(self._hidden[nodes], sub_edges)[:len(layer2)]
+
+                self.stats["incremental"] += 1
+                self.stats["recomputed_nodes"] += len(layer2)
+        self._edge_index = edge_index
+        return self._logits.clone()
+
 if __name__ == "__main__":
     # Mock parameters
     FEATURE_DIM = 775 # Log(768) + Metrics(4) + Trace(3)
@@ -42,3 +314,26 @@ if __name__ == "__main__":
     model = LogWhispererBrain(in_channels=FEATURE_DIM, hidden_channels=16, out_channels=1)
     print("LogWhisperer Brain Initialized.")
     print(model)
+
+    # Incremental scoring on a 10k-node mesh where 1% of services change per tick
+    import time
+    num_nodes = 10000
+    model.eval()
+    x = torch.randn(num_nodes, FEATURE_DIM)
+    edge_index = torch.randint(0, num_nodes, (2, num_nodes * 3))
+    incremental = IncrementalInference(model)
+    incremental(x, edge_index)
+    for _ in range(3):
+        changed = torch.randperm(num_nodes)[:num_nodes // 100]
+        x = x.clone()
+        x[changed] += torch.randn(len(changed), FEATURE_DIM)
+
+        start = time.perf_counter()
+        fast = incremental(x, edge_index, changed=changed)
+        fast_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        with torch.no_grad():
+            full = model(x, edge_index)
+        full_ms = (time.perf_counter() - start) * 1000
+        print(f"Incremental {fast_ms:.1f} ms vs full {full_ms:.1f} ms, "
+              f"max diff {(fast - full).abs().max().item():.2e}")
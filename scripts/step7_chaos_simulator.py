@@ -1,41 +1,193 @@
+import warnings
 import numpy as np
 import torch
+from feature_store import FEATURE_DIM, MODALITY_SLICES
 
-def simulate_chaos(graph):
+FAULT_TYPES = ["latency", "error_burst", "pod_kill", "dependency_timeout"]
+
+# Feature indices of the fused node vector
+CPU, MEMORY, LATENCY, ERROR_RATE = 768, 769, 770, 771          # step3 metrics
+P99_SELF_TIME, ERROR_RATIO, RETRY_RATIO = 772, 773, 774        # step4 traces
+
+# Metric/trace shift each fault causes on the faulty service, plus how strongly
+# it pushes its logs towards the fault's "anomalous template" direction.
+FAULT_SIGNATURES = {
+    "latency":            ({LATENCY: 4.0, P99_SELF_TIME: 4.0, CPU: 1.0}, 0.5),
+    "error_burst":        ({ERROR_RATE: 4.0, ERROR_RATIO: 4.0}, 3.0),
+    "pod_kill":           ({CPU: -3.0, MEMORY: -3.0, ERROR_RATE: 3.0, ERROR_RATIO: 2.0}, 2.0),
+    "dependency_timeout": ({LATENCY: 3.0, P99_SELF_TIME: 2.0, RETRY_RATIO: 4.0}, 1.0),
+}
+# What services affected by the cascade see: the root's symptoms without its own log/CPU story
+CASCADE_DIMS = [LATENCY, ERROR_RATE, P99_SELF_TIME, ERROR_RATIO, RETRY_RATIO]
+
+def synthetic_topology(num_nodes, avg_fan_out=2, seed=0):
+    """
+    Generates a service call graph with power-law fan-in: each new service
+    calls a few existing ones picked by preferential attachment, so a handful
+    of shared backends (databases, auth) end up with most of the callers.
+    Returns {"nodes": [{"id": ...}], "edges": [{"source": ..., "target": ...}]}.
+    """
+    rng = np.random.default_rng(seed)
+    names = [f"srv-{i}" for i in range(num_nodes)]
+    weight = np.ones(num_nodes)
+    edges = []
+    for i in range(1, num_nodes):
+        k = min(i, max(1, rng.poisson(avg_fan_out)))
+        p = weight[:i] / weight[:i].sum()
+        for target in rng.choice(i, size=k, replace=False, p=p):
+            edges.append({"source": names[i], "target": names[target]})
+            weight[target] += 1
+    return {"nodes": [{"id": name} for name in names], "edges": edges}
+
+def _signatures(seed=7):
+    """
+    [num_faults, 775] root signatures and cascade signatures. Log directions
+    are fixed random unit vectors, one per fault type.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    root = torch.zeros(len(FAULT_TYPES), FEATURE_DIM)
+    for f, fault in enumerate(FAULT_TYPES):
+        shifts, log_scale = FAULT_SIGNATURES[fault]
+        direction = torch.randn(MODALITY_SLICES["logs"].stop, generator=generator)
+        root[f, MODALITY_SLICES["logs"]] = log_scale * direction / direction.norm()
+        for index, shift in shifts.items():
+            root[f, index] = shift
+    cascade = torch.zeros_like(root)
+    cascade[:, CASCADE_DIMS] = root[:, CASCADE_DIMS]
+    return root, cascade
+
+class ChaosSimulator:
+    """
+    Topology-aware fault injection.
+
+    The propagation operator is built once as a sparse CSR matrix. Each call
+    to simulate() injects a random fault (latency, error burst, pod kill,
+    dependency timeout) into a random root service per scenario and spreads
+    decaying symptoms `hops` steps through the call graph with sparse
+    matrix products, for all scenarios at once.
+
+    propagate_to="callers" sends symptoms from a failing service to the
+    services that call it (the impact direction of a real outage);
+    "callees" follows the call edges instead.
+    """
+    def __init__(self, graph, hops=3, decay=0.5, noise=1.0, propagate_to="callers"):
+        if propagate_to not in ("callers", "callees"):
+            raise ValueError(f"Unknown propagation direction: {propagate_to}")
+        self.node_ids = [n['id'] if isinstance(n, dict) else n for n in graph['nodes']]
+        self.num_nodes = len(self.node_ids)
+        self.hops = hops
+        self.decay = decay
+        self.noise = noise
+
+        index = {name: i for i, name in enumerate(self.node_ids)}
+        pairs = [(index[e['source']], index[e['target']]) for e in graph['edges']
+                 if e['source'] in index and e['target'] in index]
+        src = torch.tensor([p[0] for p in pairs], dtype=torch.long)
+        dst = torch.tensor([p[1] for p in pairs], dtype=torch.long)
+        self.edge_index = torch.stack([src, dst]) if pairs else torch.zeros(2, 0, dtype=torch.long)
+
+        # Row i of P collects symptoms arriving at node i
+        rows, cols = (src, dst) if propagate_to == "callers" else (dst, src)
+        values = torch.ones(len(pairs))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)  # "CSR support is in beta"
+            self.propagation = torch.sparse_coo_tensor(torch.stack([rows, cols]), values,
+                                                       (self.num_nodes, self.num_nodes),
+                                                       check_invariants=True).coalesce().to_sparse_csr()
+        self.root_signatures, self.cascade_signatures = _signatures()
+
+    def symptom_intensity(self, roots):
+        """
+        [B, N] cascade intensity for root indices [B]: decay**h at h hops,
+        keeping the strongest path, excluding the roots themselves.
+        """
+        batch = len(roots)
+        frontier = torch.zeros(self.num_nodes, batch)
+        frontier[roots, torch.arange(batch)] = 1.0
+        intensity = torch.zeros_like(frontier)
+        for _ in range(self.hops):
+            frontier = self.decay * torch.clamp(self.propagation @ frontier, max=1.0)
+            intensity = torch.maximum(intensity, frontier)
+        intensity[roots, torch.arange(batch)] = 0.0
+        return intensity.t()
+
+    def simulate(self, num_scenarios, generator=None):
+        """
+        Returns (x [B, N, 775], labels [B, N], roots [B], faults [B]) where
+        faults index FAULT_TYPES.
+        """
+        roots = torch.randint(0, self.num_nodes, (num_scenarios,), generator=generator)
+        faults = torch.randint(0, len(FAULT_TYPES), (num_scenarios,), generator=generator)
+        severity = 0.7 + 0.6 * torch.rand(num_scenarios, generator=generator)
+
+        # 1. Healthy baseline
+        x = self.noise * torch.randn(num_scenarios, self.num_nodes, FEATURE_DIM, generator=generator)
+
+        # 2. Labels (y): 1 for Root Cause, 0 for healthy or cascading failure
+        labels = torch.zeros(num_scenarios, self.num_nodes)
+        labels[torch.arange(num_scenarios), roots] = 1.0
+
+        # 3. Inject the fault at the root and the decayed cascade around it
+        root_signature = severity[:, None] * self.root_signatures[faults]
+        cascade_signature = severity[:, None] * self.cascade_signatures[faults]
+        x.addcmul_(labels.unsqueeze(-1), root_signature.unsqueeze(1))
+        x.addcmul_(self.symptom_intensity(roots).unsqueeze(-1), cascade_signature.unsqueeze(1))
+        return x, labels, roots, faults
+
+    def simulate_sequence(self, num_scenarios, window, generator=None, onset=0.5):
+        """
+        Time-series variant of simulate(): returns (x [B, W, N, 775], labels,
+        roots, faults). The fault builds up instead of appearing at once:
+        from step onset * W on, the root signature and its cascade ramp
+        linearly up to full severity at the last step, and every step has
+        its own healthy noise.
+        """
+        roots = torch.randint(0, self.num_nodes, (num_scenarios,), generator=generator)
+        faults = torch.randint(0, len(FAULT_TYPES), (num_scenarios,), generator=generator)
+        severity = 0.7 + 0.6 * torch.rand(num_scenarios, generator=generator)
+
+        x = self.noise * torch.randn(num_scenarios, window, self.num_nodes, FEATURE_DIM, generator=generator)
+        labels = torch.zeros(num_scenarios, self.num_nodes)
+        labels[torch.arange(num_scenarios), roots] = 1.0
+
+        # Ramp [W]: 0 before the onset, rising to 1 at the last step
+        start = int(onset * window)
+        ramp = torch.zeros(window)
+        ramp[start:] = torch.arange(1, window - start + 1) / (window - start)
+
+        root_signature = severity[:, None] * self.root_signatures[faults]
+        cascade_signature = severity[:, None] * self.cascade_signatures[faults]
+        intensity = self.symptom_intensity(roots)
+        for t in range(start, window):
+            x[:, t].addcmul_(labels.unsqueeze(-1), ramp[t] * root_signature.unsqueeze(1))
+            x[:, t].addcmul_(intensity.unsqueeze(-1), ramp[t] * cascade_signature.unsqueeze(1))
+        return x, labels, roots, faults
+
+def simulate_chaos(graph, generator=None, verbose=True):
     """
     Simulates a 'Fault Injection' (Chaos Engineering) session.
-    It picks a service as the root cause, injects jitter into its features,
-    and returns the labels for training.
-    """
-    print("Simulating Chaos...")
-    
-    num_nodes = len(graph['nodes'])
-    root_cause_index = np.random.randint(0, num_nodes)
-    target_service = graph['nodes'][root_cause_index]['id']
-    
-    print(f"Injecting failure into: {target_service}")
-    
-    # 1. Generate Labels (y)
-    # 1 for Root Cause, 0 for healthy or cascading failure
-    labels = torch.zeros(num_nodes, dtype=torch.float)
-    labels[root_cause_index] = 1.0
-    
-    # 2. Inject Semantic Jitter into Feature Matrix (X)
-    # We simulate a failure by spiking the latent features of the target node
-    x = torch.randn(num_nodes, 775)
-    x[root_cause_index] += 5.0 # Distinctive spike for root cause
-    
-    # Simulate propagation (neighbors also get slightly "sick")
-    for edge in graph['edges']:
-        if edge['source'] == target_service:
-            # Find the index of target service workload
-            # For simplicity in this mock, we skip complex matching
-            pass
-
-    print("Chaos data generated.")
-    return x, labels
+    It picks a service as the root cause, injects a fault into its features
+    and cascades symptoms to its neighbors, and returns the labels for training.
+    Build a ChaosSimulator once to generate many scenarios per call.
+    """
+    if verbose:
+        print("Simulating Chaos...")
+
+    simulator = ChaosSimulator(graph)
+    x, labels, roots, faults = simulator.simulate(1, generator)
+
+    if verbose:
+        target_service = simulator.node_ids[int(roots[0])]
+        print(f"Injecting {FAULT_TYPES[int(faults[0])]} failure into: {target_service}")
+        print("Chaos data generated.")
+    return x[0], labels[0]
 
 if __name__ == "__main__":
-    mock_graph = {"nodes": [{"id": "auth"}, {"id": "cart"}, {"id": "db"}], "edges": []}
+    mock_graph = {"nodes": [{"id": "auth"}, {"id": "cart"}, {"id": "db"}],
+                  "edges": [{"source": "auth", "target": "db"}, {"source": "cart", "target": "db"}]}
     x, y = simulate_chaos(mock_graph)
     print(f"Labels: {y}")
+
+    simulator = ChaosSimulator(synthetic_topology(500))
+    x, y, roots, faults = simulator.simulate(256)
+    print(f"Batch: x {tuple(x.shape)}, {int(y.sum())} labeled root causes")
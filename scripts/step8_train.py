@@ -1,45 +1,159 @@
+import os
+import time
+import argparse
 import torch
-from step6_model import LogWhispererBrain
-from step7_chaos_simulator import simulate_chaos
+from torch_geometric.data import Data
+from torch_geometric.loader import DataLoader
+from step6_model import LogWhispererBrain, TemporalLogWhispererBrain
+from step7_chaos_simulator import ChaosSimulator, synthetic_topology
 
-def train_brain():
+# Configuration
+FEATURE_DIM = 775
+HIDDEN_DIM = 16
+CHECKPOINT_DIR = "checkpoints"
+MODEL_PATH = "log_whisperer_v1.pth"  # Best weights, as loaded by step9
+TEMPORAL_MODEL_PATH = "log_whisperer_temporal_v1.pth"  # Same for the temporal variant
+
+class ChaosGraphDataset(torch.utils.data.Dataset):
+    """
+    Chaos graphs generated on demand. Sample i is fully determined by
+    (seed, i), so DataLoader workers can generate samples in parallel and
+    every epoch sees the same dataset. A small pool of topologies is shared
+    across samples; pregenerate=True materializes all samples up front.
+
+    With window=W each sample is a chaos sequence whose fault ramps up over
+    W snapshots, stored node-major as x [N, W, D] so PyG batches it along
+    the node dimension (see model_input).
+    """
+    def __init__(self, num_graphs, num_nodes=500, num_topologies=8, seed=0, pregenerate=False, window=None):
+        self.num_graphs = num_graphs
+        self.seed = seed
+        self.window = window
+        self.simulators = [ChaosSimulator(synthetic_topology(num_nodes, seed=seed * 1000 + t))
+                           for t in range(num_topologies)]
+        self._cache = [self._generate(i) for i in range(num_graphs)] if pregenerate else None
+
+    def __len__(self):
+        return self.num_graphs
+
+    def _generate(self, i):
+        simulator = self.simulators[i % len(self.simulators)]
+        generator = torch.Generator().manual_seed(self.seed * 1_000_003 + i)
+        if self.window:
+            x, y, _, _ = simulator.simulate_sequence(1, self.window, generator)
+            return Data(x=x[0].transpose(0, 1), edge_index=simulator.edge_index, y=y[0].view(-1, 1))
+        x, y, _, _ = simulator.simulate(1, generator)
+        return Data(x=x[0], edge_index=simulator.edge_index, y=y[0].view(-1, 1))
+
+    def __getitem__(self, i):
+        return self._cache[i] if self._cache is not None else self._generate(i)
+
+def model_input(batch, temporal=False):
+    # Temporal batches are [N, W, D]; the model takes [W, N, D]
+    return batch.x.transpose(0, 1) if temporal else batch.x
+
+def save_checkpoint(path, model, optimizer, epoch, best_val, bad_epochs):
+    tmp = f"{path}.tmp"
+    torch.save({
+        "epoch": epoch,
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "best_val": best_val,
+        "bad_epochs": bad_epochs,
+    }, tmp)
+    os.replace(tmp, path)
+
+def evaluate(model, loader, loss_fn, temporal=False):
+    model.eval()
+    total, graphs = 0.0, 0
+    with torch.no_grad():
+        for batch in loader:
+            out = model(model_input(batch, temporal), batch.edge_index)
+            total += loss_fn(out, batch.y).item() * batch.num_graphs
+            graphs += batch.num_graphs
+    return total / max(graphs, 1)
+
+def train_brain(num_nodes=500, train_graphs=2000, val_graphs=200, batch_size=32, epochs=100, lr=0.01,
+                num_workers=2, patience=5, checkpoint_dir=CHECKPOINT_DIR, checkpoint_every=1, resume=True,
+                window=None):
     # 1. Hyperparameters
-    FEATURE_DIM = 775
-    HIDDEN_DIM = 16
-    lr = 0.01
-    epochs = 100
-    
-    # 2. Initialize Model & Optimizer
-    model = LogWhispererBrain(in_channels=FEATURE_DIM, hidden_channels=HIDDEN_DIM, out_channels=1)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    temporal = bool(window)
+    last_path = os.path.join(checkpoint_dir, "last_temporal.pt" if temporal else "last.pt")
+    model_path = TEMPORAL_MODEL_PATH if temporal else MODEL_PATH
+
+    # 2. Initialize Model & Optimizer (window=W trains the temporal variant on W-step sequences)
+    brain = TemporalLogWhispererBrain if temporal else LogWhispererBrain
+    model = brain(in_channels=FEATURE_DIM, hidden_channels=HIDDEN_DIM, out_channels=1)
     optimizer = torch.optim.Adam(model.parameters(), lr=lr)
-    loss_fn = torch.nn.BCEWithLogitsLoss()
-    
-    # 3. Training Loop
-    model.train()
+    # One root cause per graph: weight positives so the model cannot win by predicting "healthy"
+    loss_fn = torch.nn.BCEWithLogitsLoss(pos_weight=torch.tensor([float(num_nodes - 1)]))
+
+    start_epoch, best_val, bad_epochs = 0, float("inf"), 0
+    if resume and os.path.exists(last_path):
+        state = torch.load(last_path, map_location="cpu")
+        model.load_state_dict(state["model"])
+        optimizer.load_state_dict(state["optimizer"])
+        start_epoch, best_val, bad_epochs = state["epoch"] + 1, state["best_val"], state["bad_epochs"]
+        print(f"Resuming from epoch {start_epoch} (best val loss {best_val:.4f})")
+
+    # 3. Data: chaos graphs generated in worker processes and batched by PyG
+    train_set = ChaosGraphDataset(train_graphs, num_nodes, seed=1, window=window)
+    val_set = ChaosGraphDataset(val_graphs, num_nodes, seed=2, window=window)
+    loader_kwargs = {"batch_size": batch_size, "num_workers": num_workers,
+                     "persistent_workers": num_workers > 0}
+    train_loader = DataLoader(train_set, shuffle=True, **loader_kwargs)
+    val_loader = DataLoader(val_set, shuffle=False, **loader_kwargs)
+
+    # 4. Training Loop
     print("Starting Training Loop...")
-    
-    mock_graph = {"nodes": [{"id": f"srv-{i}"} for i in range(10)], "edges": []}
-    
-    # Mock Edge Index (Fully connected for simplicity in mock)
-    edge_index = torch.tensor([[0, 1], [1, 0]], dtype=torch.long) 
-    
-    for epoch in range(epochs):
-        # Fresh Chaos injection per epoch
-        x, y = simulate_chaos(mock_graph)
-        y = y.view(-1, 1)
-        
-        optimizer.zero_grad()
-        out = model(x, edge_index)
-        loss = loss_fn(out, y)
-        
-        loss.backward()
-        optimizer.step()
-        
-        if epoch % 10 == 0:
-            print(f"Epoch {epoch} | Loss: {loss.item():.4f}")
-            
+    for epoch in range(start_epoch, epochs):
+        model.train()
+        started = time.perf_counter()
+        total, graphs = 0.0, 0
+        for batch in train_loader:
+            optimizer.zero_grad()
+            out = model(model_input(batch, temporal), batch.edge_index)
+            loss = loss_fn(out, batch.y)
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * batch.num_graphs
+            graphs += batch.num_graphs
+        elapsed = time.perf_counter() - started
+
+        val_loss = evaluate(model, val_loader, loss_fn, temporal)
+        print(f"Epoch {epoch} | Loss: {total / max(graphs, 1):.4f} | Val: {val_loss:.4f} | "
+              f"{graphs / elapsed:.1f} graphs/sec")
+
+        if val_loss < best_val:
+            best_val, bad_epochs = val_loss, 0
+            torch.save(model.state_dict(), model_path)
+        else:
+            bad_epochs += 1
+
+        if (epoch + 1) % checkpoint_every == 0 or bad_epochs >= patience:
+            save_checkpoint(last_path, model, optimizer, epoch, best_val, bad_epochs)
+        if bad_epochs >= patience:
+            print(f"Early stopping: no improvement for {patience} epochs.")
+            break
+
     print("Training Complete. Model is now sensitive to system failures.")
-    torch.save(model.state_dict(), "log_whisperer_v1.pth")
+    return model
 
 if __name__ == "__main__":
-    train_brain()
+    parser = argparse.ArgumentParser(description="Train the LogWhisperer GNN brain")
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--train-graphs", type=int, default=2000)
+    parser.add_argument("--val-graphs", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--patience", type=int, default=5)
+    parser.add_argument("--no-resume", action="store_true")
+    parser.add_argument("--temporal", type=int, default=None, metavar="W",
+                        help="Train the temporal variant on W-snapshot sequences")
+    args = parser.parse_args()
+
+    train_brain(num_nodes=args.nodes, train_graphs=args.train_graphs, val_graphs=args.val_graphs,
+                batch_size=args.batch_size, epochs=args.epochs, num_workers=args.workers,
+                patience=args.patience, resume=not args.no_resume, window=args.temporal)
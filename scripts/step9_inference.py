@@ -1,69 +1,378 @@
+import os
+import time
+import hashlib
+import queue
+import threading
+import argparse
+from collections import deque
 import torch
-import json
 import numpy as np
-from step6_model import LogWhispererBrain
-from step10_explainer import explain_prediction
-from step11_remediation import suggest_remediation
-from step12_notifier import send_alert
+from step6_model import (LogWhispererBrain, TemporalLogWhispererBrain, IncrementalInference, TemporalInference,
+                         quantize_brain)
+from feature_store import FeatureStore, FEATURE_DIM
+from lazy_loader import timed, report_startup
+from telemetry import INFERENCE_SECONDS, NODES_SCORED
 
-def run_inference(live_graph_data):
+# Configuration
+CHECKPOINT_PATH = "log_whisperer_v1.pth"
+QUANTIZED_CHECKPOINT_PATH = "log_whisperer_v1_int8.pth"  # Written by quantize_models.py
+QUANTIZED = os.environ.get("LOGWHISPERER_QUANTIZED", "0") == "1"
+TEMPORAL_CHECKPOINT_PATH = "log_whisperer_temporal_v1.pth"  # Written by step8 --temporal
+TEMPORAL_WINDOW = int(os.environ.get("LOGWHISPERER_TEMPORAL_WINDOW", 0))  # Snapshots per node; 0 = static model
+HIDDEN_DIM = 16
+ALERT_THRESHOLD = 0.8
+
+def file_digest(path):
+    """
+    SHA-256 of a checkpoint file (None if it does not exist); ties an int8
+    export to the fp32 weights it was quantized from.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_live_graph(store=None, window=None):
+    """
+    Loads the fused node matrix written by the graph builder. The memory-mapped
+    array is wrapped by torch without copying.
+    """
+    frame = (store or FeatureStore()).read("graph", window)
+    return {
+        "nodes": [{"id": service} for service in frame.services],
+        "x": torch.from_numpy(frame.values)
+    }
+
+class LatencyTracker:
+    """
+    Keeps the most recent scoring latencies (ms) for p50/p99 reporting.
+    """
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+
+    def percentile(self, p):
+        return float(np.percentile(self.samples, p)) if self.samples else 0.0
+
+    def summary(self):
+        return {"count": self.count, "p50_ms": self.percentile(50), "p99_ms": self.percentile(99)}
+
+class InferenceServer:
+    """
+    Long-lived RCA scorer: the checkpoint is loaded once, edge_index is cached
+    until the topology changes, and graph snapshots can be fed through a
+    bounded queue to a background worker.
+
+    compile_mode: None (eager), "torchscript" (script, falling back to trace
+    on the first snapshot) or "compile" (torch.compile).
+    incremental: reuse the previous tick's layer-1 embeddings and logits and
+    recompute only the 2-hop neighborhood of changed nodes (eager only).
+    quantized: score with the int8 model from quantized_path, or quantize the
+    fp32 checkpoint on load if it has not been exported.
+    temporal_window: score with the temporal model from temporal_path over
+    the last temporal_window snapshots, one per score() call (eager fp32 only).
+    """
+    def __init__(self, checkpoint_path=CHECKPOINT_PATH, hidden_dim=HIDDEN_DIM, num_threads=None,
+                 compile_mode=None, queue_size=4, on_result=None, incremental=False,
+                 quantized=QUANTIZED, quantized_path=QUANTIZED_CHECKPOINT_PATH, temporal_window=TEMPORAL_WINDOW,
+                 temporal_path=TEMPORAL_CHECKPOINT_PATH):
+        if temporal_window and (incremental or quantized or compile_mode):
+            raise ValueError("Temporal scoring supports neither incremental, quantized nor compiled mode")
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        # 1. Load the "Brain" once
+        if temporal_window:
+            self.model = TemporalLogWhispererBrain(in_channels=FEATURE_DIM, hidden_channels=hidden_dim, out_channels=1)
+            checkpoint_path = temporal_path
+        else:
+            self.model = LogWhispererBrain(in_channels=FEATURE_DIM, hidden_channels=hidden_dim, out_channels=1)
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self.model.load_state_dict(torch.load(checkpoint_path, map_location="cpu"))
+            print(f"Loaded checkpoint {checkpoint_path}")
+        else:
+            print(f"Warning: checkpoint {checkpoint_path} not found, scoring with untrained weights.")
+        self.model.eval()
+        # Gradient explanations (step 10) need the differentiable fp32 weights
+        self.explain_model = self.model
+        if quantized:
+            self.model = quantize_brain(self.model)
+            if quantized_path and os.path.exists(quantized_path):
+                exported = torch.load(quantized_path, map_location="cpu", weights_only=False)
+                if exported.get("source_digest", "missing") == file_digest(checkpoint_path):
+                    self.model.load_state_dict(exported["state_dict"])
+                    print(f"Loaded int8 checkpoint {quantized_path}")
+                else:
+                    print(f"Warning: {quantized_path} was not exported from {checkpoint_path}; "
+                          f"quantizing on load instead. Re-run quantize_models.py.")
+
+        self.compile_mode = compile_mode
+        self._scorer = self.model
+        self._optimized = compile_mode is None
+        if compile_mode == "compile":
+            self._scorer = torch.compile(self.model)
+            self._optimized = True
+
+        self._edge_key = None
+        self._edge_index = None
+        self.incremental = IncrementalInference(self.model) if incremental else None
+        self.temporal = TemporalInference(self.model, temporal_window) if temporal_window else None
+
+        self.latency = LatencyTracker()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.on_result = on_result
+        self._worker = None
+
+    def _optimize(self, x, edge_index):
+        # GATConv is not always scriptable; tracing works because the graph
+        # structure only enters through tensor inputs.
+        try:
+            self._scorer = torch.jit.script(self.model)
+        except Exception:
+            self._scorer = torch.jit.trace(self.model, (x, edge_index), check_trace=False)
+        self._optimized = True
+
+    def _resolve_edge_index(self, graph, node_ids):
+        """
+        Returns the cached edge_index while the topology version is unchanged;
+        otherwise takes it from the snapshot, builds it from named edges, or
+        falls back to a ring over the nodes.
+        """
+        version = graph.get('topology_version')
+        if version is not None and version == self._edge_key:
+            return self._edge_index
+
+        if 'edge_index' in graph:
+            edge_index = graph['edge_index']
+        elif 'edges' in graph:
+            from step5_graph_builder import build_edge_index
+            edge_index, _ = build_edge_index(node_ids, graph['edges'])
+        else:
+            num_nodes = len(node_ids)
+            edge_index = torch.tensor([[i, (i+1)%num_nodes] for i in range(num_nodes)], dtype=torch.long).t()
+
+        if version is not None:
+            self._edge_key, self._edge_index = version, edge_index
+        return edge_index
+
+    def score(self, graph):
+        """
+        Scores one snapshot. Accepts the graph builder's Data/dict
+        (x, edge_index, node_ids) or the legacy {"nodes": [...feature_vector]} form.
+        In incremental mode an optional "changed" list of node indices skips
+        the comparison against the previous snapshot. In temporal mode each
+        call also appends the snapshot to the per-node history.
+        Returns (node_ids, probabilities, x, edge_index).
+        """
+        if 'node_ids' in graph:
+            node_ids = list(graph['node_ids'])
+        else:
+            node_ids = [n['id'] for n in graph['nodes']]
+        if 'x' in graph:
+            x = graph['x']
+        else:
+            x = torch.tensor([n['feature_vector'] for n in graph['nodes']], dtype=torch.float)
+        edge_index = self._resolve_edge_index(graph, node_ids)
+
+        start = time.perf_counter()
+        with torch.inference_mode():
+            if self.incremental is not None:
+                logits = self.incremental(x, edge_index, graph.get('changed'))
+            elif self.temporal is not None:
+                logits = self.temporal(x, edge_index, node_ids)
+            else:
+                if not self._optimized:
+                    self._optimize(x, edge_index)
+                logits = self._scorer(x, edge_index)
+            probabilities = torch.sigmoid(logits).view(-1).numpy()
+        elapsed = time.perf_counter() - start
+        self.latency.record(elapsed * 1000)
+        INFERENCE_SECONDS.observe(elapsed)
+        NODES_SCORED.inc(len(node_ids))
+        return node_ids, probabilities, x, edge_index
+
+    def warmup(self, num_nodes=64, avg_degree=4, alerts=True):
+        """
+        Pays the one-off costs before the first real snapshot: kernel and
+        allocator warmup, TorchScript tracing, and (with alerts) importing
+        the step 10-12 chain and starting the alert pipeline. Leaves the
+        latency stats and the edge_index cache untouched.
+        """
+        with timed("warmup inference server"):
+            graph = {
+                "node_ids": [f"warmup-{i}" for i in range(num_nodes)],
+                "x": torch.zeros(num_nodes, FEATURE_DIM),
+                "edge_index": torch.randint(0, num_nodes, (2, num_nodes * avg_degree)),
+            }
+            latency, self.latency = self.latency, LatencyTracker()
+            self.score(graph)
+            self.latency = latency
+            if self.incremental is not None:
+                self.incremental.reset()
+            if self.temporal is not None:
+                self.temporal.reset()
+            if alerts:
+                from alert_pipeline import get_alert_pipeline
+                get_alert_pipeline(model=self.explain_model)
+        return self
+
+    @staticmethod
+    def rank(node_ids, probabilities):
+        order = np.argsort(-probabilities, kind="stable")
+        return [{"service": node_ids[i], "score": float(probabilities[i])} for i in order]
+
+    def process(self, graph):
+        node_ids, probabilities, _, _ = self.score(graph)
+        return self.rank(node_ids, probabilities)
+
+    # --- Queue-driven serving ---
+    def submit(self, graph, block=True, timeout=None):
+        """
+        Enqueues a snapshot; blocks when the queue is full so producers feel backpressure.
+        """
+        self.queue.put(graph, block=block, timeout=timeout)
+
+    def _serve(self):
+        while True:
+            graph = self.queue.get()
+            if graph is None:
+                break
+            try:
+                rankings = self.process(graph)
+                if self.on_result:
+                    self.on_result(rankings)
+            except Exception as e:
+                print(f"Inference error: {e}")
+            finally:
+                self.queue.task_done()
+
+    def start(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._serve, name="rca-inference", daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self):
+        if self._worker is not None:
+            self.queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+_server = None
+
+def get_server(**kwargs):
+    """
+    Returns the process-wide InferenceServer, creating it on first use.
+    """
+    global _server
+    if _server is None:
+        _server = InferenceServer(**kwargs)
+    return _server
+
+def run_inference(live_graph_data=None, store=None, server=None, alerts=None):
     """
     Simulates a real-time RCA inference run with Industrial Extensions.
+    With no live_graph_data, node features are loaded from the feature store.
+    Explanation, remediation and notification (steps 10-12) are handed to the
+    asynchronous alert pipeline so scoring never waits on webhook I/O.
     """
+    if live_graph_data is None:
+        live_graph_data = load_live_graph(store)
+
     print("--- LogWhisperer: Real-time RCA Run (Industrial) ---")
-    
-    # 1. Load the "Brain"
-    FEATURE_DIM = 775
-    model = LogWhispererBrain(in_channels=FEATURE_DIM, hidden_channels=16, out_channels=1)
-    model.eval()
-
-    # 2. Prepare Live Data
-    nodes = live_graph_data['nodes']
-    num_nodes = len(nodes)
-    x = torch.tensor([n['feature_vector'] for n in nodes], dtype=torch.float)
-    edge_index = torch.tensor([[i, (i+1)%num_nodes] for i in range(num_nodes)], dtype=torch.long).t()
-
-    # 3. Predict Root Cause
-    with torch.no_grad():
-        logits = model(x, edge_index)
-        probabilities = torch.sigmoid(logits).squeeze().numpy()
-
-    # 4. Rank & Explain & Act
+    server = server or get_server()
+
+    # 1-3. Score with the persistent model
+    node_ids, probabilities, x, edge_index = server.score(live_graph_data)
+
+    # 4. Rank, and hand flagged nodes to steps 10-12
     rankings = []
+    flagged = []
     for i, prob in enumerate(probabilities):
-        score = float(prob)
-        service_id = nodes[i]['id']
-        
         report = {
-            "service": service_id,
-            "score": score
+            "service": node_ids[i],
+            "score": float(prob)
         }
-        
-        if score > 0.8:
-            # Step 10: Explain
-            explanation = explain_prediction(service_id, x[i].numpy())
-            report["explanation"] = explanation
-            
-            # Step 11: Remediation
-            remediation = suggest_remediation(service_id, explanation)
-            report["remediation"] = remediation
-            
-            # Step 12: Notification
-            send_alert(report)
-            
+        if report["score"] > ALERT_THRESHOLD:
+            flagged.append(dict(report, index=i))
         rankings.append(report)
 
+    if flagged:
+        if alerts is None:
+            from alert_pipeline import get_alert_pipeline
+            alerts = get_alert_pipeline(model=server.explain_model)
+        # The temporal model explains and fingerprints with the window it scored
+        history = server.temporal.history() if server.temporal is not None else None
+        alerts.submit(flagged, x, edge_index, node_ids, probabilities, history=history)
+
     # Sort by probability descending
     rankings = sorted(rankings, key=lambda x: x['score'], reverse=True)
-    
+
     print("\n--- Final Rankings ---")
     for r in rankings:
-        status = "🚨 ALERT" if r['score'] > 0.8 else "✅ OK"
+        status = "🚨 ALERT" if r['score'] > ALERT_THRESHOLD else "✅ OK"
         print(f"[{status}] {r['service']} (Score: {r['score']:.4f})")
-    
+
     return rankings
 
+def benchmark_server(num_nodes=1000, avg_degree=4, ticks=200, changed_fraction=0.0, **server_kwargs):
+    """
+    Measures steady-state scoring latency on a random mesh of num_nodes services.
+    changed_fraction of the nodes get new features every tick.
+    """
+    server = InferenceServer(**server_kwargs)
+    graph = {
+        "node_ids": [f"srv-{i}" for i in range(num_nodes)],
+        "x": torch.randn(num_nodes, FEATURE_DIM),
+        "edge_index": torch.randint(0, num_nodes, (2, num_nodes * avg_degree)),
+        "topology_version": 1,
+    }
+    for _ in range(5):
+        server.score(graph)  # Warmup (and trace/compile)
+    server.latency = LatencyTracker()
+    num_changed = int(changed_fraction * num_nodes)
+    for _ in range(ticks):
+        if num_changed:
+            changed = torch.randperm(num_nodes)[:num_changed]
+            graph["x"] = graph["x"].clone()
+            graph["x"][changed] = torch.randn(num_changed, FEATURE_DIM)
+            graph["changed"] = changed
+        server.score(graph)
+    summary = server.latency.summary()
+    print(f"{num_nodes} nodes: p50 {summary['p50_ms']:.2f} ms, p99 {summary['p99_ms']:.2f} ms")
+    return summary
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LogWhisperer real-time inference")
+    parser.add_argument("--benchmark", action="store_true", help="Report p50/p99 scoring latency")
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--compile", choices=["torchscript", "compile"], default=None)
+    parser.add_argument("--incremental", action="store_true", help="Recompute only around changed nodes")
+    parser.add_argument("--quantized", action="store_true", default=QUANTIZED, help="Score with the int8 model")
+    parser.add_argument("--temporal", type=int, default=TEMPORAL_WINDOW, metavar="W",
+                        help="Score with the temporal model over the last W snapshots")
+    parser.add_argument("--changed", type=float, default=0.01, help="Fraction of nodes changing per benchmark tick")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_server(args.nodes, changed_fraction=args.changed, num_threads=args.threads,
+                         compile_mode=args.compile, incremental=args.incremental, quantized=args.quantized,
+                         temporal_window=args.temporal)
+        raise SystemExit(0)
+
+    with timed("start inference server"):
+        server = get_server(num_threads=args.threads, compile_mode=args.compile, incremental=args.incremental,
+                            quantized=args.quantized, temporal_window=args.temporal)
+    server.warmup()
+
     # Mock live data
     mock_live_data = {
         "nodes": [
@@ -72,5 +381,9 @@ if __name__ == "__main__":
             {"id": "payment-db", "feature_vector": np.random.randn(775).tolist()}
         ]
     }
-    
+
     run_inference(mock_live_data)
+    report_startup("first output")
+
+    from alert_pipeline import get_alert_pipeline
+    get_alert_pipeline().stop()
@@ -0,0 +1,138 @@
+import json
+import numpy as np
+from step7_chaos_simulator import synthetic_topology
+
+# Configuration
+NAMESPACE_SIZE = 50      # Services per synthetic namespace
+LOG_VERBS = ["Connection refused to", "Read timed out from", "Cache miss for key", "Retrying call to",
+             "Slow query on", "User login for", "Request served by", "Pod restarted in"]
+
+class SyntheticMesh:
+    """
+    A power-law service mesh (preferential-attachment call graph from step 7)
+    with matching telemetry generators, sized for benchmarks:
+
+        topology      step 1 format: nodes, edges with RPS, namespaces, version
+        log_entries   Loki-style (timestamp, service, line) tuples
+        metric_rows   step 3 raw rows, one per service per scrape
+        jaeger_export Jaeger JSON whose traces follow the call graph
+
+    fan="out" (default) gives the call graph power-law fan-out: a few
+    gateway/aggregator services call hundreds of others while each service
+    has about avg_degree callers. fan="in" keeps step 7's direction instead:
+    each service calls about avg_degree others and shared backends collect
+    power-law fan-in.
+
+    Everything is derived from `seed`, so two runs produce the same mesh.
+    """
+    def __init__(self, num_services, avg_degree=2, seed=0, namespace_size=NAMESPACE_SIZE, fan="out"):
+        if fan not in ("out", "in"):
+            raise ValueError(f"Unknown fan direction: {fan}")
+        self.num_services = num_services
+        self.seed = seed
+        graph = synthetic_topology(num_services, avg_fan_out=avg_degree, seed=seed)
+        if fan == "out":
+            # Preferential attachment concentrates in-degree; reversing every call moves it to out-degree
+            graph['edges'] = [{"source": e['target'], "target": e['source']} for e in graph['edges']]
+        self.services = [n['id'] for n in graph['nodes']]
+        rng = np.random.default_rng(seed)
+        self.edges = [dict(e, requests_per_second=float(rng.lognormal(3.0, 1.0))) for e in graph['edges']]
+
+        index = {s: i for i, s in enumerate(self.services)}
+        self.callees = [[] for _ in self.services]
+        for e in self.edges:
+            self.callees[index[e['source']]].append(index[e['target']])
+        self.namespaces = {s: f"ns-{i // namespace_size}" for i, s in enumerate(self.services)}
+
+    def topology(self):
+        return {"nodes": list(self.services), "edges": [dict(e) for e in self.edges],
+                "namespaces": dict(self.namespaces), "version": 1}
+
+    def log_entries(self, lines_per_service=20, num_templates=300, start=0.0, duration=60.0):
+        """
+        Time-ordered (timestamp, service, line) tuples; message shapes are
+        Zipf-distributed over num_templates with random variable parts.
+        """
+        rng = np.random.default_rng(self.seed + 1)
+        shapes = [f"{LOG_VERBS[i % len(LOG_VERBS)]} backend-{i} after {{}} ms from {{}}" for i in range(num_templates)]
+        weights = 1.0 / np.arange(1, num_templates + 1)
+        total = lines_per_service * self.num_services
+
+        shape_ids = rng.choice(num_templates, size=total, p=weights / weights.sum())
+        services = np.repeat(np.arange(self.num_services), lines_per_service)
+        timestamps = np.sort(start + duration * rng.random(total))
+        rng.shuffle(services)
+        latencies = rng.integers(1, 5000, size=total)
+        ips = rng.integers(1, 255, size=(total, 4))
+        return [(float(ts), self.services[s], shapes[k].format(ms, ".".join(map(str, ip))))
+                for ts, s, k, ms, ip in zip(timestamps, services, shape_ids, latencies, ips)]
+
+    def metric_rows(self, steps=10):
+        """
+        Raw step 3 rows: `steps` scrapes per service around a per-service baseline.
+        """
+        rng = np.random.default_rng(self.seed + 2)
+        n = self.num_services
+        base = np.stack([rng.uniform(5, 60, n), rng.uniform(100, 2000, n),
+                         rng.uniform(10, 300, n), rng.uniform(0.0, 0.02, n)], axis=1)
+        rows = []
+        for t in range(steps):
+            values = base * rng.normal(1.0, 0.1, size=base.shape)
+            rows.extend({"timestamp": t, "service": s, "cpu_usage": v[0], "memory_usage": v[1],
+                         "latency_ms": v[2], "error_rate": v[3]}
+                        for s, v in zip(self.services, values.tolist()))
+        return rows
+
+    def jaeger_export(self, traces_per_service=1, max_depth=4, call_probability=0.6, error_rate=0.01,
+                      retry_rate=0.02):
+        """
+        Jaeger JSON ({"data": [...]}) with traces rooted at random services
+        that walk their callees down to max_depth; each call is taken with
+        call_probability, fails with error_rate and is retried with retry_rate.
+        """
+        rng = np.random.default_rng(self.seed + 3)
+        processes = {f"p{i}": {"serviceName": s} for i, s in enumerate(self.services)}
+        traces = []
+        for t in range(traces_per_service * self.num_services):
+            trace_id = f"t{t:x}"
+            spans = []
+
+            def visit(service, parent, depth, duration_us):
+                span_id = f"{len(spans):x}"
+                error = bool(rng.random() < error_rate)
+                spans.append({
+                    "traceID": trace_id, "spanID": span_id, "operationName": f"call-{service}",
+                    "references": [{"refType": "CHILD_OF", "traceID": trace_id, "spanID": parent}] if parent else [],
+                    "processID": f"p{service}", "duration": int(duration_us),
+                    "tags": [{"key": "error", "type": "bool", "value": True}] if error else [],
+                })
+                if depth >= max_depth:
+                    return
+                callees = [c for c in self.callees[service] if rng.random() < call_probability]
+                for callee in callees:
+                    share = duration_us * rng.uniform(0.2, 0.8) / len(callees)
+                    for _ in range(2 if rng.random() < retry_rate else 1):
+                        visit(callee, span_id, depth + 1, share)
+
+            visit(int(rng.integers(self.num_services)), None, 0, rng.lognormal(11.0, 0.5))
+            traces.append({"traceID": trace_id, "processes": processes, "spans": spans})
+        return {"data": traces}
+
+    def write_jaeger_export(self, path, **kwargs):
+        """
+        Writes the export as JSONL, one trace per line, as iter_span_batches streams it.
+        """
+        with open(path, "w") as f:
+            for trace in self.jaeger_export(**kwargs)["data"]:
+                # Each line only needs the processes its spans reference
+                used = {span["processID"] for span in trace["spans"]}
+                f.write(json.dumps(dict(trace, processes={p: trace["processes"][p] for p in used})) + "\n")
+        return path
+
+if __name__ == "__main__":
+    mesh = SyntheticMesh(1000)
+    topology = mesh.topology()
+    spans = sum(len(t["spans"]) for t in mesh.jaeger_export()["data"])
+    print(f"{len(topology['nodes'])} services, {len(topology['edges'])} edges, "
+          f"{len(set(topology['namespaces'].values()))} namespaces, {spans} spans, "
+          f"{len(mesh.log_entries())} log lines, {len(mesh.metric_rows())} metric rows")
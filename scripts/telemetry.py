@@ -0,0 +1,262 @@
+import os
+import time
+import atexit
+import bisect
+import cProfile
+import pstats
+import functools
+import threading
+from contextlib import contextmanager
+
+# Configuration
+METRICS_PORT = int(os.environ.get("LOGWHISPERER_METRICS_PORT", 9108))
+PROFILE_DIR = os.environ.get("LOGWHISPERER_PROFILE")  # Directory for per-stage cProfile dumps; unset = off
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Registry:
+    """
+    Holds every metric of the process and renders them in the Prometheus
+    text exposition format.
+    """
+    def __init__(self):
+        self.metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels: inc(2, result="hit").
+    """
+    kind = "counter"
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_text(self.labels, key)} {value}" for key, value in items]
+
+class Gauge(Counter):
+    """
+    Value that can go up and down: set(42, service="auth").
+    """
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram:
+    """
+    Cumulative-bucket histogram (seconds by default), optionally split by labels.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(name, "") for name in self.labels))
+        return series[-1] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = _label_text(self.labels, key, [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _label_text(self.labels, key, ['le="+Inf"'])
+            lines.append(f"{self.name}_bucket{le} {series[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {series[-1]}")
+        return lines
+
+# --- Pipeline metrics ---
+STAGE_SECONDS = Histogram("logwhisperer_stage_duration_seconds", "Wall time of one pipeline stage run.",
+                          labels=("stage",))
+LOG_LINES = Counter("logwhisperer_log_lines_total", "Log lines grouped into service windows.")
+TEMPLATES_EMBEDDED = Counter("logwhisperer_templates_embedded_total", "Log templates run through BERT.")
+CACHE_LOOKUPS = Counter("logwhisperer_embedding_cache_lookups_total", "Template embedding cache lookups.",
+                        labels=("result",))
+SPANS_ENCODED = Counter("logwhisperer_spans_encoded_total", "Trace spans encoded into service vectors.")
+INFERENCE_SECONDS = Histogram("logwhisperer_inference_duration_seconds", "GNN scoring latency per snapshot.")
+NODES_SCORED = Counter("logwhisperer_nodes_scored_total", "Services scored by the GNN.")
+ALERTS = Counter("logwhisperer_alerts_total", "Root-cause alerts by outcome.", labels=("outcome",))
+ALERT_DELIVERY_SECONDS = Histogram("logwhisperer_alert_delivery_seconds",
+                                   "Time from flagging a root cause to delivering its notification.")
+REMEDIATIONS = Counter("logwhisperer_remediations_total", "Remediation plans by status.", labels=("status",))
+TICKS = Counter("logwhisperer_pipeline_ticks_total", "Orchestrator ticks by outcome.", labels=("outcome",))
+
+# --- Profiling ---
+_profiles = {}  # stage -> pstats.Stats
+_profile_lock = threading.Lock()
+_profiling = threading.local()
+
+def _dump_profiles():
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    for stage, stats in _profiles.items():
+        stats.dump_stats(os.path.join(PROFILE_DIR, f"{stage}.prof"))
+    if _profiles:
+        print(f"Wrote cProfile stats for {len(_profiles)} stages to {PROFILE_DIR}/")
+
+if PROFILE_DIR:
+    atexit.register(_dump_profiles)
+
+_profiler_lock = threading.Lock()  # Only one cProfile can be active per process (3.12+)
+
+@contextmanager
+def _profiled(stage):
+    # One profiler at a time: nested stages are attributed to the outermost
+    # one, and stages running concurrently on other threads go unprofiled
+    if getattr(_profiling, "active", False) or not _profiler_lock.acquire(blocking=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        try:
+            profiler.enable()
+        except ValueError:  # Another profiling tool is already active
+            yield
+            return
+        _profiling.active = True
+        try:
+            yield
+        finally:
+            profiler.disable()
+            _profiling.active = False
+        with _profile_lock:
+            if stage in _profiles:
+                _profiles[stage].add(profiler)
+            else:
+                _profiles[stage] = pstats.Stats(profiler)
+    finally:
+        _profiler_lock.release()
+
+@contextmanager
+def stage_timer(stage):
+    """
+    Times the block into logwhisperer_stage_duration_seconds{stage=...}.
+    With LOGWHISPERER_PROFILE=<dir> the block is also profiled with cProfile
+    and the per-stage stats are written to <dir>/<stage>.prof at exit.
+    """
+    start = time.perf_counter()
+    try:
+        if PROFILE_DIR:
+            with _profiled(stage):
+                yield
+        else:
+            yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+def timed_stage(stage):
+    """
+    Decorator form of stage_timer for functions that are one stage.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# --- /metrics endpoint ---
+def serve_metrics(port=METRICS_PORT, host="0.0.0.0"):
+    """
+    Serves /metrics on a daemon thread and returns the HTTP server. http.server
+    is imported here so that steps importing telemetry only for timers skip it.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        registry = REGISTRY
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = self.registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="rca-metrics", daemon=True).start()
+    print(f"Serving Prometheus metrics on http://{host}:{server.server_port}/metrics")
+    return server
+
+if __name__ == "__main__":
+    with stage_timer("example"):
+        time.sleep(0.01)
+    ALERTS.inc(outcome="sent")
+    print(REGISTRY.render())
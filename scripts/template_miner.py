@@ -0,0 +1,192 @@
+import re
+import json
+import os
+
+# Variable parts of a log line, tried left to right in a single pass.
+# IPs must come before plain numbers, otherwise the digits get masked first
+# and the address never becomes <IP>.
+MASK_PATTERN = re.compile(
+    r'(?P<IP>\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b)'
+    r'|(?P<HEX>\b0x[0-9a-fA-F]+\b)'
+    r'|(?P<ID>\d+)'
+)
+WILDCARD = "<*>"
+
+
+def mask_variables(log_message):
+    """
+    Replaces IPs, hex literals and numbers with placeholders in one regex pass.
+    """
+    return MASK_PATTERN.sub(lambda m: f"<{m.lastgroup}>", log_message)
+
+
+class LogCluster:
+    def __init__(self, cluster_id, tokens, path, size=1):
+        self.cluster_id = cluster_id
+        self.tokens = tokens
+        self.path = path  # Tree path chosen at creation, kept so reloads land in the same leaf
+        self.size = size
+
+    @property
+    def template(self):
+        return " ".join(self.tokens)
+
+
+class TemplateMiner:
+    """
+    Online Drain-style template miner.
+
+    Lines are routed through a fixed-depth parse tree (token count, then the
+    first few tokens) to a small leaf of candidate clusters, so the per-line
+    cost stays O(tokens) no matter how much history has been seen. Cluster IDs
+    are assigned once and never reused, giving a stable template-ID table
+    that can be saved and reloaded across runs.
+    """
+    def __init__(self, depth=4, sim_threshold=0.4, max_children=100):
+        if depth < 3:
+            raise ValueError("depth must be at least 3")
+        self.depth = depth
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.clusters = {}
+        self.root = {}
+        self._next_id = 1
+
+    # --- Tree routing ---
+    def _prefix(self, tokens):
+        prefix = [str(len(tokens))]
+        for token in tokens[:self.depth - 2]:
+            # Tokens that still carry digits or placeholders are variables, not structure
+            if token.startswith("<") or any(c.isdigit() for c in token):
+                token = WILDCARD
+            prefix.append(token)
+        return prefix
+
+    def _leaf(self, path, create):
+        node = self.root
+        for i, token in enumerate(path):
+            is_last = i == len(path) - 1
+            child = node.get(token)
+            if child is None:
+                if not create:
+                    child = node.get(WILDCARD)
+                    if child is None:
+                        return None
+                else:
+                    if token != WILDCARD and len(node) >= self.max_children:
+                        token = WILDCARD
+                    child = node.setdefault(token, [] if is_last else {})
+            path[i] = token
+            node = child
+        return node
+
+    # --- Similarity ---
+    @staticmethod
+    def _similarity(template_tokens, tokens):
+        same = 0
+        params = 0
+        for a, b in zip(template_tokens, tokens):
+            if a == WILDCARD:
+                params += 1
+            elif a == b:
+                same += 1
+        return same / len(tokens), params
+
+    def _best_match(self, leaf, tokens):
+        best, best_sim, best_params = None, -1.0, -1
+        for cluster_id in leaf:
+            cluster = self.clusters[cluster_id]
+            sim, params = self._similarity(cluster.tokens, tokens)
+            if sim > best_sim or (sim == best_sim and params > best_params):
+                best, best_sim, best_params = cluster, sim, params
+        if best is not None and best_sim >= self.sim_threshold:
+            return best
+        return None
+
+    # --- Public API ---
+    def add(self, log_message):
+        """
+        Routes a raw log line to its cluster, creating or generalizing the
+        template as needed. Returns (template_id, template).
+        """
+        tokens = mask_variables(log_message).split()
+        if not tokens:
+            tokens = [""]
+        path = self._prefix(tokens)
+        leaf = self._leaf(path, create=True)
+
+        cluster = self._best_match(leaf, tokens)
+        if cluster is None:
+            cluster = LogCluster(self._next_id, tokens, path)
+            self.clusters[cluster.cluster_id] = cluster
+            leaf.append(cluster.cluster_id)
+            self._next_id += 1
+        else:
+            cluster.size += 1
+            cluster.tokens = [a if a == b else WILDCARD for a, b in zip(cluster.tokens, tokens)]
+        return cluster.cluster_id, cluster.template
+
+    def match(self, log_message):
+        """
+        Looks up the cluster for a line without updating the miner.
+        Returns (template_id, template) or (None, masked line).
+        """
+        masked = mask_variables(log_message)
+        tokens = masked.split() or [""]
+        leaf = self._leaf(self._prefix(tokens), create=False)
+        cluster = self._best_match(leaf, tokens) if leaf else None
+        if cluster is None:
+            return None, masked
+        return cluster.cluster_id, cluster.template
+
+    def template(self, template_id):
+        return self.clusters[template_id].template
+
+    def __len__(self):
+        return len(self.clusters)
+
+    def save(self, path):
+        state = {
+            "depth": self.depth,
+            "sim_threshold": self.sim_threshold,
+            "max_children": self.max_children,
+            "next_id": self._next_id,
+            "clusters": [
+                {"id": c.cluster_id, "tokens": c.tokens, "path": c.path, "size": c.size}
+                for c in self.clusters.values()
+            ],
+        }
+        with open(path, "w") as f:
+            json.dump(state, f)
+
+    @classmethod
+    def load(cls, path, **defaults):
+        """
+        Restores a miner saved with save(); returns a fresh miner if the file is missing.
+        """
+        if not os.path.exists(path):
+            return cls(**defaults)
+        with open(path, "r") as f:
+            state = json.load(f)
+        miner = cls(depth=state["depth"], sim_threshold=state["sim_threshold"],
+                    max_children=state["max_children"])
+        for entry in state["clusters"]:
+            cluster = LogCluster(entry["id"], entry["tokens"], entry["path"], entry["size"])
+            miner.clusters[cluster.cluster_id] = cluster
+            miner._leaf(list(cluster.path), create=True).append(cluster.cluster_id)
+        miner._next_id = state["next_id"]
+        return miner
+
+
+if __name__ == "__main__":
+    miner = TemplateMiner()
+    for line in [
+        "Connection refused to 192.168.1.10",
+        "Connection refused to 10.0.0.7:8080",
+        "User 501 logged in successfully",
+        "User 77 logged in successfully",
+        "User alice logged in successfully",
+        "Read timed out from database cluster",
+    ]:
+        template_id, template = miner.add(line)
+        print(f"[{template_id}] {template}")
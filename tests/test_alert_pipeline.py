@@ -0,0 +1,196 @@
+import time
+import pytest
+import torch
+from alert_pipeline import AlertPipeline, start_stub_webhook
+
+@pytest.fixture
+def webhook():
+    server, url, received = start_stub_webhook(webhook_delay=0.05)
+    yield url, received
+    server.shutdown()
+
+def reports_for(services):
+    return [{"service": f"srv-{i}", "score": 0.9, "index": i} for i in services]
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_submit_never_blocks_and_counts_drops(webhook):
+    url, received = webhook
+    pipeline = AlertPipeline(webhook_url=url, cooldown_seconds=0.0, batch_wait=0.0, queue_size=2,
+                             notify_workers=1).start()
+    x = torch.randn(10, 775)
+    took = []
+    accepted = 0
+    for _ in range(50):
+        start = time.perf_counter()
+        accepted += pipeline.submit(reports_for(range(10)), x)
+        took.append(time.perf_counter() - start)
+    pipeline.stop()
+
+    assert max(took) < 0.02  # A 50 ms webhook never stalls the caller
+    assert pipeline.stats["dropped"] > 0
+    assert pipeline.stats["submitted"] == 10 * accepted
+    assert pipeline.stats["submitted"] + pipeline.stats["dropped"] == 500
+    assert pipeline.stats["sent"] == sum(len(p["attachments"]) for p in received)
+
+def test_cooldown_suppresses_repeat_alerts(webhook):
+    url, received = webhook
+    pipeline = AlertPipeline(webhook_url=url, cooldown_seconds=60.0, batch_wait=0.0).start()
+    x = torch.randn(10, 775)
+    pipeline.submit(reports_for([1, 2, 3]), x)
+    assert wait_for(lambda: pipeline.stats["sent"] == 3)
+    pipeline.submit(reports_for([2, 3, 4]), x)
+    pipeline.stop()
+
+    assert pipeline.stats["suppressed"] == 2
+    assert pipeline.stats["sent"] == 4
+    services = [a["fields"][0]["value"] for p in received for a in p["attachments"]]
+    assert sorted(services) == ["srv-1", "srv-2", "srv-3", "srv-4"]
+
+def test_max_batch_folds_reports_into_few_notifications(webhook):
+    url, received = webhook
+    pipeline = AlertPipeline(webhook_url=url, cooldown_seconds=0.0, max_batch=5, batch_wait=0.2).start()
+    x = torch.randn(20, 775)
+    for services in ([0, 1, 2], [3, 4, 5, 6], [7, 8, 9, 10, 11]):
+        pipeline.submit(reports_for(services), x)
+    pipeline.stop()
+
+    sizes = sorted(len(p["attachments"]) for p in received)
+    assert sum(sizes) == 12
+    assert max(sizes) <= 5
+    assert len(received) < 12  # Several root causes per message
+
+def test_failed_delivery_does_not_start_cooldown():
+    delivered = []
+
+    def flaky_notify(reports, webhook_url):
+        if not delivered:
+            delivered.append(None)
+            raise ConnectionError("webhook down")
+        delivered.append([r["service"] for r in reports])
+
+    pipeline = AlertPipeline(notify=flaky_notify, cooldown_seconds=60.0, batch_wait=0.0).start()
+    x = torch.randn(10, 775)
+    pipeline.submit(reports_for([1]), x)
+    assert wait_for(lambda: pipeline.stats["errors"] == 1)
+    pipeline.submit(reports_for([1]), x)
+    pipeline.stop()
+
+    assert pipeline.stats["suppressed"] == 0
+    assert delivered[1:] == [["srv-1"]]
+
+def test_slow_remediation_never_delays_notifications():
+    import threading
+    from step11_remediation import RemediationEngine
+
+    release = threading.Event()
+    sent, executed = [], []
+
+    class SlowExecutor:
+        def execute(self, plans):
+            release.wait(5.0)
+            executed.append([p["service"] for p in plans])
+            raise RuntimeError("kubectl timed out")
+
+    pipeline = AlertPipeline(notify=lambda reports, url: sent.append(reports), cooldown_seconds=0.0,
+                             batch_wait=0.0, remediation=RemediationEngine.from_file(),
+                             executor=SlowExecutor()).start()
+    x = torch.randn(10, 775)
+    pipeline.submit(reports_for([1, 2]), x)
+    assert wait_for(lambda: len(sent) == 1, timeout=2.0)
+    assert executed == []  # Still stuck in kubectl
+    pipeline.submit(reports_for([3]), x)
+    assert wait_for(lambda: len(sent) == 2, timeout=2.0)
+
+    release.set()
+    pipeline.stop()
+    assert executed == [["srv-1", "srv-2"], ["srv-3"]]
+    assert pipeline.stats["remediation_errors"] == 2
+    assert pipeline.stats["errors"] == 0 and pipeline.stats["sent"] == 3
+
+def test_incident_store_failure_never_costs_the_alert(tmp_path):
+    import numpy as np
+    from incident_store import IncidentStore
+    from step6_model import LogWhispererBrain
+
+    store = IncidentStore(str(tmp_path / "incidents"), index="brute")
+    store.add(np.ones(64, dtype=np.float32), [{"service": "old", "score": 0.9}])  # Wrong width for this model
+    sent = []
+    pipeline = AlertPipeline(notify=lambda reports, url: sent.append(reports), cooldown_seconds=0.0,
+                             batch_wait=0.0, model=LogWhispererBrain(775, 16, 1).eval(), incident_store=store).start()
+    x = torch.randn(3, 775)
+    edge_index = torch.tensor([[0, 1], [1, 2]])
+    pipeline.submit(reports_for([0, 2]), x, edge_index, ["srv-0", "srv-1", "srv-2"], [0.9, 0.1, 0.95])
+    pipeline.stop()
+
+    assert pipeline.stats["incident_errors"] == 1
+    assert pipeline.stats["errors"] == 0
+    assert [r["service"] for r in sent[0]] == ["srv-0", "srv-2"]
+    assert "similar_incidents" not in sent[0][0]
+
+def test_incidents_are_recorded_after_alerting(tmp_path):
+    from incident_store import IncidentStore
+    from step6_model import LogWhispererBrain
+    from step11_remediation import RemediationEngine
+
+    store = IncidentStore(str(tmp_path / "incidents"), index="brute")
+    pipeline = AlertPipeline(notify=lambda reports, url: None, cooldown_seconds=0.0, batch_wait=0.0,
+                             model=LogWhispererBrain(775, 16, 1).eval(), incident_store=store,
+                             remediation=RemediationEngine.from_file()).start()
+    x = torch.randn(3, 775)
+    edge_index = torch.tensor([[0, 1], [1, 2]])
+    pipeline.submit(reports_for([0]), x, edge_index, ["srv-0", "srv-1", "srv-2"], [0.9, 0.1, 0.2])
+    pipeline.stop()
+
+    assert pipeline.stats["incident_errors"] == 0
+    assert len(store) == 1
+    record = IncidentStore(str(tmp_path / "incidents"), index="brute").similar(store.index.vectors[0], 1)[0]
+    assert [c["service"] for c in record["root_causes"]] == ["srv-0"]
+    assert record["root_causes"][0]["remediation"]["status"] == "planned"
+
+def test_incident_history_is_opt_in(tmp_path, monkeypatch):
+    import importlib.util
+    import incident_store
+    monkeypatch.delenv("LOGWHISPERER_INCIDENTS", raising=False)
+    monkeypatch.chdir(tmp_path)
+    spec = importlib.util.spec_from_file_location("fresh_incident_store", incident_store.__file__)
+    fresh = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fresh)
+
+    assert fresh.open_incident_store() is None
+    assert list(tmp_path.iterdir()) == []  # Nothing written to the working directory
+    store = fresh.open_incident_store(str(tmp_path / "incidents"))
+    assert store is not None and store.root == str(tmp_path / "incidents")
+    temporal = fresh.open_incident_store(str(tmp_path / "incidents"), temporal=True)
+    assert temporal.root == str(tmp_path / "incidents" / "temporal")
+
+def test_temporal_ticks_are_fingerprinted_over_their_window(tmp_path):
+    from incident_store import IncidentStore
+    from step6_model import TemporalLogWhispererBrain, TemporalInference
+    from step11_remediation import RemediationEngine
+
+    model = TemporalLogWhispererBrain(775, 16, 1).eval()
+    inference = TemporalInference(model, 3)
+    edge_index = torch.tensor([[0, 1], [1, 2]])
+    node_ids = ["srv-0", "srv-1", "srv-2"]
+    snapshots = [torch.randn(3, 775) for _ in range(3)]
+    for x in snapshots:
+        scores = torch.sigmoid(inference(x, edge_index, node_ids)).view(-1)
+
+    store = IncidentStore(str(tmp_path / "incidents"), index="brute")
+    sent = []
+    pipeline = AlertPipeline(notify=lambda reports, url: sent.append(reports), cooldown_seconds=0.0,
+                             batch_wait=0.0, model=model, incident_store=store,
+                             remediation=RemediationEngine.from_file()).start()
+    pipeline.submit(reports_for([1]), snapshots[-1], edge_index, node_ids, scores.tolist(),
+                    history=inference.history())
+    pipeline.stop()
+
+    assert pipeline.stats["incident_errors"] == 0 and sent[0][0]["attribution"]["service"] == "srv-1"
+    with torch.no_grad():
+        expected = model.fingerprint(torch.stack(snapshots), edge_index, scores)
+    assert torch.allclose(torch.from_numpy(store.index.vectors[0]), expected, atol=1e-5)
@@ -0,0 +1,41 @@
+import sys
+import threading
+import lazy_loader
+from lazy_loader import lazy_import, timed_import
+
+SLOW_MODULE = """
+import time
+RUNS.append(1)
+FIRST = 1
+time.sleep(0.2)
+LAST = 2
+"""
+
+def test_first_access_from_many_threads_runs_module_once(tmp_path, monkeypatch):
+    (tmp_path / "slow_lazy_module.py").write_text("from builtins import RUNS\n" + SLOW_MODULE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    runs = []
+    monkeypatch.setattr("builtins.RUNS", runs, raising=False)
+
+    module = lazy_import("slow_lazy_module")
+    assert runs == []  # Nothing ran yet
+
+    results, errors = [], []
+    def read():
+        try:
+            results.append(module.FIRST + module.LAST)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert results == [3] * 8
+    assert runs == [1]
+    assert "slow_lazy_module" not in lazy_loader._pending
+    assert not hasattr(module, "__getattr__")
+    assert timed_import("slow_lazy_module") is module
+    sys.modules.pop("slow_lazy_module")
@@ -0,0 +1,67 @@
+import json
+from loki_ingest import iter_loki_range, iter_loki_file, iter_entries
+
+class FakeLoki:
+    """
+    Serves query_range pages from in-memory streams: entries with
+    start <= ts < end in time order, at most `limit` of them.
+    """
+    def __init__(self, streams):
+        self.streams = streams  # {service: [(ts_ns, line)]}
+        self.calls = []
+
+    def get(self, url, params):
+        self.calls.append(params)
+        entries = sorted((ts, service, line) for service, values in self.streams.items()
+                         for ts, line in values if params["start"] <= ts < params["end"])
+        page = entries[:params["limit"]]
+        result = [{"stream": {"service_name": service},
+                   "values": [[str(ts), line] for ts, s, line in page if s == service]}
+                  for service in self.streams]
+        body = {"data": {"result": [r for r in result if r["values"]]}}
+        return FakeResponse(body)
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+def collect(session, **kwargs):
+    return list(iter_entries(iter_loki_range('{job="x"}', 0, 10, session=session, **kwargs)))
+
+def test_pages_resume_at_shared_timestamp():
+    ts = 1_000_000_000
+    loki = FakeLoki({"auth": [(ts, f"line {i}") for i in range(5)] + [(ts + 1, "after")]})
+    entries = collect(loki, limit=3)
+    assert sorted(line for _, _, line in entries) == sorted([f"line {i}" for i in range(5)] + ["after"])
+
+def test_pages_do_not_repeat_entries_across_streams():
+    ts = 2_000_000_000
+    loki = FakeLoki({"auth": [(ts, "a"), (ts + 5, "b"), (ts + 5, "c")],
+                     "cart": [(ts + 5, "a"), (ts + 9, "d")]})
+    entries = collect(loki, limit=2)
+    assert sorted((s, line) for _, s, line in entries) == \
+        [("auth", "a"), ("auth", "b"), ("auth", "c"), ("cart", "a"), ("cart", "d")]
+
+def test_more_than_limit_at_one_timestamp_terminates():
+    ts = 3_000_000_000
+    loki = FakeLoki({"auth": [(ts, f"line {i}") for i in range(10)] + [(ts + 1, "after")]})
+    entries = collect(loki, limit=4)
+    assert sorted(line for _, _, line in entries) == sorted([f"line {i}" for i in range(10)] + ["after"])
+
+def test_dump_format_detected_from_content(tmp_path):
+    response = {"data": {"result": [{"stream": {"service_name": "auth"}, "values": [["1", "x"]]}]}}
+    stream = {"stream": {"service_name": "cart"}, "values": [["2", "y"]]}
+
+    jsonl = tmp_path / "dump.log"
+    jsonl.write_text(json.dumps(response) + "\n\n" + json.dumps(stream) + "\n")
+    assert [e[1:] for e in iter_entries(iter_loki_file(str(jsonl)))] == [("auth", "x"), ("cart", "y")]
+
+    pretty = tmp_path / "dump.jsonl"
+    pretty.write_text(json.dumps(response, indent=2))
+    assert [e[1:] for e in iter_entries(iter_loki_file(str(pretty)))] == [("auth", "x")]
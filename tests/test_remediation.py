@@ -0,0 +1,145 @@
+import os
+import json
+import pytest
+from step11_remediation import RemediationEngine, KubectlExecutor, TokenBucket, load_policy
+
+FAKE_KUBECTL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_kubectl")
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def engine_for(clock, per_service=(2, 1800), global_=(10, 300), window=300):
+    policy = load_policy()
+    policy["defaults"] = {
+        "coalesce_window_seconds": window,
+        "rate_limits": {"per_service": {"capacity": per_service[0], "refill_seconds": per_service[1]},
+                        "global": {"capacity": global_[0], "refill_seconds": global_[1]}},
+    }
+    return RemediationEngine(policy, clock=clock)
+
+def report(service, score=0.9, explanation="Log Patterns shifted"):
+    return {"service": service, "score": score, "explanation": explanation}
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(capacity=2, refill_seconds=100, clock=clock)
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+    clock.now += 49
+    assert not bucket.take()  # 0.98 tokens
+    clock.now += 1
+    assert bucket.take()
+    clock.now += 10_000
+    assert bucket.take() and bucket.take() and not bucket.take()  # Capped at capacity
+
+def test_coalesce_window():
+    clock = FakeClock()
+    engine = engine_for(clock, window=300)
+    first, = engine.plan([report("auth")])
+    assert first["status"] == "planned"
+
+    clock.now += 299
+    again, = engine.plan([report("auth", explanation="Metric spike")])
+    assert again["status"] == "coalesced"
+    assert again["suggested_command"] == first["suggested_command"]
+
+    clock.now += 2
+    later, = engine.plan([report("auth", explanation="Metric spike")])
+    assert later["status"] == "planned"
+    assert later["suggested_command"] == "kubectl scale deployment/auth --replicas=5"
+
+def test_one_command_per_deployment_per_batch():
+    engine = engine_for(FakeClock())
+    plans = engine.plan([report("auth", 0.5, "Trace errors"), report("auth", 0.9, "Log Patterns"),
+                         report("cart", 0.7)])
+    assert [p["status"] for p in plans] == ["coalesced", "planned", "planned"]
+    assert plans[0]["suggested_command"] == "kubectl rollout restart deployment/auth"  # Highest score wins
+
+def test_per_service_and_global_rate_limits():
+    clock = FakeClock()
+    engine = engine_for(clock, per_service=(1, 1000), global_=(3, 300), window=0)
+
+    plans = engine.plan([report(f"svc-{i}", 1.0 - i / 10) for i in range(5)])
+    assert [p["status"] for p in plans] == ["planned"] * 3 + ["rate_limited"] * 2
+
+    clock.now += 100  # One global token back, but svc-0 has used its own
+    plans = engine.plan([report("svc-0", 0.9), report("svc-3", 0.8)])
+    assert [p["status"] for p in plans] == ["rate_limited", "planned"]
+    assert engine.stats == {"planned": 4, "coalesced": 0, "rate_limited": 3}
+
+def test_rate_limited_deployment_is_never_reported_coalesced():
+    engine = engine_for(FakeClock(), per_service=(1, 1000), global_=(1, 300))
+    plans = engine.plan([report("a", 0.9), report("b", 0.8), report("b", 0.7)])
+    assert [p["status"] for p in plans] == ["planned", "rate_limited", "rate_limited"]
+
+def test_history_is_pruned_as_it_ages():
+    clock = FakeClock()
+    engine = engine_for(clock, per_service=(2, 1000), global_=(100, 300), window=300)
+    engine.plan([report(f"svc-{i}") for i in range(50)])
+    assert len(engine.issued) == len(engine.service_buckets) == 50
+
+    clock.now += 301  # Outside the coalesce window, buckets half refilled
+    plans = engine.plan([report("svc-0")])
+    assert plans[0]["status"] == "planned"
+    assert list(engine.issued) == ["svc-0"]
+    assert len(engine.service_buckets) == 50  # Still short of capacity
+
+    clock.now += 500  # The others have refilled; svc-0 is still short
+    engine.plan([])
+    assert list(engine.service_buckets) == ["svc-0"]
+    assert engine.issued == {}
+
+    plans = engine.plan([report("svc-0"), report("svc-0", 0.5), report("svc-1")])
+    assert [p["status"] for p in plans] == ["planned", "coalesced", "planned"]
+    clock.now += 1
+    assert engine.plan([report("svc-0", explanation="Metric spike")])[0]["status"] == "coalesced"
+
+def test_executor_batches_batchable_actions_into_one_call(tmp_path, monkeypatch):
+    log = tmp_path / "kubectl.log"
+    monkeypatch.setenv("FAKE_KUBECTL_LOG", str(log))
+    engine = engine_for(FakeClock(), per_service=(5, 100), global_=(50, 100))
+    reports = ([report(f"api-{i}", explanation="Log Patterns") for i in range(3)] +
+               [report(f"db-{i}", explanation="Metric") for i in range(2)] +
+               [report(f"web-{i}", explanation="Unknown") for i in range(2)] +
+               [report("api-0", 0.1, explanation="Metric")])
+    results = KubectlExecutor(engine, kubectl=FAKE_KUBECTL, dry_run=False).execute(engine.plan(reports))
+
+    calls = [json.loads(line) for line in log.read_text().splitlines()]
+    assert sorted(calls) == sorted([
+        ["rollout", "restart", "deployment/api-0", "deployment/api-1", "deployment/api-2"],
+        ["scale", "deployment/db-0", "deployment/db-1", "--replicas=5"],
+        ["get", "pods", "-l", "app=web-0"],
+        ["get", "pods", "-l", "app=web-1"],
+    ])
+    assert all(r["returncode"] == 0 for r in results)
+    assert sorted(len(r["services"]) for r in results) == [1, 1, 2, 3]
+
+def test_executor_dry_run_and_failures(tmp_path, monkeypatch):
+    log = tmp_path / "kubectl.log"
+    monkeypatch.setenv("FAKE_KUBECTL_LOG", str(log))
+    engine = engine_for(FakeClock())
+    plans = engine.plan([report("auth")])
+
+    dry = KubectlExecutor(engine, kubectl=FAKE_KUBECTL, dry_run=True).execute(plans)
+    assert dry[0]["argv"][1:] == ["rollout", "restart", "deployment/auth"] and not log.exists()
+
+    monkeypatch.setenv("FAKE_KUBECTL_EXIT", "1")
+    failed = KubectlExecutor(engine, kubectl=FAKE_KUBECTL, dry_run=False).execute(plans)
+    assert failed[0]["returncode"] == 1
+    missing = KubectlExecutor(engine, kubectl=str(tmp_path / "no-kubectl"), dry_run=False).execute(plans)
+    assert missing[0]["returncode"] is None
+
+def test_service_names_cannot_inject_arguments():
+    engine = engine_for(FakeClock())
+    plan, = engine.plan([report("auth --all-namespaces; rm -rf /")])
+    assert plan["argv"] == ["kubectl", "rollout", "restart", "deployment/auth --all-namespaces; rm -rf /"]
+
+def test_unknown_action_is_rejected():
+    policy = load_policy()
+    policy["rules"].insert(0, {"name": "bad", "action": "delete"})
+    with pytest.raises(ValueError):
+        RemediationEngine(policy)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import torch
+from feature_store import FEATURE_DIM
+from sharding import (ShardedInference, connected_components, namespace_groups, partition,
+                      multi_cluster_topology)
+from step5_graph_builder import build_edge_index
+from step6_model import LogWhispererBrain, quantize_brain
+from synthetic_mesh import SyntheticMesh
+
+def make_model():
+    torch.manual_seed(0)
+    return LogWhispererBrain(FEATURE_DIM, 16, 1).eval()
+
+def assert_shards_match_full_graph(model, x, edge_index, shards):
+    with torch.inference_mode():
+        reference = model(x, edge_index).view(-1)
+    edge_index = edge_index.numpy()
+    scored = np.zeros(len(x), dtype=int)
+    boundary = 0
+    for shard in shards:
+        with torch.inference_mode():
+            logits = model(x[shard.nodes], torch.from_numpy(shard.edge_index)).view(-1)[:len(shard.core)]
+        assert torch.allclose(logits, reference[shard.core], atol=1e-6)
+        # Core nodes fed by nodes of other shards depend on the halo
+        in_core = np.zeros(len(x), dtype=bool)
+        in_core[shard.core] = True
+        boundary += int(np.unique(edge_index[1][in_core[edge_index[1]] & ~in_core[edge_index[0]]]).size)
+        scored[shard.core] += 1
+    assert (scored == 1).all()  # Every node is scored by exactly one shard
+    return boundary
+
+def test_component_shards_match_full_graph():
+    topology = multi_cluster_topology(600, 6)
+    edge_index, _ = build_edge_index(topology["nodes"], topology["edges"])
+    x = torch.randn(len(topology["nodes"]), FEATURE_DIM, generator=torch.Generator().manual_seed(1))
+    groups = connected_components(len(x), edge_index.numpy())
+    shards = partition(len(x), edge_index.numpy(), groups, 4)
+    assert sum(len(s.halo) for s in shards) == 0
+    assert_shards_match_full_graph(make_model(), x, edge_index, shards)
+
+def test_namespace_shards_with_halo_match_full_graph():
+    topology = SyntheticMesh(600, seed=3).topology()
+    edge_index, _ = build_edge_index(topology["nodes"], topology["edges"])
+    x = torch.randn(len(topology["nodes"]), FEATURE_DIM, generator=torch.Generator().manual_seed(2))
+    groups = namespace_groups(topology["nodes"], topology["namespaces"])
+    shards = partition(len(x), edge_index.numpy(), groups, 4)
+    assert sum(len(s.halo) for s in shards) > 0
+    assert assert_shards_match_full_graph(make_model(), x, edge_index, shards) > 0
+
+def test_sharded_inference_rejects_temporal_model():
+    with pytest.raises(ValueError):
+        ShardedInference(make_model(), num_workers=1, temporal_window=4)
+
+def test_quantized_workers_score_with_int8_model():
+    model = make_model()
+    topology = multi_cluster_topology(200, 4)
+    edge_index, _ = build_edge_index(topology["nodes"], topology["edges"])
+    x = torch.randn(len(topology["nodes"]), FEATURE_DIM, generator=torch.Generator().manual_seed(3))
+    graph = {"node_ids": topology["nodes"], "x": x, "edge_index": edge_index, "topology_version": 1}
+
+    sharded = ShardedInference(model, num_workers=1, quantized=True)
+    try:
+        _, probabilities, _, _ = sharded.score(graph)
+    finally:
+        sharded.close()
+
+    # Dynamic int8 picks activation scales per batch, so compare shard by shard
+    quantized = quantize_brain(model)
+    expected = np.empty(len(x), dtype=np.float32)
+    with torch.inference_mode():
+        for shard in sharded.shards:
+            logits = quantized(x[shard.nodes], torch.from_numpy(shard.edge_index))[:len(shard.core)]
+            expected[shard.core] = torch.sigmoid(logits).view(-1).numpy()
+        fp32 = torch.sigmoid(model(x, edge_index)).view(-1).numpy()
+    assert np.abs(probabilities - expected).max() < 1e-6
+    assert np.abs(probabilities - fp32).max() > 1e-4  # Not the fp32 model
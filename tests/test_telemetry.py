@@ -0,0 +1,35 @@
+import time
+import threading
+import telemetry
+from telemetry import stage_timer
+
+def test_concurrent_profiled_stages_do_not_fail(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(telemetry, "_profiles", {})
+
+    errors = []
+    def stage(n):
+        try:
+            with stage_timer(f"test_stage_{n}"):
+                with stage_timer("test_inner"):
+                    sum(range(100000))
+                    time.sleep(0.05)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=stage, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    # Only outermost stages are profiled, never two at once
+    assert 1 <= len(telemetry._profiles) <= 8
+    assert "test_inner" not in telemetry._profiles
+    assert not telemetry._profiler_lock.locked()
+    assert not getattr(telemetry._profiling, "active", False)
+
+    # Profiling is free again once the others finished
+    with stage_timer("test_after"):
+        sum(range(1000))
+    assert "test_after" in telemetry._profiles
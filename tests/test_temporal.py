@@ -0,0 +1,74 @@
+import torch
+from step6_model import TemporalLogWhispererBrain, TemporalInference
+from step10_explainer import explain_batch
+
+WINDOW = 4
+
+def make_model():
+    torch.manual_seed(0)
+    return TemporalLogWhispererBrain(775, 16, 1).eval()
+
+def ring(num_nodes):
+    return torch.tensor([list(range(num_nodes)), [(i + 1) % num_nodes for i in range(num_nodes)]])
+
+def test_ticks_match_a_full_window_forward():
+    model = make_model()
+    inference = TemporalInference(model, WINDOW)
+    edge_index = ring(6)
+    node_ids = [f"srv-{i}" for i in range(6)]
+    snapshots = [torch.randn(6, 775) for _ in range(7)]
+
+    with torch.no_grad():
+        for t, x in enumerate(snapshots):
+            logits = inference(x, edge_index, node_ids)
+            window = torch.stack(snapshots[max(0, t - WINDOW + 1):t + 1])
+            assert torch.allclose(logits, model(window, edge_index), atol=1e-5)
+
+def test_new_service_history_starts_from_its_first_snapshot():
+    model = make_model()
+    inference = TemporalInference(model, WINDOW)
+    old_ids, new_ids = ["a", "b", "c"], ["a", "new", "b", "c"]
+    first = [torch.randn(3, 775) for _ in range(3)]
+    second = [torch.randn(4, 775) for _ in range(2)]
+
+    with torch.no_grad():
+        for x in first:
+            inference(x, ring(3), old_ids)
+        for x in second:
+            logits = inference(x, ring(4), new_ids)
+
+    # The full window with "new" backfilled by its first snapshot
+    frames = []
+    for x in first[-(WINDOW - len(second)):]:
+        frames.append(torch.stack([x[0], second[0][1], x[1], x[2]]))
+    window = torch.stack(frames + second)
+    with torch.no_grad():
+        assert torch.allclose(logits, model(window, ring(4)), atol=1e-5)
+
+def test_history_explains_and_fingerprints_the_scored_window():
+    model = make_model()
+    inference = TemporalInference(model, WINDOW)
+    edge_index = ring(5)
+    node_ids = [f"srv-{i}" for i in range(5)]
+    snapshots = [torch.randn(5, 775) for _ in range(WINDOW + 2)]
+    with torch.no_grad():
+        for x in snapshots:
+            logits = inference(x, edge_index, node_ids)
+    history = inference.history()
+    x, window = snapshots[-1], torch.stack(snapshots[-WINDOW:])
+    assert history.shape == (WINDOW - 1, 5, model.temporal_channels)
+
+    with torch.no_grad():
+        assert torch.allclose(model(x, edge_index, history=history), logits, atol=1e-5)
+        scores = torch.sigmoid(logits).view(-1)
+        assert torch.allclose(model.fingerprint(x, edge_index, scores, history=history),
+                              model.fingerprint(window, edge_index, scores), atol=1e-5)
+        # Without the history the snapshot is a window of one and scores differently
+        assert not torch.allclose(model(x, edge_index), logits, atol=1e-3)
+
+    # Saliency through the window equals the window forward's gradient on its latest frame
+    [detail] = explain_batch(model, x, edge_index, [2], node_ids, top_k_edges=0, history=history)
+    window = window.clone().requires_grad_(True)
+    model(window, edge_index).view(-1)[2].backward()
+    expected = (window.grad[-1] * x)[2].abs()
+    assert detail["top_features"] == torch.topk(expected, 5).indices.tolist()
@@ -0,0 +1,88 @@
+import json
+import pytest
+import requests
+from step1_extract_topology import TopologyService
+
+class FakePrometheus:
+    """
+    Session stand-in answering instant rate() queries from a queue of
+    snapshots ({(source, target): rps}); an Exception in the queue is raised
+    as a failed scrape.
+    """
+    def __init__(self, snapshots):
+        self.snapshots = list(snapshots)
+        self.calls = []
+
+    def get(self, url, params, timeout):
+        self.calls.append(url)
+        snapshot = self.snapshots.pop(0)
+        if isinstance(snapshot, Exception):
+            raise snapshot
+        result = [{"metric": {"source_workload": s, "destination_workload": t,
+                              "source_workload_namespace": "shop", "destination_workload_namespace": "shop"},
+                   "value": [0, str(rps)]} for (s, t), rps in snapshot.items()]
+        return FakeResponse({"status": "success", "data": {"result": result}})
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+def test_incremental_poll_reports_added_removed_and_changed():
+    prometheus = FakePrometheus([
+        {("web", "auth"): 10.0, ("web", "cart"): 5.0},
+        {("web", "auth"): 10.5, ("web", "cart"): 9.0},
+        {("web", "auth"): 10.5, ("cart", "db"): 2.0},
+    ])
+    service = TopologyService(session=prometheus)
+
+    first = service.poll()
+    assert {(e["source"], e["target"]) for e in first["added"]} == {("web", "auth"), ("web", "cart")}
+    assert first["version"] == 1
+
+    second = service.poll()
+    assert not second["added"] and not second["removed"]
+    assert [(e["source"], e["target"]) for e in second["changed"]] == [("web", "cart")]  # 10.5 is within 10%
+    assert second["version"] == 1
+
+    third = service.poll()
+    assert [(e["source"], e["target"]) for e in third["added"]] == [("cart", "db")]
+    assert third["removed"] == [{"source": "web", "target": "cart"}]
+    assert third["version"] == 2
+
+    topology = service.topology()
+    assert topology["nodes"] == ["auth", "cart", "db", "web"]
+    assert topology["namespaces"]["db"] == "shop"
+    _, values = service.edge_series("web", "auth")
+    assert list(values) == [10.0, 10.5, 10.5]
+
+def test_scrape_error_keeps_graph_and_recovers(tmp_path, monkeypatch):
+    prometheus = FakePrometheus([
+        {("web", "auth"): 1.0},
+        requests.ConnectionError("scrape failed"),
+        {("web", "auth"): 1.0, ("auth", "db"): 3.0},
+    ])
+    service = TopologyService(session=prometheus)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+
+    service.run(iterations=3)
+
+    assert len(prometheus.calls) == 3
+    assert service.version == 2
+    saved = json.loads((tmp_path / "topology_graph.json").read_text())
+    assert {(e["source"], e["target"]) for e in saved["edges"]} == {("web", "auth"), ("auth", "db")}
+    assert not (tmp_path / "topology_delta.json").exists()
+
+def test_failed_poll_leaves_history_untouched():
+    prometheus = FakePrometheus([{("web", "auth"): 1.0}, requests.ConnectionError("down")])
+    service = TopologyService(session=prometheus)
+    service.poll()
+    with pytest.raises(requests.ConnectionError):
+        service.poll()
+    assert service.topology()["edges"] == [{"source": "web", "target": "auth", "requests_per_second": 1.0}]